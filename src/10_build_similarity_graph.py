@@ -0,0 +1,145 @@
+"""
+Build the corpus similarity graph
+Screens every corpus image against its nearest CLIP neighbours with the same
+LLM prompt used online and saves the verdicts to data/similarity_graph.json.
+Pairs already in the graph are skipped, so re-running after an ingestion only
+screens new images (and an interrupted run resumes where it stopped).
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+from tqdm import tqdm
+from visual_search import get_visual_search_engine, LLM_SCREEN_BATCH_SIZE, LLM_SCREEN_CONCURRENCY
+from similarity_graph import SimilarityGraph, SIMILARITY_GRAPH_FILE, SIMILARITY_GRAPH_NEIGHBOURS
+
+SAVE_EVERY = 50  # Anchors between checkpoints
+
+def neighbour_pairs(engine, graph: SimilarityGraph, neighbours: int) -> List[Tuple[str, List[str]]]:
+    """
+    Nearest unscreened corpus neighbours of every image
+    
+    Args:
+        engine: VisualSearchEngine
+        graph: Existing graph (pairs already in it are skipped)
+        neighbours: Neighbours per image
+    
+    Returns:
+        List of (image_file, [neighbour image_file]) with at least one new pair
+    """
+    data = engine.collection.get(include=["embeddings"])
+    ids = list(data["ids"])
+    results = engine.collection.query(
+        query_embeddings=[list(map(float, embedding)) for embedding in data["embeddings"]],
+        n_results=min(neighbours + 1, len(ids)),
+        include=[]
+    )
+    
+    work = []
+    seen = set()
+    for image_file, neighbour_ids in zip(ids, results["ids"]):
+        pending = []
+        for other in neighbour_ids:
+            pair = tuple(sorted((image_file, other)))
+            if other == image_file or pair in seen or graph.verdict(image_file, other) is not None:
+                continue
+            seen.add(pair)
+            pending.append(other)
+        if pending:
+            work.append((image_file, pending))
+    return work
+
+async def screen_anchor(engine, image_file: str, others: List[str]) -> List[Tuple[str, bool]]:
+    """
+    Screen one image against its neighbours (batched, pairwise on parse failure)
+    
+    Returns:
+        (neighbour, verdict) for every pair the LLM answered; failed pairs are
+        left out so the next run retries them
+    """
+    def payload(item: str) -> str:
+        source = 'main_database' if item.startswith('main_') else 'reference_pdfs'
+        return engine.get_candidate_payload({'image_file': item, 'source': source})
+    
+    query_url = payload(image_file)
+    verdicts = []
+    for start in range(0, len(others), max(1, LLM_SCREEN_BATCH_SIZE)):
+        group = others[start:start + max(1, LLM_SCREEN_BATCH_SIZE)]
+        urls = [payload(other) for other in group]
+        
+        answers = None
+        if len(group) > 1:
+            answers = await engine._compare_payloads_batch(query_url, urls, permissive=False)
+        if answers is None:
+            answers = await asyncio.gather(*[
+                engine._compare_payloads(query_url, url, permissive=False) for url in urls
+            ])
+        verdicts.extend((other, answer) for other, answer in zip(group, answers) if answer is not None)
+    return verdicts
+
+async def build_graph(engine, graph: SimilarityGraph, work: List[Tuple[str, List[str]]]) -> Tuple[int, int]:
+    """
+    Screen every pending pair and add the verdicts to the graph
+    
+    Returns:
+        Tuple of (pairs screened, pairs failed)
+    """
+    semaphore = asyncio.Semaphore(LLM_SCREEN_CONCURRENCY)
+    screened = failed = 0
+    
+    async def run(image_file: str, others: List[str]):
+        async with semaphore:
+            try:
+                return image_file, others, await screen_anchor(engine, image_file, others)
+            except Exception as e:
+                print(f"\n⚠️ Error screening {image_file}: {e}")
+                return image_file, others, []
+    
+    tasks = [asyncio.create_task(run(image_file, others)) for image_file, others in work]
+    for done, task in enumerate(tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Screening"), 1):
+        image_file, others, verdicts = await task
+        for other, similar in verdicts:
+            graph.add(image_file, other, similar)
+        screened += len(verdicts)
+        failed += len(others) - len(verdicts)
+        
+        if done % SAVE_EVERY == 0:
+            graph.save()
+    
+    graph.save()
+    return screened, failed
+
+def main():
+    """Main similarity graph pipeline"""
+    parser = argparse.ArgumentParser(description="Precompute LLM verdicts between corpus images")
+    parser.add_argument('--neighbours', type=int, default=SIMILARITY_GRAPH_NEIGHBOURS,
+                        help="Nearest CLIP neighbours screened per image")
+    parser.add_argument('--full', action='store_true', help="Discard the existing graph and rescreen every pair")
+    args = parser.parse_args()
+    
+    print("="*70)
+    print("🕸️  Similarity Graph Builder")
+    print("="*70)
+    
+    engine = get_visual_search_engine()
+    graph = (None if args.full else SimilarityGraph.load()) or SimilarityGraph()
+    if len(graph):
+        print(f"📂 Existing graph: {len(graph.edges)} images, {len(graph)} verdicts")
+    
+    work = neighbour_pairs(engine, graph, args.neighbours)
+    pairs = sum(len(others) for _, others in work)
+    print(f"🔍 {pairs} new pairs to screen across {len(work)} images ({args.neighbours} neighbours each)")
+    
+    start = time.time()
+    screened, failed = asyncio.run(build_graph(engine, graph, work)) if work else (0, 0)
+    
+    similar = sum(v for neighbours in graph.edges.values() for v in neighbours.values()) // 2
+    print()
+    print(f"✅ Screened {screened} pairs in {time.time() - start:.0f}s" + (f" ({failed} failed, retried next run)" if failed else ""))
+    print(f"   Graph: {len(graph.edges)} images, {len(graph)} verdicts ({similar} similar)")
+    print(f"💾 Saved graph to {SIMILARITY_GRAPH_FILE}")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
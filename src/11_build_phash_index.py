@@ -0,0 +1,104 @@
+"""
+Build the perceptual hash index
+Hashes every cropped chromatograph and stores its nearest CLIP neighbours, so
+visual search can answer uploads of library reports without CLIP, peak
+analysis or LLM screening
+"""
+
+import chromadb
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+from perceptual_hash import PerceptualHashIndex, image_hashes, load_aliases, PHASH_INDEX_FILE, PHASH_NEIGHBOURS
+
+def hash_images(image_dir, prefix):
+    """
+    Hash every image in a directory
+    
+    Args:
+        image_dir: Directory containing cropped images
+        prefix: Collection id prefix ('main_' or 'reference_')
+    
+    Returns:
+        Dict of image_file (collection id) -> (pHash, dHash)
+    """
+    image_dir = Path(image_dir)
+    hashes = {}
+    for img_path in tqdm(sorted(image_dir.glob("*.png")), desc=f"Hashing {image_dir.name}"):
+        try:
+            hashes[f"{prefix}{img_path.name}"] = image_hashes(Image.open(img_path))
+        except Exception as e:
+            print(f"\n⚠️ Error hashing {img_path.name}: {e}")
+    return hashes
+
+def clip_neighbours(collection, image_ids, neighbours: int):
+    """
+    Nearest CLIP neighbours of every indexed image
+    
+    Args:
+        collection: hb_image_embeddings Chroma collection
+        image_ids: Images to look up (ids missing from the collection are skipped)
+        neighbours: Neighbours per image
+    
+    Returns:
+        Dict of image_file -> [(neighbour image_file, similarity)], best first,
+        with similarities on the same 1 / (1 + distance) scale as visual search
+    """
+    data = collection.get(ids=list(image_ids), include=["embeddings"])
+    results = collection.query(
+        query_embeddings=[list(map(float, embedding)) for embedding in data["embeddings"]],
+        n_results=min(neighbours + 1, collection.count()),
+        include=["distances"]
+    )
+    return {
+        image_id: [
+            (other, 1.0 / (1.0 + distance))
+            for other, distance in zip(ids, distances) if other != image_id
+        ][:neighbours]
+        for image_id, ids, distances in zip(data["ids"], results["ids"], results["distances"])
+    }
+
+def main():
+    """Main perceptual hash index pipeline"""
+    project_root = Path(__file__).parent.parent
+    
+    print("="*70)
+    print("🔑 Perceptual Hash Index Builder")
+    print("="*70)
+    
+    tasks = [
+        ('Main Database', project_root / 'data' / 'cropped_images_main', 'main_'),
+        ('Reference PDFs', project_root / 'data' / 'cropped_images_reference', 'reference_')
+    ]
+    
+    hashes = {}
+    for name, input_dir, prefix in tasks:
+        if not input_dir.exists():
+            print(f"⚠️  Skipping {name}: Directory not found")
+            continue
+        images = hash_images(input_dir, prefix)
+        hashes.update(images)
+        print(f"✅ {name}: {len(images)} images")
+    
+    client = chromadb.PersistentClient(path=str(project_root / 'vector_db' / 'chroma_storage'))
+    collection = client.get_collection(name="hb_image_embeddings")
+    
+    print(f"\n🔍 Looking up {PHASH_NEIGHBOURS} CLIP neighbours per image...")
+    neighbours = clip_neighbours(collection, hashes, PHASH_NEIGHBOURS)
+    
+    # Near-duplicates collapsed at ingestion resolve to their canonical image
+    aliases = {alias: canonical for alias, canonical in load_aliases(collection).items() if alias in hashes}
+    
+    # Only images in the collection (or their aliases) can be returned as search results
+    indexed = [image_id for image_id in hashes if image_id in neighbours or image_id in aliases]
+    index = PerceptualHashIndex({image_id: hashes[image_id] for image_id in indexed}, neighbours, aliases)
+    index.save()
+    
+    print()
+    print(f"💾 Saved {len(index)} hashes ({len(aliases)} near-duplicate aliases) to {PHASH_INDEX_FILE}")
+    if len(index) < len(hashes):
+        print(f"   ({len(hashes) - len(index)} hashed images are not in the collection)")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,27 @@ Creates separate collections for text (384-dim) and images (512-dim)
 import chromadb
 from chromadb.config import Settings
 import json
+import os
 from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from PIL import Image
 from tqdm import tqdm
+from perceptual_hash import image_hashes, hamming_distances
+
+# Collapse near-duplicate crops (blank pages, repeated templates) to one
+# canonical image; the others are kept as aliases in its metadata
+DEDUP_ENABLED = os.getenv("DEDUP_NEAR_DUPLICATES", "1") == "1"
+
+# Near-duplicates must agree on both 256-bit perceptual hashes within this
+# many bits, have at least this CLIP cosine similarity, AND match pixel for
+# pixel at thumbnail resolution. The pixel check is what separates different
+# patients with the same pattern on the same report template: their hashes
+# can be 2 bits apart, but the printed percentages differ.
+DEDUP_MAX_DISTANCE = 4
+DEDUP_MIN_COSINE = 0.98
+DEDUP_THUMBNAIL = 256         # Thumbnail side for the pixel check
+DEDUP_MAX_PIXEL_DIFF = 0.05   # 99.5th percentile |difference| (0-1); JPEG noise ~0.01
 
 def load_text_data():
     """Load text data from PDF extraction"""
@@ -88,7 +107,82 @@ def load_crop_metadata():
     
     return metadata
 
-def build_image_collection(client, collection_name, embeddings, metadata):
+def image_path(img_id: str) -> Path:
+    """Cropped image file behind a collection id"""
+    project_root = Path(__file__).parent.parent
+    if img_id.startswith('main_'):
+        return project_root / "data" / "cropped_images_main" / img_id[len('main_'):]
+    return project_root / "data" / "cropped_images_reference" / img_id[len('reference_'):]
+
+def canonical_priority(img_id: str, meta: Dict) -> tuple:
+    """Sort key choosing the canonical image of a cluster (labeled references first)"""
+    reference = img_id.startswith('reference_')
+    labeled = meta.get('category', 'unknown') not in ('unknown', 'main_db')
+    return (0 if reference else 1, 0 if labeled else 1, img_id)
+
+def thumbnail(image: Image.Image) -> np.ndarray:
+    """Grayscale DEDUP_THUMBNAIL x DEDUP_THUMBNAIL pixels"""
+    return np.asarray(image.convert('L').resize((DEDUP_THUMBNAIL, DEDUP_THUMBNAIL), Image.BOX), dtype=np.uint8)
+
+def same_pixels(a: np.ndarray, b: np.ndarray) -> bool:
+    """Whether two thumbnails differ only by encoding noise"""
+    diff = np.abs(a.astype(np.int16) - b.astype(np.int16)) / 255.0
+    return float(np.percentile(diff, 99.5)) <= DEDUP_MAX_PIXEL_DIFF
+
+def cluster_near_duplicates(embeddings: Dict, metadata: Dict) -> Dict[str, List[str]]:
+    """
+    Group near-identical crops under a canonical image
+    
+    Images are visited in canonical_priority order; each joins the first
+    canonical it is a near-duplicate of, otherwise it becomes a canonical
+    itself (no chaining through intermediate images).
+    
+    Args:
+        embeddings: Dict of image embeddings
+        metadata: Dict of image metadata
+    
+    Returns:
+        Dict of canonical id -> alias ids (every embedded image is either a
+        key or an alias)
+    """
+    clusters: Dict[str, List[str]] = {}
+    canonical_ids = []
+    canonical_phashes, canonical_dhashes, canonical_vectors, canonical_thumbnails = [], [], [], []
+    
+    for img_id in tqdm(sorted(embeddings, key=lambda i: canonical_priority(i, metadata.get(i, {}))), desc="Clustering near-duplicates"):
+        vector = np.asarray(embeddings[img_id]['embedding'], dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        
+        try:
+            image = Image.open(image_path(img_id))
+            p, d = image_hashes(image)
+            pixels = thumbnail(image)
+        except Exception as e:
+            print(f"\n⚠️ Could not hash {img_id}: {e}")
+            clusters[img_id] = []  # Kept as its own canonical, never matched
+            continue
+        
+        if canonical_ids:
+            near = (
+                (hamming_distances(np.stack(canonical_phashes), p) <= DEDUP_MAX_DISTANCE)
+                & (hamming_distances(np.stack(canonical_dhashes), d) <= DEDUP_MAX_DISTANCE)
+                & (np.stack(canonical_vectors) @ vector >= DEDUP_MIN_COSINE)
+            )
+            match = next((i for i in np.flatnonzero(near) if same_pixels(canonical_thumbnails[i], pixels)), None)
+            if match is not None:
+                clusters[canonical_ids[match]].append(img_id)
+                continue
+        
+        clusters[img_id] = []
+        canonical_ids.append(img_id)
+        canonical_phashes.append(np.frombuffer(p, dtype=np.uint8))
+        canonical_dhashes.append(np.frombuffer(d, dtype=np.uint8))
+        canonical_vectors.append(vector)
+        canonical_thumbnails.append(pixels)
+    
+    return clusters
+
+def build_image_collection(client, collection_name, embeddings, metadata, clusters=None):
     """
     Build ChromaDB collection for image embeddings
     
@@ -97,6 +191,8 @@ def build_image_collection(client, collection_name, embeddings, metadata):
         collection_name: Name of collection
         embeddings: Dict of image embeddings
         metadata: Dict of image metadata
+        clusters: Optional dict of canonical id -> alias ids from
+            cluster_near_duplicates (only canonical images are indexed)
     """
     print(f"\n📸 Building image collection: {collection_name}")
     
@@ -119,7 +215,12 @@ def build_image_collection(client, collection_name, embeddings, metadata):
     metadatas = []
     documents = []
     
+    if clusters is None:
+        clusters = {img_id: [] for img_id in embeddings}
+    
     for img_id, img_data in tqdm(embeddings.items(), desc="Processing images"):
+        if img_id not in clusters:
+            continue  # Alias of a near-duplicate canonical image
         # Get metadata
         meta = metadata.get(img_id, {})
         
@@ -137,7 +238,9 @@ def build_image_collection(client, collection_name, embeddings, metadata):
             'category': category,
             'system_type': system_type,
             'image_file': img_id,
-            'page': meta.get('page', 0)
+            'page': meta.get('page', 0),
+            'aliases': ",".join(clusters[img_id]),
+            'alias_count': len(clusters[img_id])
         }
         
         if 'original_file' in meta:
@@ -194,12 +297,22 @@ def main():
     print(f"   ✅ Loaded {len(image_embeddings)} image embeddings")
     print(f"   ✅ Loaded metadata for {len(crop_metadata)} images")
     
+    # Collapse near-duplicate crops before indexing
+    clusters = None
+    if DEDUP_ENABLED:
+        print("\n🧬 Clustering near-duplicate images...")
+        clusters = cluster_near_duplicates(image_embeddings, crop_metadata)
+        aliased = sum(len(aliases) for aliases in clusters.values())
+        print(f"   ✅ {len(clusters)} canonical images, {aliased} near-duplicates kept as aliases "
+              f"in {sum(1 for aliases in clusters.values() if aliases)} clusters")
+    
     # Build image collection
     image_collection = build_image_collection(
         client,
         "hb_image_embeddings",
         image_embeddings,
-        crop_metadata
+        crop_metadata,
+        clusters
     )
     
     # Summary
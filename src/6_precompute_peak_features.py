@@ -0,0 +1,94 @@
+"""
+Precompute peak features for all cropped chromatograph images
+Lets visual search re-rank candidates without re-running peak analysis/OCR
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+from peak_analyzer import get_peak_analyzer
+
+def analyze_file(img_path: Path) -> dict:
+    """Run peak analysis on one cropped image"""
+    analyzer = get_peak_analyzer()
+    return analyzer.analyze_image(Image.open(img_path))
+
+def precompute_peak_features(image_dir, prefix, max_workers=None):
+    """
+    Compute peak features for every image in a directory
+    
+    Args:
+        image_dir: Directory containing cropped images
+        prefix: Collection id prefix ('main_' or 'reference_')
+        max_workers: Parallel workers (default: CPU count)
+    
+    Returns:
+        Dict of image_file (collection id) -> features
+    """
+    image_dir = Path(image_dir)
+    image_files = sorted(image_dir.glob("*.png"))
+    
+    if not image_files:
+        print(f"⚠️  No images found in {image_dir}")
+        return {}
+    
+    print(f"🔬 Analyzing {len(image_files)} images from {image_dir.name}")
+    
+    features = {}
+    # OCR runs in tesseract subprocesses, so threads keep every core busy
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {img_path: executor.submit(analyze_file, img_path) for img_path in image_files}
+        for img_path, future in tqdm(futures.items(), desc=f"Analyzing {image_dir.name}"):
+            try:
+                features[f"{prefix}{img_path.name}"] = future.result()
+            except Exception as e:
+                print(f"\n⚠️ Error analyzing {img_path.name}: {e}")
+    
+    return features
+
+def main():
+    """Main peak feature precomputation pipeline"""
+    project_root = Path(__file__).parent.parent
+    output_file = project_root / 'data' / 'peak_features.json'
+    
+    print("="*70)
+    print("🔬 Peak Feature Precomputation")
+    print("="*70)
+    
+    tasks = [
+        {
+            'name': 'Main Database',
+            'input_dir': project_root / 'data' / 'cropped_images_main',
+            'prefix': 'main_'
+        },
+        {
+            'name': 'Reference PDFs',
+            'input_dir': project_root / 'data' / 'cropped_images_reference',
+            'prefix': 'reference_'
+        }
+    ]
+    
+    all_features = {}
+    for task in tasks:
+        if not task['input_dir'].exists():
+            print(f"⚠️  Skipping {task['name']}: Directory not found")
+            continue
+        
+        features = precompute_peak_features(task['input_dir'], task['prefix'])
+        all_features.update(features)
+        print(f"✅ {task['name']}: {len(features)} images")
+    
+    with open(output_file, 'w') as f:
+        json.dump(all_features, f)
+    
+    print()
+    print(f"💾 Saved {len(all_features)} feature sets to {output_file}")
+    print("="*70)
+    print("💡 Visual search loads this file at startup to skip candidate peak analysis")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Precompute LLM screening payloads for all cropped chromatograph images
+Downscaled grayscale JPEG data URLs, so screening never re-encodes candidates
+"""
+
+import json
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+from llm_payloads import encode_image_for_llm, LLM_PAYLOADS_FILE, LLM_IMAGE_MAX_SIDE
+
+def build_payloads(image_dir, prefix):
+    """
+    Encode every image in a directory for the vision model
+    
+    Args:
+        image_dir: Directory containing cropped images
+        prefix: Collection id prefix ('main_' or 'reference_')
+    
+    Returns:
+        Tuple of (payloads dict, original bytes, encoded bytes)
+    """
+    image_dir = Path(image_dir)
+    image_files = sorted(image_dir.glob("*.png"))
+    
+    payloads = {}
+    original_bytes = 0
+    encoded_bytes = 0
+    
+    for img_path in tqdm(image_files, desc=f"Encoding {image_dir.name}"):
+        try:
+            payload = encode_image_for_llm(Image.open(img_path))
+            payloads[f"{prefix}{img_path.name}"] = payload
+            original_bytes += img_path.stat().st_size
+            encoded_bytes += len(payload)
+        except Exception as e:
+            print(f"\n⚠️ Error encoding {img_path.name}: {e}")
+    
+    return payloads, original_bytes, encoded_bytes
+
+def main():
+    """Main payload precomputation pipeline"""
+    project_root = Path(__file__).parent.parent
+    
+    print("="*70)
+    print("📦 LLM Screening Payload Precomputation")
+    print("="*70)
+    print(f"   Max side: {LLM_IMAGE_MAX_SIDE}px, grayscale JPEG")
+    print()
+    
+    tasks = [
+        ('Main Database', project_root / 'data' / 'cropped_images_main', 'main_'),
+        ('Reference PDFs', project_root / 'data' / 'cropped_images_reference', 'reference_')
+    ]
+    
+    all_payloads = {}
+    total_original = 0
+    total_encoded = 0
+    
+    for name, input_dir, prefix in tasks:
+        if not input_dir.exists():
+            print(f"⚠️  Skipping {name}: Directory not found")
+            continue
+        
+        payloads, original_bytes, encoded_bytes = build_payloads(input_dir, prefix)
+        all_payloads.update(payloads)
+        total_original += original_bytes
+        total_encoded += encoded_bytes
+        print(f"✅ {name}: {len(payloads)} images")
+    
+    with open(LLM_PAYLOADS_FILE, 'w') as f:
+        json.dump(all_payloads, f)
+    
+    print()
+    print(f"💾 Saved {len(all_payloads)} payloads to {LLM_PAYLOADS_FILE}")
+    if total_original:
+        print(f"📉 PNG {total_original / 1e6:.1f} MB → base64 JPEG {total_encoded / 1e6:.1f} MB "
+              f"({total_encoded / total_original:.0%})")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
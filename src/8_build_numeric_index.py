@@ -0,0 +1,76 @@
+"""
+Build the numeric (HbA2/HbF/HbS/HbE/HbA) index
+Parses reported fractions from the main case tables, the reference report
+text layers and the precomputed peak-analysis OCR into data/numeric_index.npz
+"""
+
+from pathlib import Path
+import numpy as np
+import fitz  # PyMuPDF
+from numeric_index import (
+    NumericIndex, build_records, load_json, NUMERIC_INDEX_FILE, ANALYTES, ANALYTE_LABELS
+)
+
+def extract_reference_texts(reference_dir: Path) -> dict:
+    """
+    Read the text layer of every reference PDF page
+    
+    Returns:
+        Dict of reference image id -> {'text', 'category', 'page'}
+    """
+    texts = {}
+    for pdf_path in sorted(reference_dir.rglob("*.pdf")):
+        category = pdf_path.parent.name
+        # Same ids as 2_extract_reference_pdfs.py pages after cropping
+        safe_name = "".join(c if c.isalnum() or c in ('-', '_') else '_' for c in pdf_path.stem)
+        pdf_key = f"{category}_{safe_name}"
+        
+        try:
+            doc = fitz.open(str(pdf_path))
+            for page_num in range(len(doc)):
+                image_id = f"reference_cropped_{pdf_key}_page{page_num + 1}.png"
+                texts[image_id] = {
+                    'text': doc[page_num].get_text(),
+                    'category': category,
+                    'page': page_num + 1
+                }
+            doc.close()
+        except Exception as e:
+            print(f"⚠️ Error reading {pdf_path.name}: {e}")
+    
+    return texts
+
+def main():
+    """Main numeric index pipeline"""
+    project_root = Path(__file__).parent.parent
+    
+    print("="*70)
+    print("🔢 Numeric Index Builder")
+    print("="*70)
+    
+    pdf_text = load_json(project_root / 'data' / 'pdf_text.json')
+    print(f"📄 Main database: {len(pdf_text)} pages")
+    
+    reference_dir = project_root / 'data' / 'reference_chromatographs'
+    reference_texts = extract_reference_texts(reference_dir) if reference_dir.exists() else {}
+    print(f"📚 Reference reports: {len(reference_texts)} pages")
+    
+    peak_features = load_json(project_root / 'data' / 'peak_features.json')
+    if not peak_features:
+        print("⚠️  data/peak_features.json not found - run src/6_precompute_peak_features.py for OCR values")
+    print(f"🔬 OCR peak features: {len(peak_features)} images")
+    
+    records = build_records(pdf_text, reference_texts, peak_features)
+    index = NumericIndex(records)
+    index.save()
+    
+    print()
+    print(f"💾 Saved {len(index)} records to {NUMERIC_INDEX_FILE}")
+    for source in ('main_text', 'reference_text', 'ocr'):
+        print(f"   {source}: {int((index.sources == source).sum())} records")
+    for analyte in ANALYTES:
+        print(f"   {ANALYTE_LABELS[analyte]}: {int((~np.isnan(index.columns[analyte])).sum())} values")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
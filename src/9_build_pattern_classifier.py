@@ -0,0 +1,61 @@
+"""
+Build the local pattern classifier
+Fits the kNN + prototype classifier on the reference library's CLIP
+embeddings and peak features, calibrates its confidence with
+leave-one-report-out and saves data/pattern_classifier.npz
+"""
+
+import json
+from pathlib import Path
+import chromadb
+from pattern_classifier import PatternClassifier, CLASSIFIER_FILE, CLASSIFIER_CONFIDENCE_THRESHOLD
+
+def load_json(path: Path) -> dict:
+    """Load a JSON file ({} if missing)"""
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    """Main pattern classifier pipeline"""
+    project_root = Path(__file__).parent.parent
+    
+    print("="*70)
+    print("🧭 Pattern Classifier Builder")
+    print("="*70)
+    
+    client = chromadb.PersistentClient(path=str(project_root / 'vector_db' / 'chroma_storage'))
+    collection = client.get_collection(name="hb_image_embeddings")
+    
+    peak_features = load_json(project_root / 'data' / 'peak_features.json')
+    if not peak_features:
+        print("⚠️  data/peak_features.json not found - classifying on CLIP embeddings only")
+    reference_metadata = load_json(project_root / 'data' / 'reference_metadata.json')
+    
+    classifier = PatternClassifier.from_collection(collection, peak_features, reference_metadata)
+    print(f"📚 {len(classifier)} labeled references in {len(classifier.classes)} categories")
+    
+    print("\n🔄 Calibrating (leave-one-report-out)...")
+    report = classifier.calibrate()
+    classifier.save()
+    
+    confident = report['confidence'] >= CLASSIFIER_CONFIDENCE_THRESHOLD
+    print(f"   Temperature: {report['temperature']:.2f}")
+    print(f"   Accuracy:    {report['accuracy']:.1%}")
+    print(f"   ECE:         {report['ece']:.3f}")
+    print(f"   At confidence ≥ {CLASSIFIER_CONFIDENCE_THRESHOLD:.0%}: "
+          f"{confident.mean():.1%} of cases skip the LLM, "
+          f"{report['correct'][confident].mean() if confident.any() else float('nan'):.1%} correct")
+    
+    print("\n   Per category (leave-one-report-out accuracy):")
+    for category in classifier.classes:
+        members = classifier.categories == category
+        print(f"   {category:24s} {int(members.sum()):4d} refs  {report['correct'][members].mean():.0%}")
+    
+    print()
+    print(f"💾 Saved classifier to {CLASSIFIER_FILE}")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,10 @@ Connects React frontend to OpenRouter LLM
 """
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import os
 from dotenv import load_dotenv
 import base64
@@ -19,9 +19,19 @@ from PIL import Image
 load_dotenv()
 
 # Import OpenRouter client and RAG search
-from openrouter_client import OpenRouterClient
+from openrouter_client import get_openrouter_client
 from rag_search import get_search_engine
 from visual_search import get_visual_search_engine
+from batch_visual_search import format_batch_result
+from job_queue import get_job_manager
+from numeric_index import get_numeric_index, parse_range_query, describe_ranges, format_matches
+from semantic_cache import SemanticAnswerCache, SEMANTIC_CACHE_ENABLED
+from chat_sessions import ChatSession, get_session_store
+from peak_analyzer import get_peak_analyzer
+from pattern_classifier import get_pattern_classifier, CLASSIFIER_CONFIDENCE_THRESHOLD, CLASSIFIER_SPECULATIVE_VISION
+import json
+import time
+import asyncio
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -48,7 +58,7 @@ app.add_middleware(
 )
 
 # Initialize OpenRouter client
-openrouter_client = OpenRouterClient()
+openrouter_client = get_openrouter_client()
 
 # Initialize RAG search engine
 print("🔍 Initializing RAG search engine...")
@@ -59,6 +69,12 @@ except Exception as e:
     print(f"⚠️  Warning: RAG search not available: {e}")
     rag_engine = None
 
+# Paraphrased first-turn questions with the same sources reuse earlier answers
+answer_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED and rag_engine else None
+
+# Server-side conversations (rolling window + summary) for clients that send a session_id
+session_store = get_session_store()
+
 # Initialize Visual search engine
 print("🎨 Initializing Visual search engine...")
 try:
@@ -78,21 +94,28 @@ class ChatRequest(BaseModel):
     model: Optional[str] = "meta-llama/llama-3.1-8b-instruct"
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 500
+    session_id: Optional[str] = None  # Server keeps the history; send only the new message
 
 class ChatResponse(BaseModel):
     message: str
     sources: Optional[List[str]] = []
     model_used: str
+    session_id: Optional[str] = None
+
+DEFAULT_ANALYSIS_PROMPT = "Analyze this hemoglobin chromatograph pattern"
 
 class ImageAnalysisRequest(BaseModel):
     image_base64: str
-    prompt: Optional[str] = "Analyze this hemoglobin chromatograph pattern"
+    prompt: Optional[str] = DEFAULT_ANALYSIS_PROMPT
+    narrative: Optional[bool] = False  # Always ask the vision model for a written analysis
 
 class ImageAnalysisResponse(BaseModel):
     analysis: str
     pattern_type: Optional[str] = None
     confidence: Optional[float] = None
     sources: Optional[List[str]] = []
+    similar_patterns: Optional[List[dict]] = []
+    llm_used: Optional[bool] = None
 
 # Health check endpoint
 @app.get("/")
@@ -113,46 +136,119 @@ async def health_check():
         "api_version": "1.0.0"
     }
 
-# Chat endpoint
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.get("/api/metrics")
+async def get_metrics():
+    """Client metrics: OpenRouter (retries, hedges, breakers, rate limits, cache) and RAG query cache"""
+    return {
+        "openrouter": openrouter_client.get_metrics(),
+        "rag_query_cache": rag_engine.query_cache.stats() if rag_engine else None,
+        "semantic_answer_cache": answer_cache.stats() if answer_cache else None,
+        "chat_sessions": session_store.stats()
+    }
+
+# Identical on every session turn so providers can reuse the cached prompt prefix
+SESSION_SYSTEM_PROMPT = """You are a medical AI assistant specializing in hemoglobin pattern diseases.
+You help healthcare professionals analyze chromatograph patterns and diagnose hemoglobinopathies.
+
+Each question may come with information from the patient database. When it does:
+- Provide specific, evidence-based answers
+- Cite page numbers when referencing specific cases
+When it does not, provide general medical knowledge.
+
+When discussing patterns:
+- Describe retention times and peak characteristics
+- Mention relevant HbA, HbA2, HbF, and HbS percentages
+- Suggest differential diagnoses
+- Recommend confirmatory tests when appropriate
+
+Always maintain a professional, clinical tone."""
+
+def build_chat_messages(
+    request: ChatRequest,
+    session: Optional[ChatSession] = None
+) -> Tuple[List[dict], List[str], Optional[tuple]]:
     """
-    Handle chat messages
+    Build the OpenRouter message list for a chat request
     
-    This endpoint:
-    1. Receives chat history from frontend
-    2. Sends to OpenRouter LLM
-    3. Returns AI response
+    Searches the vector database with the user's last message (RAG) and
+    prepends a system message with the retrieved context. With a session,
+    the history comes from the server (summary + recent turns) behind a
+    fixed system prompt, and the context travels with the new question.
+    
+    Returns:
+        Tuple of (messages, sources, cache_key). cache_key is
+        (bucket, query_embedding) for answers the semantic cache may serve,
+        None otherwise (follow-up turns, no RAG).
     """
-    try:
-        # Get user's last message for RAG search
-        user_query = request.messages[-1].content if request.messages else ""
-        
-        # Convert Pydantic models to dict for OpenRouter
-        messages = [
-            {"role": msg.role, "content": msg.content}
-            for msg in request.messages
-        ]
-        
-        # Search vector database for relevant context (RAG)
-        context = ""
-        sources = []
+    # Get user's last message for RAG search
+    user_query = request.messages[-1].content if request.messages else ""
+    
+    # Convert Pydantic models to dict for OpenRouter
+    messages = [
+        {"role": msg.role, "content": msg.content}
+        for msg in request.messages
+    ]
+    
+    # Search vector database for relevant context (RAG)
+    context = ""
+    sources = []
+    cache_key = None
+    
+    if rag_engine and user_query:
+        print(f"🔍 Searching database for: '{user_query[:50]}...'")
+        rag_results = rag_engine.search_and_format(
+            query=user_query,
+            top_k=5,
+            min_similarity=0.3,
+            model=request.model
+        )
         
-        if rag_engine and user_query:
-            print(f"🔍 Searching database for: '{user_query[:50]}...'")
-            rag_results = rag_engine.search_and_format(
-                query=user_query,
-                top_k=5,
-                min_similarity=0.3
-            )
-            
-            context = rag_results['context']
-            sources = rag_results['sources']
-            print(f"✅ Found {rag_results['num_results']} relevant cases")
+        context = rag_results['context']
+        sources = rag_results['sources']
+        print(f"✅ Found {rag_results['num_results']} relevant cases (~{rag_results['context_tokens']} context tokens)")
         
-        # Build enhanced system message with context
-        if context and context != "No relevant information found in the database.":
-            system_content = f"""You are a medical AI assistant specializing in hemoglobin pattern diseases. 
+        # Only standalone questions are cacheable; follow-ups depend on the history
+        has_history = session is not None and (session.turns or session.summary)
+        if answer_cache and len(request.messages) == 1 and not has_history:
+            bucket = (request.model, request.temperature, request.max_tokens, tuple(rag_results['source_pages']))
+            cache_key = (bucket, rag_results['query_embedding'])
+    
+    # Numeric constraints ("HbA2 between 4 and 8%") are answered by the structured index
+    numeric_ranges = parse_range_query(user_query) if user_query else {}
+    numeric_index = get_numeric_index()
+    if numeric_ranges and numeric_index is not None:
+        matches = numeric_index.query(numeric_ranges)
+        print(f"🔢 Numeric index: {len(matches)} cases with {describe_ranges(numeric_ranges)}")
+        if matches:
+            structured = format_matches(numeric_ranges, matches)
+            if context and context != "No relevant information found in the database.":
+                context = f"{structured}\n\n---\n\n{context}"
+            else:
+                context = structured
+            sources = [f"Numeric index - {len(matches)} cases with {describe_ranges(numeric_ranges)}"] + sources
+            if cache_key:
+                cache_key = (cache_key[0] + (describe_ranges(numeric_ranges), len(matches)), cache_key[1])
+    
+    has_context = bool(context) and context != "No relevant information found in the database."
+    if not has_context:
+        sources = ["General medical knowledge (no specific database matches)"]
+    
+    if session is not None:
+        # Stable prefix (system prompt, summary, earlier turns), per-turn context last
+        if has_context:
+            turn_content = f"Information from the patient database:\n\n{context}\n\nQuestion: {user_query}"
+        else:
+            turn_content = f"(No specific cases were found in the database for this question.)\n\nQuestion: {user_query}"
+        messages = (
+            [{"role": "system", "content": SESSION_SYSTEM_PROMPT}]
+            + session.history()
+            + [{"role": "user", "content": turn_content}]
+        )
+        return messages, sources, cache_key
+    
+    # Build enhanced system message with context
+    if has_context:
+        system_content = f"""You are a medical AI assistant specializing in hemoglobin pattern diseases. 
 You help healthcare professionals analyze chromatograph patterns and diagnose hemoglobinopathies.
 
 IMPORTANT: Use the following information from the patient database to answer the question:
@@ -168,9 +264,9 @@ Based on this database information:
 - Recommend confirmatory tests when appropriate
 
 Always maintain a professional, clinical tone and reference the source pages."""
-        else:
-            # No relevant context found, use general knowledge
-            system_content = """You are a medical AI assistant specializing in hemoglobin pattern diseases. 
+    else:
+        # No relevant context found, use general knowledge
+        system_content = """You are a medical AI assistant specializing in hemoglobin pattern diseases. 
 You help healthcare professionals analyze chromatograph patterns and diagnose hemoglobinopathies.
 
 Note: No specific cases were found in the database for this query. Provide general medical knowledge.
@@ -182,32 +278,124 @@ When discussing patterns:
 - Recommend confirmatory tests when appropriate
 
 Always maintain a professional, clinical tone."""
-            sources = ["General medical knowledge (no specific database matches)"]
-        
-        system_message = {
-            "role": "system",
-            "content": system_content
-        }
+    
+    system_message = {
+        "role": "system",
+        "content": system_content
+    }
+    
+    messages.insert(0, system_message)
+    
+    return messages, sources, cache_key
+
+def get_cached_answer(cache_key: Optional[tuple]) -> Optional[str]:
+    """Semantic cache lookup for a key from build_chat_messages"""
+    if cache_key is None:
+        return None
+    bucket, query_embedding = cache_key
+    return answer_cache.get(bucket, query_embedding, rag_engine.index_version)
+
+def store_answer(cache_key: Optional[tuple], answer: str):
+    """Remember an answer for paraphrases of the same question"""
+    if cache_key is not None and answer:
+        bucket, query_embedding = cache_key
+        answer_cache.put(bucket, query_embedding, answer, rag_engine.index_version)
+
+# Chat endpoint
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """
+    Handle chat messages
+    
+    This endpoint:
+    1. Receives chat history from frontend
+    2. Sends to OpenRouter LLM
+    3. Returns AI response
+    """
+    try:
+        # RAG search runs on a worker thread so the event loop stays free
+        session = session_store.get_or_create(request.session_id) if request.session_id else None
+        messages, sources, cache_key = await asyncio.to_thread(build_chat_messages, request, session)
         
-        messages.insert(0, system_message)
+        # Paraphrase of an answered question with the same sources?
+        response = get_cached_answer(cache_key)
+        if response is None:
+            # Call OpenRouter with context
+            response = await openrouter_client.chat_completion(
+                messages=messages,
+                model=request.model,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            )
+            store_answer(cache_key, response)
         
-        # Call OpenRouter with context
-        response = await openrouter_client.chat_completion(
-            messages=messages,
-            model=request.model,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
-        )
+        if session is not None:
+            session_store.record(session, request.messages[-1].content, response)
         
         return ChatResponse(
             message=response,
             sources=sources,
-            model_used=request.model
+            model_used=request.model,
+            session_id=request.session_id
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Handle chat messages with a streamed answer (Server-Sent Events)
+    
+    Events:
+    - sources: {"sources"} retrieved context, sent before generation starts
+    - token: {"text"} answer fragment as the model produces it
+    - done: {"message", "sources", "model_used", "session_id"} full answer
+    - error: {"detail"} generation failed
+    """
+    async def event_stream():
+        try:
+            session = session_store.get_or_create(request.session_id) if request.session_id else None
+            messages, sources, cache_key = await asyncio.to_thread(build_chat_messages, request, session)
+            yield sse_event("sources", {"sources": sources})
+            
+            message = get_cached_answer(cache_key)
+            if message is not None:
+                yield sse_event("token", {"text": message})
+            else:
+                parts = []
+                async for text in openrouter_client.chat_completion_stream(
+                    messages=messages,
+                    model=request.model,
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens
+                ):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                message = "".join(parts)
+                store_answer(cache_key, message)
+            
+            if session is not None:
+                session_store.record(session, request.messages[-1].content, message)
+            
+            yield sse_event("done", {
+                "message": message,
+                "sources": sources,
+                "model_used": request.model,
+                "session_id": request.session_id
+            })
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Chat error: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    """Forget a server-side chat session"""
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return {"deleted": session_id}
+
 # Image upload endpoint
 @app.post("/api/upload-image")
 async def upload_image(file: UploadFile = File(...)):
@@ -238,15 +426,89 @@ async def upload_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
 
 # Image analysis endpoint
+def peak_feature_query(features: dict) -> Tuple[str, dict]:
+    """
+    Describe a chromatograph's peak features as RAG query text and numeric ranges
+    
+    Returns:
+        Tuple of (query text, numeric_index ranges around the OCR'd HbA2/HbF)
+    """
+    parts = []
+    ranges = {}
+    a2 = features.get('a2_concentration')
+    f = features.get('f_concentration')
+    if a2 is not None:
+        parts.append(f"HbA2 {a2:g}%")
+        ranges['hba2'] = (max(a2 - 1.0, 0.0), a2 + 1.0)
+    if f is not None:
+        parts.append(f"HbF {f:g}%")
+        ranges['hbf'] = (max(f - max(2.0, 0.2 * f), 0.0), f + max(2.0, 0.2 * f))
+    parts.append(f"{features.get('num_peaks', 0)} peaks")
+    return "Hemoglobin chromatograph with " + ", ".join(parts), ranges
+
+def lookup_peak_features(features: dict) -> List[str]:
+    """Database cases matching a chromatograph's peak features (numeric index + RAG)"""
+    query, ranges = peak_feature_query(features)
+    sources = []
+    
+    numeric_index = get_numeric_index()
+    if ranges and numeric_index is not None:
+        for match in numeric_index.query(ranges, limit=3):
+            values = ", ".join(f"{label} {match[key]:g}%" for key, label in (('hba2', 'HbA2'), ('hbf', 'HbF')) if key in match)
+            location = f"Page {match['page']}" if match['source'] == 'main_text' else match['image_id']
+            sources.append(f"Numeric match: {location} ({values})")
+    
+    if rag_engine:
+        rag_results = rag_engine.search_and_format(query=query, top_k=3, min_similarity=0.3)
+        sources.extend(rag_results['sources'])
+    
+    return sources
+
+def describe_prediction(prediction: dict, features: dict) -> str:
+    """Short written analysis from the local classifier (used when the vision model is skipped)"""
+    lines = [f"Pattern: {prediction['pattern_type']} (local classifier, confidence {prediction['confidence']:.0%})"]
+    
+    measured = [f"{features.get('num_peaks', 0)} peaks detected"]
+    if features.get('a2_concentration') is not None:
+        measured.append(f"HbA2 {features['a2_concentration']:g}%")
+    if features.get('f_concentration') is not None:
+        measured.append(f"HbF {features['f_concentration']:g}%")
+    lines.append("Measured: " + ", ".join(measured))
+    
+    if prediction['alternatives']:
+        differential = ", ".join(
+            f"{category.replace('_', ' ').title()} ({probability:.0%})"
+            for category, probability in prediction['alternatives'] if probability >= 0.01
+        )
+        lines.append(f"Differential: {differential or 'no alternative above 1%'}")
+    lines.append("Request a narrative analysis for a detailed vision-model interpretation.")
+    return "\n".join(lines)
+
 @app.post("/api/analyze-image", response_model=ImageAnalysisResponse)
 async def analyze_image(request: ImageAnalysisRequest):
     """
-    Analyze chromatograph image using Vision API
+    Analyze chromatograph image
     
-    This endpoint:
-    1. Receives base64 image
-    2. Sends to OpenRouter Vision model (GPT-4V)
-    3. Returns pattern analysis
+    This endpoint runs three branches concurrently:
+    1. Hybrid CLIP + peak visual search for similar database patterns
+    2. Numeric index / RAG lookup keyed on the image's peak features
+       (reuses the peak analysis from branch 1)
+    3. Classification: the local pattern classifier labels the image from the
+       search's CLIP embedding and peak features in milliseconds. The
+       OpenRouter vision model is only called when the calibrated confidence
+       is below CLASSIFIER_CONFIDENCE_THRESHOLD, when narrative text is
+       requested (narrative=true or a custom prompt), or when no classifier
+       has been built (src/9_build_pattern_classifier.py).
+    
+    Latency trade-off: by default the vision call for a low-confidence image
+    only starts once the search has reached its peak analysis (the
+    classifier needs its CLIP embedding and features), so those requests take
+    search + vision time. With CLASSIFIER_SPECULATIVE_VISION=1 the vision
+    call starts immediately and is cancelled on a confident prediction,
+    bringing latency down to the slowest branch at the cost of a vision
+    request for (nearly) every image.
+    
+    Search branches that fail only drop their part of the response.
     """
     try:
         # Create specialized prompt for chromatograph analysis
@@ -262,33 +524,129 @@ async def analyze_image(request: ImageAnalysisRequest):
 
 Provide a technical, clinical analysis suitable for medical professionals."""
         
-        # Call OpenRouter Vision API
-        analysis = await openrouter_client.analyze_image(
-            image_base64=request.image_base64,
-            prompt=analysis_prompt
+        image_base64 = request.image_base64.split(",", 1)[-1] if request.image_base64.startswith("data:") else request.image_base64
+        image = Image.open(io.BytesIO(base64.b64decode(image_base64))).convert('RGB')
+        
+        narrative = request.narrative or request.prompt != DEFAULT_ANALYSIS_PROMPT
+        classifier = get_pattern_classifier() if visual_engine else None
+        search_ready = asyncio.get_running_loop().create_future()  # (query_embedding, query_features)
+        
+        async def vision_branch() -> str:
+            # Call OpenRouter Vision API
+            return await openrouter_client.analyze_image(
+                image_base64=image_base64,
+                prompt=analysis_prompt,
+                cache=True  # Identical image + prompt reuses the earlier analysis
+            )
+        
+        # Narrative requests (or no classifier) need the vision model anyway - start it now;
+        # otherwise only when speculative vision is enabled
+        vision_needed = narrative or classifier is None
+        vision_task = asyncio.create_task(vision_branch()) if vision_needed or CLASSIFIER_SPECULATIVE_VISION else None
+        
+        async def similar_branch() -> Tuple[List[dict], List[float]]:
+            if not visual_engine:
+                return [], []
+            query_embedding = None
+            try:
+                async for event in visual_engine.stream_search_with_peaks(
+                    image=image, top_k=5, clip_weight=0.40, peak_weight=0.60
+                ):
+                    if event['event'] == 'clip':
+                        query_embedding = event['query_embedding']
+                    elif event['event'] == 'peaks' and not search_ready.done():
+                        search_ready.set_result((query_embedding, event['query_features']))
+                    elif event['event'] == 'done':
+                        return event['results'], event['scores']
+            finally:
+                # Never leave the other branches waiting on a failed search
+                if not search_ready.done():
+                    search_ready.set_exception(RuntimeError("Visual search ended before peak analysis"))
+            return [], []
+        
+        async def knowledge_branch() -> List[str]:
+            if visual_engine:
+                _, features = await search_ready
+            else:
+                features = await asyncio.to_thread(get_peak_analyzer().analyze_image, image)
+            return await asyncio.to_thread(lookup_peak_features, features)
+        
+        async def classification_branch() -> Tuple[Optional[str], Optional[dict], dict]:
+            prediction, features = None, {}
+            if classifier is not None:
+                try:
+                    query_embedding, features = await search_ready
+                    prediction = classifier.predict(query_embedding, features)
+                except Exception as e:
+                    print(f"⚠️ Local classification failed: {e}")
+            
+            confident = prediction is not None and prediction['confidence'] >= CLASSIFIER_CONFIDENCE_THRESHOLD
+            if vision_task is not None and (vision_needed or not confident):
+                return await vision_task, prediction, features
+            if not confident:
+                return await vision_branch(), prediction, features
+            if vision_task is not None:
+                vision_task.cancel()  # Speculative call no longer needed
+            print(f"⚡ Classified locally as {prediction['pattern_type']} ({prediction['confidence']:.0%}) - skipping vision model")
+            return None, prediction, features
+        
+        classified, similar, knowledge = await asyncio.gather(
+            classification_branch(), similar_branch(), knowledge_branch(), return_exceptions=True
         )
+        if isinstance(classified, Exception):
+            raise classified
+        if isinstance(similar, Exception):
+            print(f"⚠️ Visual search for analysis failed: {similar}")
+            similar = ([], [])
+        if isinstance(knowledge, Exception):
+            print(f"⚠️ Peak feature lookup failed: {knowledge}")
+            knowledge = []
+        analysis, prediction, features = classified
+        similar_results, similar_scores = similar
+        llm_used = analysis is not None
         
-        # Parse analysis to extract pattern type (simplified)
-        pattern_type = "Unknown"
-        if "HbE" in analysis:
-            pattern_type = "HbE Disease"
-        elif "beta" in analysis.lower() and "thal" in analysis.lower():
-            pattern_type = "Beta Thalassemia"
-        elif "HbS" in analysis:
-            pattern_type = "Sickle Cell"
-        
-        # Mock sources (will be replaced with similar pattern search)
-        mock_sources = [
-            "Similar to: hb_e reference case #23",
-            "Pattern matches: 3 database cases",
-            "Confidence: High (85%)"
-        ]
+        if prediction is not None and (not llm_used or prediction['confidence'] >= CLASSIFIER_CONFIDENCE_THRESHOLD):
+            pattern_type = prediction['pattern_type']
+        else:
+            # Parse analysis to extract pattern type (simplified)
+            pattern_type = "Unknown"
+            if "HbE" in analysis:
+                pattern_type = "HbE Disease"
+            elif "beta" in analysis.lower() and "thal" in analysis.lower():
+                pattern_type = "Beta Thalassemia"
+            elif "HbS" in analysis:
+                pattern_type = "Sickle Cell"
+            elif prediction is not None:
+                pattern_type = prediction['pattern_type']
+            elif similar_results:
+                pattern_type = similar_results[0]['category'].replace("_", " ").title()
+        
+        if not llm_used:
+            analysis = describe_prediction(prediction, features)
+        
+        sources = []
+        if prediction is not None:
+            sources.append(
+                f"Classifier: {prediction['pattern_type']} ({prediction['confidence']:.0%}) - nearest references: "
+                + ", ".join(category for _, category, _ in prediction['neighbors'])
+            )
+        sources += [
+            f"Similar to: {result['category']} ({result.get('original_file') or result['image_file']}) - {score:.0%}"
+            for result, score in zip(similar_results[:3], similar_scores[:3])
+        ] + knowledge
+        
+        if prediction is not None:
+            confidence = round(prediction['confidence'], 2)
+        else:
+            confidence = round(similar_scores[0], 2) if similar_scores else None
         
         return ImageAnalysisResponse(
             analysis=analysis,
             pattern_type=pattern_type,
-            confidence=0.85,
-            sources=mock_sources
+            confidence=confidence,
+            sources=sources,
+            similar_patterns=format_visual_results(similar_results),
+            llm_used=llm_used
         )
         
     except Exception as e:
@@ -415,13 +773,139 @@ async def get_reference_image(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error serving image: {str(e)}")
 
+def format_visual_results(results: List[dict]) -> List[dict]:
+    """Format visual search results for the frontend (adds image URLs)"""
+    formatted_results = []
+    for result in results:
+        # Build image URL
+        if result['source'] == 'main_database':
+            image_url = f"/api/images/main/{result['image_file'].replace('main_cropped_', '')}"
+        else:
+            image_url = f"/api/images/reference/{result['image_file'].replace('reference_cropped_', '')}"
+        
+        formatted = {
+            'category': result['category'],
+            'similarity': result.get('hybrid_similarity', result.get('similarity', 0)),
+            'clip_similarity': result.get('clip_similarity'),
+            'peak_similarity': result.get('peak_similarity'),
+            'num_peaks': result.get('num_peaks'),
+            'peak_details': result.get('peak_details'),
+            'system_type': result['system_type'],
+            'source': result['source'],
+            'image_url': image_url,
+            'original_file': result.get('original_file', '')
+        }
+        if 'matched_page' in result:
+            formatted['matched_page'] = result['matched_page']
+        
+        formatted_results.append(formatted)
+    
+    return formatted_results
+
+async def run_visual_search(
+    contents: bytes,
+    filename: str,
+    top_k: int = 10,
+    llm_screen: bool = True,
+    page_number: int = 0,
+    all_pages: bool = False,
+    progress=None,
+    numeric_filter: str = None
+) -> dict:
+    """
+    Run a hybrid visual search on uploaded bytes and format the response
+    
+    Shared by the synchronous endpoint and the background job handler.
+    """
+    # Detect file type
+    is_pdf = filename.lower().endswith('.pdf') or contents[:4] == b'%PDF'
+    
+    # Optional numeric pre-filter, e.g. "HbA2 > 4 and HbF below 2"
+    numeric_ranges = parse_range_query(numeric_filter) if numeric_filter else {}
+    if numeric_filter and not numeric_ranges:
+        raise HTTPException(status_code=400, detail=f"Could not parse numeric filter: {numeric_filter}")
+    
+    # Multi-page mode: one PDF open, one CLIP batch, parallel peak analysis
+    if is_pdf and all_pages:
+        search = await visual_engine.search_similar_multipage(
+            pdf_bytes=contents,
+            top_k=top_k,
+            clip_weight=0.40,
+            peak_weight=0.60,
+            llm_screen=llm_screen,
+            progress=progress,
+            numeric_filter=numeric_ranges
+        )
+        
+        merged_results = format_visual_results(search['merged']['results'])
+        return {
+            'results': merged_results,
+            'total': len(merged_results),
+            'query_image': filename,
+            'pages': [
+                {
+                    'page_number': page['page_number'],
+                    'results': format_visual_results(page['results']),
+                    'query_features': {
+                        'num_peaks': page['query_features'].get('num_peaks', 0),
+                        'peak_positions': page['query_features'].get('normalized_positions', [])
+                    }
+                }
+                for page in search['pages']
+            ]
+        }
+    
+    # Hybrid search with LLM screening:
+    # Step 1: CLIP + peak-based similarity search
+    # Step 2: LLM vision model screens results (if enabled)
+    #   - LLM looks at both images and filters out clinically dissimilar ones
+    #   - No OCR needed - LLM directly sees the chromatograph patterns
+    if is_pdf:
+        results, similarities, query_features = await visual_engine.search_similar_with_peaks(
+            pdf_bytes=contents, 
+            top_k=top_k,
+            clip_weight=0.40,  # 40% Visual similarity
+            peak_weight=0.60,  # 60% Clinical features (balanced)
+            llm_screen=llm_screen,
+            page_number=page_number,
+            progress=progress,
+            numeric_filter=numeric_ranges
+        )
+    else:
+        image = Image.open(io.BytesIO(contents)).convert('RGB')
+        results, similarities, query_features = await visual_engine.search_similar_with_peaks(
+            image=image, 
+            top_k=top_k,
+            clip_weight=0.40,  # 40% Visual
+            peak_weight=0.60,  # 60% Clinical
+            llm_screen=llm_screen,
+            page_number=page_number,  # Ignored for image uploads
+            progress=progress,
+            numeric_filter=numeric_ranges
+        )
+    
+    # Format results
+    formatted_results = format_visual_results(results)
+    
+    return {
+        'results': formatted_results,
+        'total': len(formatted_results),
+        'query_image': filename,
+        'query_features': {
+            'num_peaks': query_features.get('num_peaks', 0),
+            'peak_positions': query_features.get('normalized_positions', [])
+        }
+    }
+
 # Visual search endpoint
 @app.post("/api/visual-search")
 async def visual_search(
     file: UploadFile = File(...), 
     top_k: int = 10,
     llm_screen: bool = True,  # Enable LLM screening by default
-    page_number: int = 0  # Which page to extract from PDF (0-indexed)
+    page_number: int = 0,  # Which page to extract from PDF (0-indexed)
+    all_pages: bool = False,  # Search every PDF page in one batched request
+    numeric_filter: str = None  # e.g. "HbA2 between 4 and 8" (needs src/8_build_numeric_index.py)
 ):
     """
     Visual similarity search - upload chromatograph image or PDF to find similar patterns
@@ -431,6 +915,8 @@ async def visual_search(
         top_k: Number of similar images to return
         llm_screen: Enable LLM vision screening to filter bad results (default: True)
         page_number: Which page to extract from PDF (0 = first page, 1 = second page, etc.)
+        all_pages: For PDFs, search all pages at once and return per-page and merged rankings
+        numeric_filter: Optional HbA2/HbF/HbS/HbE range text restricting candidates
     
     Returns:
         JSON with similar images and metadata
@@ -442,68 +928,284 @@ async def visual_search(
         # Read uploaded file
         contents = await file.read()
         
-        # Detect file type
-        is_pdf = file.filename.lower().endswith('.pdf') or contents[:4] == b'%PDF'
-        
-        # Hybrid search with LLM screening:
-        # Step 1: CLIP + peak-based similarity search
-        # Step 2: LLM vision model screens results (if enabled)
-        #   - LLM looks at both images and filters out clinically dissimilar ones
-        #   - No OCR needed - LLM directly sees the chromatograph patterns
-        if is_pdf:
-            results, similarities, query_features = await visual_engine.search_similar_with_peaks(
-                pdf_bytes=contents, 
-                top_k=top_k,
-                clip_weight=0.40,  # 40% Visual similarity
-                peak_weight=0.60,  # 60% Clinical features (balanced)
-                llm_screen=llm_screen,
-                page_number=page_number
-            )
-        else:
-            image = Image.open(io.BytesIO(contents)).convert('RGB')
-            results, similarities, query_features = await visual_engine.search_similar_with_peaks(
-                image=image, 
-                top_k=top_k,
-                clip_weight=0.40,  # 40% Visual
-                peak_weight=0.60,  # 60% Clinical
-                llm_screen=llm_screen,
-                page_number=page_number  # Ignored for image uploads
-            )
+        return await run_visual_search(
+            contents,
+            file.filename,
+            top_k=top_k,
+            llm_screen=llm_screen,
+            page_number=page_number,
+            all_pages=all_pages,
+            numeric_filter=numeric_filter
+        )
         
-        # Format results
-        formatted_results = []
-        for result in results:
-            # Build image URL
-            if result['source'] == 'main_database':
-                image_url = f"/api/images/main/{result['image_file'].replace('main_cropped_', '')}"
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Visual search error: {str(e)}")
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Streaming visual search endpoint
+@app.post("/api/visual-search/stream")
+async def visual_search_stream(
+    file: UploadFile = File(...),
+    top_k: int = 10,
+    llm_screen: bool = True,
+    page_number: int = 0
+):
+    """
+    Visual similarity search with progressive results (server-sent events)
+    
+    Events, in order:
+        clip  - CLIP-ranked results (available almost immediately)
+        peaks - results re-ranked with peak similarity, plus query features
+        llm   - one per LLM screening verdict, as each comparison finishes
+        done  - final results (same shape as /api/visual-search)
+        error - sent instead of the remaining events if the search fails
+    """
+    if not visual_engine:
+        raise HTTPException(status_code=503, detail="Visual search not available")
+    
+    contents = await file.read()
+    filename = file.filename
+    
+    async def event_stream():
+        try:
+            is_pdf = filename.lower().endswith('.pdf') or contents[:4] == b'%PDF'
+            if is_pdf:
+                search_input = {'pdf_bytes': contents, 'page_number': page_number}
             else:
-                image_url = f"/api/images/reference/{result['image_file'].replace('reference_cropped_', '')}"
+                search_input = {'image': Image.open(io.BytesIO(contents)).convert('RGB')}
             
-            formatted_results.append({
-                'category': result['category'],
-                'similarity': result.get('hybrid_similarity', result.get('similarity', 0)),
-                'clip_similarity': result.get('clip_similarity'),
-                'peak_similarity': result.get('peak_similarity'),
-                'num_peaks': result.get('num_peaks'),
-                'peak_details': result.get('peak_details'),
-                'system_type': result['system_type'],
-                'source': result['source'],
-                'image_url': image_url,
-                'original_file': result.get('original_file', '')
-            })
-        
-        return {
-            'results': formatted_results,
-            'total': len(formatted_results),
-            'query_image': file.filename,
-            'query_features': {
-                'num_peaks': query_features.get('num_peaks', 0),
-                'peak_positions': query_features.get('normalized_positions', [])
+            async for event in visual_engine.stream_search_with_peaks(
+                top_k=top_k,
+                clip_weight=0.40,
+                peak_weight=0.60,
+                llm_screen=llm_screen,
+                **search_input
+            ):
+                if event['event'] == 'llm':
+                    yield sse_event('llm', {
+                        'rank': event['rank'],
+                        'approved': event['approved'],
+                        'result': format_visual_results([event['result']])[0]
+                    })
+                    continue
+                
+                formatted_results = format_visual_results(event['results'])
+                data = {
+                    'results': formatted_results,
+                    'total': len(formatted_results),
+                    'query_image': filename
+                }
+                if 'query_features' in event:
+                    data['query_features'] = {
+                        'num_peaks': event['query_features'].get('num_peaks', 0),
+                        'peak_positions': event['query_features'].get('normalized_positions', [])
+                    }
+                yield sse_event(event['event'], data)
+        except Exception as e:
+            yield sse_event('error', {'detail': f"Visual search error: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# Batch visual search endpoint
+@app.post("/api/visual-search/batch")
+async def visual_search_batch(
+    files: List[UploadFile] = File(...),
+    top_k: int = 10,
+    llm_screen: bool = False,  # Off by default for bulk back-fills
+    all_pages: bool = False,
+    batch_size: int = 32
+):
+    """
+    Batch visual similarity search for bulk back-fills
+    
+    Args:
+        files: Uploaded images and/or PDFs
+        top_k: Number of similar images to return per query
+        llm_screen: Enable LLM vision screening (default: False)
+        all_pages: For PDFs, search every page (default: first page only)
+        batch_size: Queries embedded per CLIP forward pass
+    
+    Returns:
+        Streamed JSONL (application/x-ndjson), one line per query chromatograph
+    """
+    if not visual_engine:
+        raise HTTPException(status_code=503, detail="Visual search not available")
+    
+    errors = []
+    
+    def iter_uploads():
+        # Read uploads lazily so only one batch of images is decoded at a time
+        # (search_batch pulls each batch in a worker thread, so PDF rendering
+        # and OCR cropping stay off the event loop)
+        for upload in files:
+            try:
+                contents = upload.file.read()
+                is_pdf = upload.filename.lower().endswith('.pdf') or contents[:4] == b'%PDF'
+                if is_pdf and all_pages:
+                    for page, page_image in visual_engine.extract_all_from_pdf(contents):
+                        yield f"{upload.filename}#page{page + 1}", page_image
+                elif is_pdf:
+                    yield f"{upload.filename}#page1", visual_engine.extract_from_pdf(contents)
+                else:
+                    image = Image.open(io.BytesIO(contents)).convert('RGB')
+                    yield upload.filename, visual_engine.prepare_query_image(image=image)
+            except Exception as e:
+                errors.append({'query': upload.filename, 'error': str(e)})
+    
+    async def stream_results():
+        async for item in visual_engine.search_batch(
+            iter_uploads(),
+            top_k=top_k,
+            clip_weight=0.40,
+            peak_weight=0.60,
+            llm_screen=llm_screen,
+            batch_size=batch_size
+        ):
+            yield json.dumps(format_batch_result(item)) + "\n"
+            while errors:
+                yield json.dumps(errors.pop(0)) + "\n"
+        while errors:
+            yield json.dumps(errors.pop(0)) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# Background jobs
+async def visual_search_job(params: dict, payload: bytes, progress) -> dict:
+    """Job handler: hybrid visual search on an uploaded file"""
+    if not visual_engine:
+        raise RuntimeError("Visual search not available")
+    return await run_visual_search(
+        payload,
+        params.get('filename', ''),
+        top_k=params.get('top_k', 10),
+        llm_screen=params.get('llm_screen', True),
+        page_number=params.get('page_number', 0),
+        all_pages=params.get('all_pages', False),
+        progress=progress,
+        numeric_filter=params.get('numeric_filter')
+    )
+
+async def rebuild_text_index_job(params: dict, payload: bytes, progress) -> dict:
+    """Job handler: re-chunk pdf_text.json and sync the hb_patterns collection"""
+    import build_vectordb
+    
+    project_root = Path(__file__).parent.parent
+    text_file = project_root / "data" / "pdf_text.json"
+    persist_dir = project_root / "vector_db" / "chroma_storage"
+    
+    progress("chunking", 0.1)
+    text_data = await asyncio.to_thread(build_vectordb.load_text_data, text_file)
+    chunks = await asyncio.to_thread(build_vectordb.chunk_text, text_data, chunk_size=1000, chunk_overlap=200)
+    
+    progress("embedding", 0.3)
+    collection, stats = await asyncio.to_thread(
+        build_vectordb.build_vector_database, chunks, str(persist_dir), "hb_patterns",
+        params.get('full_rebuild', False)
+    )
+    
+    # Point the live RAG engine at the rebuilt collection (and re-snapshot the hybrid index)
+    if rag_engine:
+        rag_engine.collection = rag_engine.client.get_collection(name=rag_engine.collection_name)
+        if rag_engine.hybrid_index is not None:
+            progress("indexing", 0.9)
+            await asyncio.to_thread(rag_engine.load_hybrid_index)
+        # A new version invalidates semantically cached answers
+        await asyncio.to_thread(rag_engine.refresh_index_version)
+    
+    return {'chunks': len(chunks), 'vectors': collection.count(), **stats}
+
+job_manager = get_job_manager()
+job_manager.register("visual_search", visual_search_job)
+# Rebuilds are never deduplicated (requested_at), so run them one at a time
+job_manager.register("rebuild_text_index", rebuild_text_index_job, exclusive=True)
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_manager.stop()
+
+@app.post("/api/jobs/visual-search")
+async def submit_visual_search_job(
+    file: UploadFile = File(...),
+    top_k: int = 10,
+    llm_screen: bool = True,
+    page_number: int = 0,
+    all_pages: bool = False,
+    numeric_filter: str = None
+):
+    """
+    Queue a visual search and return immediately with a job id
+    
+    Poll GET /api/jobs/{job_id} or subscribe to GET /api/jobs/{job_id}/events
+    for progress and the result. Identical submissions within the result TTL
+    share one job, as long as neither the image nor the text index has been
+    rebuilt since.
+    """
+    if not visual_engine:
+        raise HTTPException(status_code=503, detail="Visual search not available")
+    
+    contents = await file.read()
+    # Read at submit time so offline rebuilds (scripts 5 and 11) change the key too
+    image_index_version = await asyncio.to_thread(visual_engine.refresh_index_version)
+    job = job_manager.submit(
+        "visual_search",
+        params={
+            'filename': file.filename,
+            'top_k': top_k,
+            'llm_screen': llm_screen,
+            'page_number': page_number,
+            'all_pages': all_pages,
+            'numeric_filter': numeric_filter,
+            # Part of the job cache key: a rebuild must not return a stale result
+            'index_versions': {
+                'image': image_index_version,
+                'text': rag_engine.index_version if rag_engine else None
             }
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Visual search error: {str(e)}")
+        },
+        payload=contents
+    )
+    return {'job_id': job['job_id'], 'status': job['status']}
+
+@app.post("/api/jobs/rebuild-text-index")
+async def submit_rebuild_text_index_job(full_rebuild: bool = False):
+    """
+    Queue a rebuild of the text (RAG) collection from pdf_text.json
+    
+    Only new or changed chunks are re-embedded unless full_rebuild is set.
+    """
+    job = job_manager.submit(
+        "rebuild_text_index",
+        params={'requested_at': time.time(), 'full_rebuild': full_rebuild}
+    )
+    return {'job_id': job['job_id'], 'status': job['status']}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status, progress and result"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events with job status updates until the job finishes"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    async def event_stream():
+        async for job in job_manager.subscribe(job_id):
+            yield sse_event(job['status'], job)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,164 @@
+"""
+Batch Visual Search
+Runs similarity search over many reports (e.g. LIS back-fills) and streams
+results to a JSONL file, one line per query chromatograph
+
+Usage:
+    python src/batch_visual_search.py reports/ -o results.jsonl
+    python src/batch_visual_search.py a.pdf b.png --top-k 5 --all-pages
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Tuple
+from PIL import Image
+from visual_search import get_visual_search_engine
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg'}
+SUPPORTED_SUFFIXES = IMAGE_SUFFIXES | {'.pdf'}
+
+def collect_input_files(inputs: List[str], recursive: bool = False) -> List[Path]:
+    """
+    Expand input paths (files and directories) into a sorted list of reports
+    
+    Args:
+        inputs: File or directory paths
+        recursive: Descend into subdirectories
+    
+    Returns:
+        List of supported report files
+    """
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            pattern = "**/*" if recursive else "*"
+            files.extend(
+                p for p in sorted(path.glob(pattern))
+                if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES
+            )
+        elif path.is_file() and path.suffix.lower() in SUPPORTED_SUFFIXES:
+            files.append(path)
+        else:
+            print(f"⚠️  Skipping unsupported input: {item}")
+    return files
+
+def iter_queries(engine, files: List[Path], all_pages: bool = False, page_number: int = 0,
+                 errors: list = None) -> Iterator[Tuple[str, Image.Image]]:
+    """
+    Lazily load and crop query chromatographs from report files
+    
+    Args:
+        engine: VisualSearchEngine
+        files: Report files
+        all_pages: Search every page of each PDF
+        page_number: PDF page to search when all_pages is False (0-indexed)
+        errors: List collecting (query_id, error message) for unreadable files
+            (including PDFs without the requested page)
+    
+    Yields:
+        (query_id, cropped chromatograph image)
+    """
+    for path in files:
+        try:
+            if path.suffix.lower() == '.pdf':
+                pdf_bytes = path.read_bytes()
+                if all_pages:
+                    for page, page_image in engine.extract_all_from_pdf(pdf_bytes):
+                        yield f"{path}#page{page + 1}", page_image
+                else:
+                    yield f"{path}#page{page_number + 1}", engine.extract_from_pdf(pdf_bytes, page_number=page_number, strict=True)
+            else:
+                image = Image.open(path).convert('RGB')
+                yield str(path), engine.prepare_query_image(image=image)
+        except Exception as e:
+            print(f"⚠️  Failed to load {path}: {e}")
+            if errors is not None:
+                errors.append((str(path), str(e)))
+
+def format_batch_result(item: dict) -> dict:
+    """Convert an engine batch result into a compact JSON-serializable record"""
+    return {
+        'query': item['query_id'],
+        'query_features': {
+            'num_peaks': item['query_features'].get('num_peaks', 0),
+            'a2_concentration': item['query_features'].get('a2_concentration'),
+            'f_concentration': item['query_features'].get('f_concentration')
+        },
+        'results': [
+            {
+                'id': result['id'],
+                'category': result['category'],
+                'source': result['source'],
+                'image_file': result['image_file'],
+                'original_file': result.get('original_file', ''),
+                'similarity': score,
+                'clip_similarity': result.get('clip_similarity'),
+                'peak_similarity': result.get('peak_similarity')
+            }
+            for result, score in zip(item['results'], item['scores'])
+        ]
+    }
+
+async def run_batch(args) -> int:
+    """Run the batch search and stream results to the output file"""
+    files = collect_input_files(args.inputs, recursive=args.recursive)
+    if not files:
+        print("❌ No supported input files found")
+        return 1
+    
+    print(f"📂 {len(files)} report files to search")
+    engine = get_visual_search_engine()
+    
+    errors = []
+    queries = iter_queries(engine, files, all_pages=args.all_pages, page_number=args.page, errors=errors)
+    
+    start = time.time()
+    written = 0
+    
+    with open(args.output, 'w', encoding='utf-8') as out:
+        async for item in engine.search_batch(
+            queries,
+            top_k=args.top_k,
+            clip_weight=0.40,
+            peak_weight=0.60,
+            llm_screen=args.llm_screen,
+            batch_size=args.batch_size
+        ):
+            out.write(json.dumps(format_batch_result(item)) + "\n")
+            written += 1
+            
+            # Flush load errors collected while the batch was being read
+            for query_id, message in errors:
+                out.write(json.dumps({'query': query_id, 'error': message}) + "\n")
+            errors.clear()
+            out.flush()
+        
+        for query_id, message in errors:
+            out.write(json.dumps({'query': query_id, 'error': message}) + "\n")
+    
+    elapsed = time.time() - start
+    print(f"✅ Wrote {written} query results to {args.output} in {elapsed:.1f}s")
+    return 0
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Batch visual similarity search to JSONL")
+    parser.add_argument("inputs", nargs="+", help="Report files (PDF/PNG/JPG) or directories")
+    parser.add_argument("-o", "--output", default="visual_search_results.jsonl", help="Output JSONL path")
+    parser.add_argument("--top-k", type=int, default=10, help="Results per query")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per CLIP forward pass")
+    parser.add_argument("--all-pages", action="store_true", help="Search every page of each PDF")
+    parser.add_argument("--page", type=int, default=0, help="PDF page to search (0-indexed; PDFs without it are reported as errors)")
+    parser.add_argument("--recursive", action="store_true", help="Descend into subdirectories")
+    parser.add_argument("--llm-screen", action="store_true", help="Enable LLM vision screening")
+    args = parser.parse_args()
+    
+    sys.exit(asyncio.run(run_batch(args)))
+
+if __name__ == "__main__":
+    main()
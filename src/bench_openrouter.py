@@ -0,0 +1,161 @@
+"""
+OpenRouter Load Benchmark
+Fires concurrent chat, vision or screening requests through OpenRouterClient
+and reports latency percentiles and failure counts
+
+Runs offline against the bundled mock (src/mock_openrouter.py):
+    python src/bench_openrouter.py --spawn-mock --mode screen --requests 200 --concurrency 16 --seed 7
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+import numpy as np
+from PIL import Image
+from llm_payloads import encode_image_for_llm
+
+def build_messages(mode: str, batch_size: int, image_url: str) -> List[Dict]:
+    """Build a request of the given kind (mirrors the prompts used by the app)"""
+    if mode in ("chat", "stream"):
+        return [
+            {"role": "system", "content": "You are a helpful medical assistant specialized in hemoglobin pattern analysis."},
+            {"role": "user", "content": "What distinguishes HbE trait from beta thalassemia trait on HPLC?"}
+        ]
+    
+    if mode == "vision":
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Analyze this hemoglobin chromatograph."},
+                {"type": "image_url", "image_url": {"url": image_url}}
+            ]
+        }]
+    
+    # Batched screening request: one query plus batch_size candidates
+    content = [
+        {"type": "text", "text": f"Judge each candidate against the QUERY.\n"
+                                 f"**Answer with exactly {batch_size} lines, one per candidate, in this format:**\n1: YES\n2: NO"},
+        {"type": "text", "text": "QUERY:"},
+        {"type": "image_url", "image_url": {"url": image_url}}
+    ]
+    for i in range(1, batch_size + 1):
+        content.append({"type": "text", "text": f"CANDIDATE {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return [{"role": "user", "content": content}]
+
+def synthetic_chromatograph() -> Image.Image:
+    """Small synthetic trace so the benchmark needs no data files"""
+    x = np.linspace(0, 1, 800)
+    trace = np.exp(-((x - 0.35) / 0.02) ** 2) * 0.2 + np.exp(-((x - 0.6) / 0.04) ** 2)
+    canvas = np.full((300, 800), 255, dtype=np.uint8)
+    rows = (280 - trace * 250).astype(int)
+    canvas[rows, np.arange(800)] = 0
+    return Image.fromarray(canvas)
+
+def spawn_mock(port: int, args):
+    """Run the mock server in a background thread"""
+    import uvicorn
+    import mock_openrouter
+    
+    mock_openrouter.configure(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    config = uvicorn.Config(mock_openrouter.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def run_benchmark(args) -> Dict:
+    """Send the requests and collect latencies"""
+    from openrouter_client import OpenRouterClient
+    
+    client = OpenRouterClient()
+    image_url = encode_image_for_llm(synthetic_chromatograph())
+    messages = build_messages(args.mode, args.batch_size, image_url)
+    model = "openai/gpt-4o" if args.mode not in ("chat", "stream") else None
+    
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    failures: Dict[str, int] = {}
+    
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if args.mode == "stream":
+                    first_token = None
+                    async for _ in client.chat_completion_stream(messages=messages, model=model, max_tokens=50):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                    first_tokens.append(first_token)
+                else:
+                    await client.chat_completion(messages=messages, model=model, temperature=0.3, max_tokens=50)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                kind = "rate_limited" if "429" in str(e) else type(e).__name__
+                failures[kind] = failures.get(kind, 0) + 1
+    
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[one_request() for _ in range(args.requests)])
+    wall = time.perf_counter() - wall_start
+    
+    return {"latencies": latencies, "first_tokens": first_tokens, "failures": failures, "wall": wall}
+
+def report(args, outcome: Dict):
+    """Print latency percentiles and throughput"""
+    latencies = np.array(outcome["latencies"]) * 1000
+    print("="*70)
+    print(f"📊 {args.mode} x {args.requests} requests, concurrency {args.concurrency}")
+    print("="*70)
+    print(f"   Succeeded:  {len(latencies)}")
+    print(f"   Failed:     {sum(outcome['failures'].values())} {outcome['failures'] or ''}")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"   Latency:    p50 {p50:.0f} ms | p95 {p95:.0f} ms | p99 {p99:.0f} ms | max {latencies.max():.0f} ms")
+    if outcome["first_tokens"]:
+        p50, p95 = np.percentile(np.array(outcome["first_tokens"]) * 1000, [50, 95])
+        print(f"   First token: p50 {p50:.0f} ms | p95 {p95:.0f} ms")
+    print(f"   Throughput: {args.requests / outcome['wall']:.1f} req/s ({outcome['wall']:.1f}s wall)")
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark OpenRouterClient (offline with --spawn-mock)")
+    parser.add_argument("--mode", choices=["chat", "stream", "vision", "screen"], default="screen")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4, help="Candidates per screening request")
+    parser.add_argument("--spawn-mock", action="store_true", help="Start the mock server in-process")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-median-ms", type=float, default=800.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    if args.spawn_mock:
+        os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{args.port}/api/v1"
+        os.environ.setdefault("OPENROUTER_API_KEY", "mock")
+        spawn_mock(args.port, args)
+        print(f"🧪 Mock OpenRouter running on port {args.port}")
+    elif not os.getenv("OPENROUTER_BASE_URL"):
+        print("⚠️  OPENROUTER_BASE_URL not set - this will hit the real OpenRouter API")
+    
+    outcome = asyncio.run(run_benchmark(args))
+    report(args, outcome)
+    sys.exit(0 if outcome["latencies"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,32 @@ Build Vector Database
 Creates ChromaDB with embeddings from extracted PDF text
 """
 
+import hashlib
 import json
+import os
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 import sys
 
+# Padded-token budget per encode batch; short chunks get bigger batches
+ENCODE_BATCH_TOKENS = int(os.getenv("ENCODE_BATCH_TOKENS", "65536"))
+ENCODE_BATCH_MIN = 16
+ENCODE_BATCH_MAX = 512
+
+# Chroma rejects very large single writes
+WRITE_BATCH_SIZE = 1000
+
 def load_text_data(text_file: Path) -> List[Dict]:
-    """Load extracted text from JSON"""
+    """Load extracted text from JSON (page list, or the {"page_N": {...}} dict written by the extractor)"""
     print(f"📄 Loading text from: {text_file}")
     with open(text_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
+    if isinstance(data, dict):
+        data = sorted(data.values(), key=lambda page: page.get('page', 0))
     print(f"✅ Loaded {len(data)} pages")
     return data
 
@@ -66,16 +78,82 @@ def chunk_text(text_data: List[Dict], chunk_size: int = 1000, chunk_overlap: int
     print(f"✅ Created {len(chunks)} text chunks")
     return chunks
 
-def build_vector_database(chunks: List[Dict], persist_dir: str, collection_name: str):
+def chunk_id(chunk: Dict) -> str:
     """
-    Build ChromaDB vector database with embeddings
+    Stable content-hashed id for a chunk
+    
+    Unchanged text at the same page position keeps its id across runs, so
+    rebuilds only touch chunks whose content actually changed.
     """
-    print("\n🔧 Building vector database...")
+    meta = chunk['metadata']
+    digest = hashlib.sha1(
+        f"{meta['page']}:{meta['char_start']}:{chunk['text']}".encode('utf-8')
+    ).hexdigest()[:16]
+    return f"p{meta['page']}_{digest}"
+
+def estimated_tokens(text: str) -> int:
+    """Rough token count of a text (about 4 characters per token)"""
+    return max(len(text) // 4, 1)
+
+def encode_adaptive(embedding_model, texts: List[str]) -> List[List[float]]:
+    """
+    Encode texts in length-sorted batches sized to a padded-token budget
     
-    # Initialize embedding model
-    print(f"📥 Loading embedding model: sentence-transformers/all-MiniLM-L6-v2")
-    embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    print(f"✅ Model loaded (384 dimensions)")
+    Sorting by length keeps padding low, the batch size grows for short
+    chunks (at least ENCODE_BATCH_MIN, at most ENCODE_BATCH_MAX) while the
+    batch's padded cost fits ENCODE_BATCH_TOKENS, and a batch that runs out
+    of memory is retried at half size.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = [None] * len(texts)
+    
+    position = 0
+    with tqdm(total=len(texts), desc="Encoding") as bar:
+        while position < len(order):
+            # Texts are length-sorted, so each added text is the batch's longest:
+            # grow while batch size x its length stays within the token budget
+            batch_size = min(ENCODE_BATCH_MIN, len(order) - position)
+            while (batch_size < ENCODE_BATCH_MAX and position + batch_size < len(order)
+                   and (batch_size + 1) * estimated_tokens(texts[order[position + batch_size]]) <= ENCODE_BATCH_TOKENS):
+                batch_size += 1
+            while True:
+                batch = order[position:position + batch_size]
+                try:
+                    vectors = embedding_model.encode(
+                        [texts[i] for i in batch], batch_size=len(batch), show_progress_bar=False
+                    )
+                    break
+                except RuntimeError as e:
+                    if batch_size <= 1 or "out of memory" not in str(e).lower():
+                        raise
+                    batch_size //= 2
+                    print(f"⚠️  Out of memory, retrying with batch size {batch_size}")
+            
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector.tolist()
+            position += len(batch)
+            bar.update(len(batch))
+    
+    return embeddings
+
+def build_vector_database(chunks: List[Dict], persist_dir: str, collection_name: str,
+                          full_rebuild: bool = False) -> Tuple[object, Dict]:
+    """
+    Sync the ChromaDB collection with the chunks (incremental by default)
+    
+    Chunks are keyed by content-hashed ids: new ids are embedded and
+    upserted, ids no longer produced are deleted, the rest are untouched.
+    
+    Args:
+        chunks: Chunks from chunk_text
+        persist_dir: ChromaDB storage path
+        collection_name: Collection to sync
+        full_rebuild: Drop the collection and re-embed everything
+    
+    Returns:
+        Tuple of (collection, stats) with added/deleted/unchanged counts
+    """
+    print("\n🔧 Building vector database...")
     
     # Initialize ChromaDB
     persist_path = Path(persist_dir)
@@ -84,52 +162,63 @@ def build_vector_database(chunks: List[Dict], persist_dir: str, collection_name:
     print(f"\n💾 Initializing ChromaDB at {persist_path}")
     client = chromadb.PersistentClient(path=str(persist_path))
     
-    # Delete collection if it exists (fresh start)
-    try:
-        client.delete_collection(name=collection_name)
-        print(f"🗑️  Deleted existing collection: {collection_name}")
-    except:
-        pass
+    if full_rebuild:
+        try:
+            client.delete_collection(name=collection_name)
+            print(f"🗑️  Deleted existing collection: {collection_name}")
+        except Exception:
+            pass
     
-    # Create new collection
-    collection = client.create_collection(
+    collection = client.get_or_create_collection(
         name=collection_name,
         metadata={"description": "Hemoglobin pattern disease database"}
     )
-    print(f"✅ Created collection: {collection_name}")
+    print(f"✅ Using collection: {collection_name} ({collection.count()} vectors)")
     
-    # Process documents in batches
-    print(f"\n🔄 Generating embeddings and adding to database...")
-    print(f"   Processing {len(chunks)} chunks...")
+    # Diff wanted ids against what is stored
+    wanted = {}
+    for chunk in chunks:
+        wanted.setdefault(chunk_id(chunk), chunk)
+    existing = set(collection.get(include=[])['ids'])
     
-    batch_size = 50
-    for i in tqdm(range(0, len(chunks), batch_size), desc="Building DB"):
-        batch = chunks[i:i + batch_size]
-        
-        # Prepare batch data
-        texts = [chunk['text'] for chunk in batch]
-        metadatas = [chunk['metadata'] for chunk in batch]
-        ids = [f"doc_{i + j}" for j in range(len(batch))]
+    to_add = [chunk_key for chunk_key in wanted if chunk_key not in existing]
+    to_delete = sorted(existing - set(wanted))
+    stats = {
+        'added': len(to_add),
+        'deleted': len(to_delete),
+        'unchanged': len(wanted) - len(to_add)
+    }
+    print(f"   {stats['added']} new/changed, {stats['deleted']} stale, {stats['unchanged']} unchanged chunks")
+    
+    for i in range(0, len(to_delete), WRITE_BATCH_SIZE):
+        collection.delete(ids=to_delete[i:i + WRITE_BATCH_SIZE])
+    
+    if to_add:
+        # Initialize embedding model (only when something needs encoding)
+        print(f"📥 Loading embedding model: sentence-transformers/all-MiniLM-L6-v2")
+        embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        print(f"✅ Model loaded (384 dimensions)")
         
-        # Generate embeddings
-        embeddings = embedding_model.encode(texts, show_progress_bar=False)
-        embeddings_list = embeddings.tolist()
+        print(f"\n🔄 Generating embeddings for {len(to_add)} chunks...")
+        texts = [wanted[chunk_key]['text'] for chunk_key in to_add]
+        embeddings = encode_adaptive(embedding_model, texts)
         
-        # Add to collection
-        collection.add(
-            documents=texts,
-            embeddings=embeddings_list,
-            metadatas=metadatas,
-            ids=ids
-        )
+        for i in range(0, len(to_add), WRITE_BATCH_SIZE):
+            batch_ids = to_add[i:i + WRITE_BATCH_SIZE]
+            collection.upsert(
+                documents=texts[i:i + WRITE_BATCH_SIZE],
+                embeddings=embeddings[i:i + WRITE_BATCH_SIZE],
+                metadatas=[wanted[chunk_key]['metadata'] for chunk_key in batch_ids],
+                ids=batch_ids
+            )
     
-    print(f"\n✅ Successfully added {len(chunks)} documents to vector database")
+    print(f"\n✅ Vector database in sync with {len(wanted)} chunks")
     
     # Verify
     count = collection.count()
     print(f"📊 Database contains {count} vectors")
     
-    return collection
+    return collection, stats
 
 def test_database(persist_dir: str, collection_name: str):
     """Test the database with a sample query"""
@@ -193,12 +282,23 @@ def main():
         
         # Step 3: Build vector database
         print("\n--- Step 3: Building Vector Database ---")
-        collection = build_vector_database(chunks, str(persist_dir), collection_name)
+        collection, stats = build_vector_database(
+            chunks, str(persist_dir), collection_name, full_rebuild="--full" in sys.argv
+        )
         
         # Step 4: Test database
         print("\n--- Step 4: Testing Database ---")
         test_database(str(persist_dir), collection_name)
         
+        # Step 5: Snapshot the in-process hybrid (BM25 + dense) index used by RAG
+        print("\n--- Step 5: Snapshotting Hybrid Index ---")
+        from hybrid_index import HybridTextIndex, HYBRID_INDEX_FILE
+        if stats['added'] or stats['deleted'] or not HYBRID_INDEX_FILE.exists():
+            HybridTextIndex.from_collection(collection).save()
+            print(f"💾 Saved hybrid index to {HYBRID_INDEX_FILE}")
+        else:
+            print(f"✅ No changes - hybrid index at {HYBRID_INDEX_FILE} is current")
+        
         # Summary
         print("\n" + "=" * 70)
         print("📊 Vector Database Summary")
@@ -209,12 +309,12 @@ def main():
         print(f"✅ Embedding model: sentence-transformers/all-MiniLM-L6-v2")
         print(f"✅ Vector dimension: 384")
         print(f"✅ Source pages: {len(text_data)}")
-        print(f"✅ Text chunks: {len(chunks)}")
+        print(f"✅ Text chunks: {len(chunks)} ({stats['added']} added, {stats['deleted']} deleted)")
         
         print("\n✅ Vector database build complete!")
         print("\n🎉 Ready for RAG queries!")
         print("\nNext step: Update API to use vector database for search")
-        
+    
     except Exception as e:
         print(f"\n❌ Error building database: {e}")
         import traceback
@@ -0,0 +1,175 @@
+"""
+Chat Sessions
+Server-side conversation state for /api/chat: the last few turns are kept
+verbatim and older turns are folded into a cached summary in the background,
+so the prompt per turn stays roughly constant however long a session runs
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from openrouter_client import get_openrouter_client
+from rate_limiter import BACKGROUND
+
+# Messages (user + assistant) kept verbatim after the summary
+CHAT_SESSION_WINDOW = int(os.getenv("CHAT_SESSION_WINDOW", "6"))
+
+# Messages allowed past the window before older ones are summarized
+CHAT_SESSION_COMPACT_SLACK = int(os.getenv("CHAT_SESSION_COMPACT_SLACK", "4"))
+
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", str(2 * 3600)))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "meta-llama/llama-3.1-8b-instruct")
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a clinician and a hemoglobin pattern assistant.
+Merge the existing summary with the new turns into one concise summary (under 200 words).
+Keep patient values (HbA2, HbF, HbS, HbE percentages, retention times), cited page numbers,
+diagnoses discussed and open questions. Drop pleasantries. Reply with the summary only."""
+
+class ChatSession:
+    """One conversation: summary of older turns plus a verbatim window"""
+    
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.summary = ""
+        self.summarized_messages = 0
+        self.turns: List[Dict[str, str]] = []
+        self.updated_at = time.time()
+        self.compaction: Optional[asyncio.Task] = None
+    
+    def history(self) -> List[Dict[str, str]]:
+        """Summary (as a system message) followed by the verbatim turns"""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        messages.extend(dict(turn) for turn in self.turns)
+        return messages
+    
+    def record(self, user_message: str, answer: str):
+        """Append a completed user/assistant exchange"""
+        self.turns.append({"role": "user", "content": user_message})
+        self.turns.append({"role": "assistant", "content": answer})
+        self.updated_at = time.time()
+
+class ChatSessionStore:
+    """In-memory LRU of chat sessions with background summarization"""
+    
+    def __init__(self, client=None, window: int = CHAT_SESSION_WINDOW,
+                 slack: int = CHAT_SESSION_COMPACT_SLACK, ttl: float = CHAT_SESSION_TTL,
+                 max_sessions: int = CHAT_SESSION_MAX):
+        """
+        Initialize store
+        
+        Args:
+            client: OpenRouter client used for summaries (default: shared client)
+            window: Messages kept verbatim
+            slack: Extra messages tolerated before a compaction is started
+            ttl: Seconds an idle session is kept
+            max_sessions: Maximum sessions before LRU eviction
+        """
+        self.client = client or get_openrouter_client()
+        self.window = window
+        self.slack = slack
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions: OrderedDict = OrderedDict()
+        
+        self.compactions = 0
+        self.compaction_failures = 0
+    
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Return a live session, or None"""
+        self._expire()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+        return session
+    
+    def get_or_create(self, session_id: str) -> ChatSession:
+        """Return the session, creating it on first use"""
+        session = self.get(session_id)
+        if session is None:
+            session = ChatSession(session_id)
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return session
+    
+    def delete(self, session_id: str) -> bool:
+        """Forget a session"""
+        return self.sessions.pop(session_id, None) is not None
+    
+    def _expire(self):
+        """Drop sessions idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for session_id in [sid for sid, s in self.sessions.items() if s.updated_at < cutoff]:
+            del self.sessions[session_id]
+    
+    def record(self, session: ChatSession, user_message: str, answer: str):
+        """
+        Record an exchange and start a background compaction if the window overflowed
+        
+        Must be called from the event loop; the summary call runs on the
+        background rate-limit lane and never delays the user's answer.
+        """
+        session.record(user_message, answer)
+        
+        overflow = len(session.turns) - self.window
+        if overflow >= self.slack and (session.compaction is None or session.compaction.done()):
+            session.compaction = asyncio.create_task(self._compact(session, overflow))
+    
+    async def _compact(self, session: ChatSession, count: int):
+        """Fold the oldest count messages into the session summary"""
+        folded = session.turns[:count]
+        transcript = "\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in folded)
+        
+        try:
+            summary = await self.client.chat_completion(
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Existing summary:\n{session.summary or '(none)'}\n\nNew turns:\n{transcript}"}
+                ],
+                model=CHAT_SUMMARY_MODEL,
+                temperature=0.2,
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+                priority=BACKGROUND
+            )
+        except Exception as e:
+            # Keep the turns verbatim; the next exchange retries the compaction
+            self.compaction_failures += 1
+            print(f"⚠️ Session {session.session_id} summary failed: {e}")
+            return
+        
+        # Turns recorded while summarizing stay after the folded ones
+        session.summary = summary.strip()
+        del session.turns[:count]
+        session.summarized_messages += count
+        self.compactions += 1
+        print(f"🗜️  Session {session.session_id}: folded {count} messages into summary")
+    
+    def stats(self) -> Dict:
+        """Session counts and compaction counters"""
+        return {
+            "sessions": len(self.sessions),
+            "window": self.window,
+            "compactions": self.compactions,
+            "compaction_failures": self.compaction_failures
+        }
+
+
+# Singleton instance
+_session_store = None
+
+def get_session_store() -> ChatSessionStore:
+    """Get or create singleton chat session store"""
+    global _session_store
+    if _session_store is None:
+        _session_store = ChatSessionStore()
+    return _session_store
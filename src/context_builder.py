@@ -0,0 +1,214 @@
+"""
+Context Builder
+Turns retrieved text chunks into a compact, token-budgeted prompt context:
+overlapping chunks from the same page are merged, duplicates dropped,
+passages ordered by MMR and packed into a budget derived from the model
+"""
+
+import os
+from typing import Dict, List, Optional
+from hybrid_index import tokenize
+
+# Token budget for retrieved context (capped by the model's window below)
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+
+# MMR trade-off between relevance (1.0) and novelty (0.0)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+
+# Rough English/clinical text ratio; avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+# Passages are not shrunk below this many tokens when sharing the budget
+MIN_PASSAGE_TOKENS = 48
+
+# "[Source N - Page P, Relevance: 0.00]" header plus the "---" separator
+HEADER_TOKENS = 14
+
+# Context windows (tokens) of the models offered in the UI
+MODEL_CONTEXT_WINDOWS = {
+    "meta-llama/llama-3.1-8b-instruct": 131072,
+    "meta-llama/llama-3.1-70b-instruct": 131072,
+    "openai/gpt-4o": 128000,
+    "openai/gpt-4o-mini": 128000,
+    "anthropic/claude-3.5-sonnet": 200000,
+    "google/gemini-pro-1.5": 1000000,
+    "mistralai/mistral-7b-instruct": 32768
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+NO_CONTEXT = "No relevant information found in the database."
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def context_budget(model: Optional[str] = None) -> int:
+    """
+    Token budget for retrieved context
+    
+    Args:
+        model: OpenRouter model id (None for the default budget)
+    
+    Returns:
+        RAG_CONTEXT_TOKENS, capped at an eighth of the model's context window
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) if model else DEFAULT_CONTEXT_WINDOW
+    return min(RAG_CONTEXT_TOKENS, window // 8)
+
+def _join_overlapping(first: str, second: str, max_overlap: int = 400) -> str:
+    """Concatenate two chunk texts, dropping the text they share at the seam"""
+    if second in first:
+        return first
+    probe = second[:50]
+    if probe:
+        position = first.find(probe, max(0, len(first) - max_overlap))
+        if position >= 0 and second.startswith(first[position:]):
+            return first[:position] + second
+    return f"{first}\n{second}"
+
+def merge_chunks(documents: List[str], metadatas: List[Dict], similarities: List[float],
+                 max_gap: int = 0) -> List[Dict]:
+    """
+    Merge overlapping or adjacent chunks of the same page into passages
+    
+    Args:
+        documents: Retrieved chunk texts
+        metadatas: Chunk metadata (page, char_start, char_end)
+        similarities: Chunk similarity scores
+        max_gap: Characters allowed between chunks that still count as adjacent
+    
+    Returns:
+        List of passages {'text', 'page', 'similarity', 'metadata'}, best first
+    """
+    by_page: Dict = {}
+    for doc, meta, sim in zip(documents, metadatas, similarities):
+        by_page.setdefault(meta.get('page', 'Unknown'), []).append((doc, meta, sim))
+    
+    passages = []
+    for page, chunks in by_page.items():
+        chunks.sort(key=lambda chunk: chunk[1].get('char_start', 0))
+        current = None
+        for doc, meta, sim in chunks:
+            start = meta.get('char_start')
+            if (current is not None and start is not None and current['char_end'] is not None
+                    and start <= current['char_end'] + max_gap):
+                current['text'] = _join_overlapping(current['text'], doc)
+                current['char_end'] = max(current['char_end'], meta.get('char_end', start))
+                current['similarity'] = max(current['similarity'], sim)
+                continue
+            if current is not None:
+                passages.append(current)
+            current = {
+                'text': doc,
+                'page': page,
+                'similarity': sim,
+                'metadata': meta,
+                'char_end': meta.get('char_end')
+            }
+        passages.append(current)
+    
+    passages.sort(key=lambda passage: passage['similarity'], reverse=True)
+    return passages
+
+def dedupe_passages(passages: List[Dict]) -> List[Dict]:
+    """Drop passages whose text is contained in a better-ranked passage"""
+    kept = []
+    for passage in passages:
+        normalized = " ".join(passage['text'].split())
+        if any(normalized in other['normalized'] for other in kept):
+            continue
+        kept.append({**passage, 'normalized': normalized})
+    return kept
+
+def _jaccard(a: set, b: set) -> float:
+    """Jaccard similarity of two token sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def mmr_order(passages: List[Dict], mmr_lambda: float = RAG_MMR_LAMBDA) -> List[Dict]:
+    """
+    Order passages by maximal marginal relevance
+    
+    Relevance is the retrieval similarity; redundancy is the highest token
+    Jaccard overlap with any passage already selected.
+    """
+    remaining = [(passage, set(tokenize(passage['text']))) for passage in passages]
+    selected = []
+    while remaining:
+        best_index, best_score = 0, float('-inf')
+        for index, (passage, tokens) in enumerate(remaining):
+            redundancy = max((_jaccard(tokens, chosen) for _, chosen in selected), default=0.0)
+            score = mmr_lambda * passage['similarity'] - (1.0 - mmr_lambda) * redundancy
+            if score > best_score:
+                best_index, best_score = index, score
+        selected.append(remaining.pop(best_index))
+    return [passage for passage, _ in selected]
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut a text to a token budget at a word boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " …"
+
+def allocate_budget(sizes: List[int], budget: int) -> List[int]:
+    """
+    Share a token budget across passages (water-filling)
+    
+    Short passages keep their full size; the rest split what is left
+    equally, so every passage gets a slice instead of the tail being dropped.
+    Passages that cannot get MIN_PASSAGE_TOKENS are dropped from the end.
+    """
+    count = len(sizes)
+    while count and budget // count < min(MIN_PASSAGE_TOKENS, min(sizes[:count])):
+        count -= 1
+    
+    allocation = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(count), key=lambda i: sizes[i])
+    for position, index in enumerate(order):
+        share = remaining // (count - position)
+        allocation[index] = min(sizes[index], share)
+        remaining -= allocation[index]
+    return allocation
+
+def build_context(documents: List[str], metadatas: List[Dict], similarities: List[float],
+                  model: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict:
+    """
+    Build the prompt context from retrieved chunks
+    
+    Args:
+        documents: Retrieved chunk texts
+        metadatas: Chunk metadata
+        similarities: Chunk similarity scores
+        model: Chat model (sets the token budget)
+        max_tokens: Explicit token budget (overrides the model budget)
+    
+    Returns:
+        Dict with 'context' (formatted text), 'passages' (passages included,
+        in context order) and 'tokens' (estimated context tokens)
+    """
+    passages = mmr_order(dedupe_passages(merge_chunks(documents, metadatas, similarities)))
+    if not passages:
+        return {'context': NO_CONTEXT, 'passages': [], 'tokens': 0}
+    
+    budget = max_tokens if max_tokens is not None else context_budget(model)
+    overhead = HEADER_TOKENS * len(passages)
+    allocation = allocate_budget([estimate_tokens(p['text']) for p in passages], max(budget - overhead, 0))
+    
+    context_parts = []
+    included = []
+    for passage, tokens in zip(passages, allocation):
+        if tokens <= 0:
+            continue
+        header = f"[Source {len(included) + 1} - Page {passage['page']}, Relevance: {passage['similarity']:.2f}]"
+        context_parts.append(f"{header}\n{_truncate(passage['text'], tokens)}\n")
+        included.append(passage)
+    
+    if not context_parts:
+        return {'context': NO_CONTEXT, 'passages': [], 'tokens': 0}
+    
+    context = "\n---\n\n".join(context_parts)
+    return {'context': context, 'passages': included, 'tokens': estimate_tokens(context)}
@@ -0,0 +1,228 @@
+"""
+Hybrid Text Index
+In-process BM25 + dense (MiniLM) index over the hb_patterns text chunks,
+fused with reciprocal-rank fusion and loadable from one snapshot file
+
+Usage:
+    python src/hybrid_index.py build        # Snapshot the Chroma collection
+    python src/hybrid_index.py bench        # Compare against collection.query
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+HYBRID_INDEX_FILE = PROJECT_ROOT / "vector_db" / "hybrid_text_index.npz"
+
+# BM25 parameters (standard Okapi defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal-rank fusion constant
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "which", "with",
+    "show", "me", "cases", "case", "about", "tell", "does", "do", "how"
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens ("HbA2" -> "hba2", "Hb Q Thailand" -> hb, q, thailand)"""
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+class HybridTextIndex:
+    """NumPy dense matrix plus inverted-index BM25 over text chunks"""
+    
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings: np.ndarray):
+        """
+        Build the index in memory
+        
+        Args:
+            ids: Chunk ids (same as the Chroma collection)
+            documents: Chunk texts
+            metadatas: Chunk metadata dicts
+            embeddings: (N, dim) MiniLM embeddings
+        """
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        self.sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        
+        # Inverted index: term -> (doc indices, term frequencies)
+        doc_tokens = [tokenize(doc) for doc in self.documents]
+        self.doc_lengths = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(doc_tokens) else 0.0
+        
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_index, tokens in enumerate(doc_tokens):
+            for term, freq in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_index, freq))
+        
+        num_docs = len(doc_tokens)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        for term, entries in postings.items():
+            docs, freqs = zip(*entries)
+            self.postings[term] = (np.array(docs, dtype=np.int32), np.array(freqs, dtype=np.float32))
+            self.idf[term] = math.log(1.0 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def dense_scores(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Similarity 1 / (1 + L2 distance), matching the Chroma search path"""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        sq_dist = self.sq_norms + float(query @ query) - 2.0 * (self.embeddings @ query)
+        return 1.0 / (1.0 + np.sqrt(np.maximum(sq_dist, 0.0)))
+    
+    def bm25_scores(self, query: str) -> np.ndarray:
+        """Okapi BM25 score of every chunk for the query"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, freqs = self.postings[term]
+            scores[docs] += self.idf[term] * freqs * (BM25_K1 + 1.0) / (freqs + norm[docs])
+        return scores
+    
+    def search(self, query: str, query_embedding: np.ndarray, top_k: int = 5,
+               candidates: int = 50) -> List[Tuple[int, float, float, float]]:
+        """
+        Hybrid search fused with reciprocal-rank fusion
+        
+        Args:
+            query: Query text (for BM25)
+            query_embedding: Query MiniLM embedding (for dense)
+            top_k: Number of results
+            candidates: Depth of each ranking that takes part in fusion
+        
+        Returns:
+            List of (chunk index, fused score, dense similarity, bm25 score), best first
+        """
+        if not self.ids:
+            return []
+        
+        dense = self.dense_scores(query_embedding)
+        bm25 = self.bm25_scores(query)
+        depth = min(candidates, len(self.ids))
+        
+        fused: Dict[int, float] = {}
+        dense_top = np.argpartition(-dense, depth - 1)[:depth]
+        for rank, index in enumerate(dense_top[np.argsort(-dense[dense_top])], 1):
+            fused[int(index)] = fused.get(int(index), 0.0) + 1.0 / (RRF_K + rank)
+        
+        matched = np.flatnonzero(bm25 > 0)
+        if len(matched):
+            bm25_top = matched[np.argsort(-bm25[matched])][:depth]
+            for rank, index in enumerate(bm25_top, 1):
+                fused[int(index)] = fused.get(int(index), 0.0) + 1.0 / (RRF_K + rank)
+        
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(index, score, float(dense[index]), float(bm25[index])) for index, score in ranked]
+    
+    def save(self, path: Path = HYBRID_INDEX_FILE):
+        """Write the index to a single .npz snapshot"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            embeddings=self.embeddings,
+            records=np.array(json.dumps({
+                "ids": self.ids,
+                "documents": self.documents,
+                "metadatas": self.metadatas
+            }))
+        )
+    
+    @classmethod
+    def load(cls, path: Path = HYBRID_INDEX_FILE) -> Optional["HybridTextIndex"]:
+        """Load a snapshot (None if it does not exist)"""
+        if not Path(path).exists():
+            return None
+        with np.load(path) as snapshot:
+            records = json.loads(str(snapshot["records"]))
+            return cls(records["ids"], records["documents"], records["metadatas"], snapshot["embeddings"])
+    
+    @classmethod
+    def from_collection(cls, collection) -> "HybridTextIndex":
+        """Build from every chunk in a Chroma collection"""
+        data = collection.get(include=["documents", "metadatas", "embeddings"])
+        return cls(data["ids"], data["documents"], data["metadatas"], np.asarray(data["embeddings"]))
+
+def build_snapshot(persist_dir: str = None, collection_name: str = "hb_patterns",
+                   path: Path = HYBRID_INDEX_FILE) -> HybridTextIndex:
+    """Snapshot the Chroma text collection into the hybrid index file"""
+    import chromadb
+    
+    if persist_dir is None:
+        persist_dir = str(PROJECT_ROOT / "vector_db" / "chroma_storage")
+    
+    client = chromadb.PersistentClient(path=persist_dir)
+    index = HybridTextIndex.from_collection(client.get_collection(name=collection_name))
+    index.save(path)
+    print(f"💾 Saved hybrid index ({len(index)} chunks, {len(index.postings)} terms) to {path}")
+    return index
+
+def benchmark(queries: List[str], top_k: int = 5, repeats: int = 20):
+    """Compare hybrid search latency and hits with the Chroma query path"""
+    from rag_search import RAGSearchEngine
+    
+    engine = RAGSearchEngine()
+    index = HybridTextIndex.load() or HybridTextIndex.from_collection(engine.collection)
+    embeddings = engine.encode_queries(queries)
+    
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for embedding in embeddings:
+            engine.collection.query(query_embeddings=[embedding.tolist()], n_results=top_k)
+    chroma_ms = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+    
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query, embedding in zip(queries, embeddings):
+            index.search(query, embedding, top_k=top_k)
+    hybrid_ms = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+    
+    print("=" * 70)
+    print(f"📊 Chroma collection.query: {chroma_ms:.2f} ms/query")
+    print(f"📊 Hybrid BM25 + dense:     {hybrid_ms:.2f} ms/query ({chroma_ms / max(hybrid_ms, 1e-9):.0f}x)")
+    print("=" * 70)
+    
+    for query, embedding in zip(queries, embeddings):
+        chroma = engine.collection.query(query_embeddings=[embedding.tolist()], n_results=top_k)
+        chroma_pages = [meta.get("page") for meta in chroma["metadatas"][0]]
+        hybrid_pages = [index.metadatas[i].get("page") for i, _, _, _ in index.search(query, embedding, top_k=top_k)]
+        print(f"\n🔍 {query}")
+        print(f"   Chroma pages: {chroma_pages}")
+        print(f"   Hybrid pages: {hybrid_pages}")
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Hybrid BM25 + dense text index")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    
+    if args.command == "build":
+        build_snapshot()
+    else:
+        benchmark([
+            "What is HbE disease?",
+            "Hb Q Thailand",
+            "Constant Spring",
+            "Elevated HbA2 beta thalassemia trait",
+            "high HbF with no A2 peak"
+        ], top_k=args.top_k, repeats=args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Background Job Queue
+Runs long searches and ingestion off the request path on a bounded worker
+pool, with job state persisted in SQLite (no external broker needed)
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+# Handler signature: async handler(params, payload, progress) -> JSON-serializable result
+ProgressCallback = Callable[[str, float], None]
+JobHandler = Callable[[Dict, Optional[bytes], ProgressCallback], Awaitable[Any]]
+
+class JobManager:
+    """SQLite-backed job queue with an in-process asyncio worker pool"""
+    
+    def __init__(self, db_path: str = None, max_workers: int = 2, result_ttl: float = 3600.0):
+        """
+        Initialize job manager
+        
+        Args:
+            db_path: SQLite file for job state (default: data/jobs.db)
+            max_workers: Number of jobs allowed to run concurrently
+            result_ttl: Seconds finished jobs (and their results) are kept
+        """
+        if db_path is None:
+            project_root = Path(__file__).parent.parent
+            db_path = str(project_root / "data" / "jobs.db")
+        
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        
+        self.handlers: Dict[str, JobHandler] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.subscribers: Dict[str, List[asyncio.Queue]] = {}
+        
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                cache_key TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL DEFAULT 0,
+                params TEXT,
+                payload BLOB,
+                result TEXT,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL,
+                finished_at REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_cache_key ON jobs (cache_key)")
+        self.db.commit()
+    
+    def register(self, kind: str, handler: JobHandler, exclusive: bool = False):
+        """
+        Register the coroutine that runs jobs of a given kind
+        
+        Args:
+            kind: Job kind
+            handler: Coroutine function running one job
+            exclusive: Run jobs of this kind one at a time (later ones stay
+                queued until the running one finishes)
+        """
+        self.handlers[kind] = handler
+        if exclusive:
+            self.locks[kind] = asyncio.Lock()
+        else:
+            self.locks.pop(kind, None)
+    
+    async def start(self):
+        """Start the worker pool and re-queue jobs interrupted by a restart"""
+        self.queue = asyncio.Queue()
+        
+        # Jobs that were queued or running when the process stopped run again
+        rows = self.db.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (QUEUED, RUNNING)
+        ).fetchall()
+        for row in rows:
+            self._update(row["id"], status=QUEUED, stage="queued", progress=0.0)
+            self.queue.put_nowait(row["id"])
+        
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        print(f"✅ Job queue ready ({self.max_workers} workers, {len(rows)} jobs resumed)")
+    
+    async def stop(self):
+        """Stop the worker pool (running jobs resume on next start)"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def _cache_key(self, kind: str, params: Dict, payload: Optional[bytes]) -> str:
+        """Hash a submission so identical requests can share one job"""
+        digest = hashlib.sha256()
+        digest.update(kind.encode("utf-8"))
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        if payload is not None:
+            digest.update(payload)
+        return digest.hexdigest()
+    
+    def submit(self, kind: str, params: Dict = None, payload: bytes = None) -> Dict:
+        """
+        Submit a job (or reuse an identical unexpired one)
+        
+        Args:
+            kind: Registered job kind
+            params: JSON-serializable job parameters
+            payload: Optional binary input (e.g. uploaded file)
+        
+        Returns:
+            Job status dict
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self.queue is None:
+            raise RuntimeError("Job queue not started")
+        
+        params = params or {}
+        self.purge_expired()
+        
+        # Identical submissions share a queued, running or cached job
+        cache_key = self._cache_key(kind, params, payload)
+        row = self.db.execute(
+            "SELECT id FROM jobs WHERE cache_key = ? AND status != ? ORDER BY created_at DESC LIMIT 1",
+            (cache_key, FAILED)
+        ).fetchone()
+        if row is not None:
+            return self.get(row["id"])
+        
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self.db.execute(
+            """INSERT INTO jobs (id, kind, cache_key, status, stage, progress, params, payload, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (job_id, kind, cache_key, QUEUED, "queued", 0.0, json.dumps(params), payload, now, now)
+        )
+        self.db.commit()
+        self.queue.put_nowait(job_id)
+        
+        return self.get(job_id)
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get job status, progress and (when finished) result
+        
+        Args:
+            job_id: Job id
+        
+        Returns:
+            Job status dict, or None if unknown or expired
+        """
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        
+        if row["status"] in FINISHED_STATES and row["finished_at"] and time.time() - row["finished_at"] > self.result_ttl:
+            self._delete(job_id)
+            return None
+        
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "progress": row["progress"],
+            "params": json.loads(row["params"]) if row["params"] else {},
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "finished_at": row["finished_at"]
+        }
+    
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict]:
+        """
+        Stream status updates for a job until it finishes
+        
+        Args:
+            job_id: Job id
+        
+        Yields:
+            Job status dicts (the current state first, then each change)
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+        
+        # Register before yielding so no update is missed in between
+        updates: asyncio.Queue = asyncio.Queue()
+        self.subscribers.setdefault(job_id, []).append(updates)
+        try:
+            yield job
+            if job["status"] in FINISHED_STATES:
+                return
+            
+            while True:
+                job = await updates.get()
+                yield job
+                if job["status"] in FINISHED_STATES:
+                    return
+        finally:
+            listeners = self.subscribers.get(job_id, [])
+            if updates in listeners:
+                listeners.remove(updates)
+            if not listeners:
+                self.subscribers.pop(job_id, None)
+    
+    def purge_expired(self):
+        """Delete finished jobs older than the result TTL"""
+        cutoff = time.time() - self.result_ttl
+        self.db.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (SUCCEEDED, FAILED, cutoff)
+        )
+        self.db.commit()
+    
+    def _delete(self, job_id: str):
+        self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        self.db.commit()
+    
+    def _update(self, job_id: str, **fields):
+        """Persist job fields and notify subscribers"""
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        self.db.commit()
+        
+        if job_id in self.subscribers:
+            job = self.get(job_id)
+            for updates in self.subscribers[job_id]:
+                updates.put_nowait(job)
+    
+    async def _run_job(self, job_id: str):
+        """Run one job and record its outcome"""
+        row = self.db.execute("SELECT kind, params, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        
+        handler = self.handlers.get(row["kind"])
+        if handler is None:
+            self._update(job_id, status=FAILED, error=f"Unknown job kind: {row['kind']}", finished_at=time.time())
+            return
+        
+        lock = self.locks.get(row["kind"])
+        if lock is None:
+            await self._execute(job_id, row, handler)
+            return
+        
+        if lock.locked():
+            self._update(job_id, stage="waiting")
+        async with lock:
+            await self._execute(job_id, row, handler)
+    
+    async def _execute(self, job_id: str, row: sqlite3.Row, handler: JobHandler):
+        """Call the handler and persist the result or error"""
+        self._update(job_id, status=RUNNING, stage="running", progress=0.0)
+        
+        def progress(stage: str, fraction: float):
+            self._update(job_id, stage=stage, progress=min(max(fraction, 0.0), 1.0))
+        
+        try:
+            params = json.loads(row["params"]) if row["params"] else {}
+            result = await handler(params, row["payload"], progress)
+            self._update(
+                job_id,
+                status=SUCCEEDED,
+                stage="done",
+                progress=1.0,
+                result=json.dumps(result),
+                payload=None,  # Inputs are not needed once the job is done
+                finished_at=time.time()
+            )
+        except Exception as e:
+            print(f"⚠️ Job {job_id} ({row['kind']}) failed: {e}")
+            self._update(job_id, status=FAILED, stage="failed", error=str(e), payload=None, finished_at=time.time())
+    
+    async def _worker(self):
+        """Worker loop: take job ids off the queue and run them"""
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run_job(job_id)
+            finally:
+                self.queue.task_done()
+
+
+# Singleton instance
+_job_manager = None
+
+def get_job_manager() -> JobManager:
+    """Get or create singleton job manager instance"""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager()
+    return _job_manager
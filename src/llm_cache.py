@@ -0,0 +1,150 @@
+"""
+LLM Response Cache
+Disk-backed (SQLite) cache of OpenRouter completions, keyed by a canonical
+hash of the request, with LRU size caps and a TTL
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0") == "1"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+def make_cache_key(model: str, messages: List[Dict], temperature: Optional[float], max_tokens: Optional[int]) -> str:
+    """
+    Canonical hash of a completion request
+    
+    Dict keys are sorted and separators fixed, so logically identical requests
+    (including identical image data URLs) hash to the same key.
+    """
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    SQLite LRU + TTL cache for completion text
+    
+    Methods block on SQLite (thread-safe behind one lock), so coroutines call
+    them through asyncio.to_thread rather than on the event loop.
+    """
+    
+    def __init__(self, db_path: str = None, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: float = LLM_CACHE_TTL):
+        """
+        Initialize cache
+        
+        Args:
+            db_path: SQLite file (default: data/llm_cache.db)
+            max_entries: Maximum cached responses before LRU eviction
+            max_bytes: Maximum total response size before LRU eviction
+            ttl: Seconds a response stays valid
+        """
+        if db_path is None:
+            project_root = Path(__file__).parent.parent
+            db_path = str(project_root / "data" / "llm_cache.db")
+        
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self.db.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response (and mark it recently used), or None"""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.db.commit()
+                self.misses += 1
+                return None
+            
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+            return row[0]
+    
+    def put(self, key: str, model: str, response: str):
+        """Store a response and evict least recently used entries over the caps"""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.db.execute(
+                """INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, model, response, size, now, now)
+            )
+            self._evict(now)
+            self.db.commit()
+    
+    def _evict(self, now: float):
+        """Drop expired entries, then LRU entries until under both caps"""
+        self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", stale)
+    
+    def clear(self):
+        """Remove every cached response"""
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self.lock:
+            count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,91 @@
+"""
+LLM Image Payloads
+Encodes chromatograph crops into compact data URLs for vision-model screening,
+and parses the model's batched screening replies
+"""
+
+import base64
+import io
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+from PIL import Image
+
+# Longest side sent to the vision model. GPT-4o tiles images in 512px squares
+# after fitting the short side to 768px, so full-resolution crops only add
+# upload bytes and tiles, not detail the model uses.
+LLM_IMAGE_MAX_SIDE = int(os.getenv("LLM_IMAGE_MAX_SIDE", "1024"))
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "85"))
+LLM_IMAGE_GRAYSCALE = os.getenv("LLM_IMAGE_GRAYSCALE", "1") == "1"
+
+# Candidate payloads precomputed at ingestion (src/7_build_llm_payloads.py)
+LLM_PAYLOADS_FILE = Path(__file__).parent.parent / "data" / "llm_payloads.json"
+
+def encode_image_for_llm(
+    image: Image.Image,
+    max_side: int = LLM_IMAGE_MAX_SIDE,
+    quality: int = LLM_IMAGE_QUALITY,
+    grayscale: bool = LLM_IMAGE_GRAYSCALE
+) -> str:
+    """
+    Downscale and JPEG-encode an image as a base64 data URL
+    
+    Args:
+        image: PIL Image
+        max_side: Longest side in pixels after downscaling
+        quality: JPEG quality (1-95)
+        grayscale: Drop color (chromatograph traces don't need it)
+    
+    Returns:
+        data:image/jpeg;base64,... URL
+    """
+    image = image.convert('L' if grayscale else 'RGB')
+    
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    return f"data:image/jpeg;base64,{img_base64}"
+
+def load_llm_payloads(path: Path = LLM_PAYLOADS_FILE) -> Dict[str, str]:
+    """
+    Load precomputed candidate payloads
+    
+    Returns:
+        Dict of image_file (collection id) -> data URL (empty if not built)
+    """
+    if not Path(path).exists():
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# One "N: YES/NO" answer, tolerating "CANDIDATE 3: **YES**", "**Candidate 3**: Yes", "3) no"
+BATCH_VERDICT = re.compile(r"(?:candidate\s*#?\s*)?(\d+)\s*\**\s*[:.)\-]\s*\**\s*(yes|no)\b", re.IGNORECASE)
+
+def parse_batch_verdicts(reply: str, num_candidates: int) -> Optional[List[bool]]:
+    """
+    Parse a batched screening reply
+    
+    Args:
+        reply: LLM reply with one "N: YES/NO" line per candidate
+        num_candidates: Candidates in the request
+    
+    Returns:
+        One verdict per candidate (True for YES), or None unless every
+        candidate 1..num_candidates is answered, without contradictions
+    """
+    answers = {}
+    for number, verdict in BATCH_VERDICT.findall(reply):
+        number = int(number)
+        is_similar = verdict.upper() == "YES"
+        if answers.get(number, is_similar) != is_similar:
+            return None
+        answers[number] = is_similar
+    
+    if sorted(answers) != list(range(1, num_candidates + 1)):
+        return None
+    return [answers[i] for i in range(1, num_candidates + 1)]
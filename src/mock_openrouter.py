@@ -0,0 +1,280 @@
+"""
+Mock OpenRouter Server
+Local stand-in for the OpenRouter /chat/completions API, for offline
+benchmarking and load testing of OpenRouterClient and LLM screening
+
+Usage:
+    python src/mock_openrouter.py --port 8900 --latency-median-ms 800 --error-rate 0.02
+    OPENROUTER_BASE_URL=http://localhost:8900/api/v1 OPENROUTER_API_KEY=mock python src/api.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+@dataclass
+class MockSettings:
+    """Behaviour of the mock server (all rates are probabilities 0-1)"""
+    latency_median_ms: float = 800.0   # Median full-response latency
+    latency_sigma: float = 0.5         # Log-normal spread (0 = constant latency)
+    vision_latency_factor: float = 2.0 # Latency multiplier for vision requests
+    error_rate: float = 0.0            # Random 500 responses
+    rate_limit_rate: float = 0.0       # Random 429 responses
+    rate_limit_rps: float = 0.0        # Sustained requests/second before 429 (0 = off)
+    retry_after_s: float = 1.0         # Retry-After header on 429
+    yes_rate: float = 0.7              # Probability a screening verdict is YES
+    stream_chunk_ms: float = 20.0      # Delay between streamed chunks
+    stream_keepalives: int = 0         # ": OPENROUTER PROCESSING" comments before the first token
+    stream_error_after: int = -1       # Send an in-stream error chunk after this many tokens (-1 = never)
+    seed: Optional[int] = None         # Seed for reproducible runs
+
+settings = MockSettings()
+stats: Dict[str, int] = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streamed": 0, "images": 0}
+
+_rng = random.Random()
+_bucket = {"tokens": 0.0, "updated": time.monotonic()}
+
+app = FastAPI(title="Mock OpenRouter", description="Offline stand-in for the OpenRouter API")
+
+def configure(**overrides):
+    """Update mock settings (and reseed) - used by the CLI and by tests"""
+    global settings
+    settings = MockSettings(**{**settings.__dict__, **overrides})
+    _rng.seed(settings.seed)
+    _bucket["tokens"] = settings.rate_limit_rps
+    _bucket["updated"] = time.monotonic()
+    for key in stats:
+        stats[key] = 0
+
+def _count_images(messages: List[Dict]) -> int:
+    """Count image parts across all messages"""
+    count = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            count += sum(1 for part in content if part.get("type") == "image_url")
+    return count
+
+def _prompt_text(messages: List[Dict]) -> str:
+    """Concatenate all text parts of the conversation"""
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(texts)
+
+def _canned_reply(messages: List[Dict]) -> str:
+    """Produce a plausible reply for the request type"""
+    prompt = _prompt_text(messages)
+    num_images = _count_images(messages)
+    
+    # Batched screening: one "N: YES/NO" line per candidate
+    batch = re.search(r"Answer with exactly (\d+) lines", prompt)
+    if batch:
+        return "\n".join(
+            f"{i}: {'YES' if _rng.random() < settings.yes_rate else 'NO'}"
+            for i in range(1, int(batch.group(1)) + 1)
+        )
+    
+    # Pairwise screening: single YES/NO
+    if "YES or NO" in prompt and num_images >= 2:
+        return "YES" if _rng.random() < settings.yes_rate else "NO"
+    
+    # Image analysis
+    if num_images:
+        return ("Mock analysis: the chromatograph shows a dominant A0 peak with a small A2 peak "
+                "and no significant F peak. Pattern is consistent with a normal adult profile; "
+                "HbE and beta thalassemia trait should be excluded with confirmatory testing.")
+    
+    # Plain chat
+    last_user = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+    if not isinstance(last_user, str):
+        last_user = _prompt_text([{"content": last_user}])
+    return f"Mock answer to: {last_user[:200]}"
+
+def _latency_seconds(num_images: int) -> float:
+    """Draw a response latency from the configured log-normal distribution"""
+    median = settings.latency_median_ms / 1000.0
+    if num_images:
+        # Vision requests are slower, growing sub-linearly with image count
+        median *= settings.vision_latency_factor * min(num_images, 8) ** 0.5
+    if settings.latency_sigma <= 0:
+        return median
+    return _rng.lognormvariate(0.0, settings.latency_sigma) * median
+
+def _take_rate_limit_token() -> bool:
+    """Token bucket for the sustained rate limit; False means reject with 429"""
+    if settings.rate_limit_rps <= 0:
+        return True
+    now = time.monotonic()
+    _bucket["tokens"] = min(
+        settings.rate_limit_rps,
+        _bucket["tokens"] + (now - _bucket["updated"]) * settings.rate_limit_rps
+    )
+    _bucket["updated"] = now
+    if _bucket["tokens"] >= 1.0:
+        _bucket["tokens"] -= 1.0
+        return True
+    return False
+
+def _usage(messages: List[Dict], reply: str) -> Dict[str, int]:
+    """Rough token usage (4 characters per token, 85 per image)"""
+    prompt_tokens = len(_prompt_text(messages)) // 4 + 85 * _count_images(messages)
+    completion_tokens = max(1, len(reply) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+@app.post("/chat/completions")
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI/OpenRouter-compatible chat completions (text, vision, streaming)"""
+    payload = await request.json()
+    messages = payload.get("messages", [])
+    model = payload.get("model", "mock/model")
+    num_images = _count_images(messages)
+    
+    stats["requests"] += 1
+    stats["images"] += num_images
+    
+    if not _take_rate_limit_token() or _rng.random() < settings.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(settings.retry_after_s)},
+            content={"error": {"code": 429, "message": "Rate limit exceeded (mock)"}}
+        )
+    
+    latency = _latency_seconds(num_images)
+    fail = _rng.random() < settings.error_rate
+    reply = _canned_reply(messages)
+    completion_id = f"gen-mock-{uuid.uuid4().hex[:12]}"
+    
+    if fail:
+        await asyncio.sleep(latency)
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"code": 500, "message": "Upstream provider error (mock)"}}
+        )
+    
+    if payload.get("stream"):
+        stats["streamed"] += 1
+        words = re.findall(r"\S+\s*", reply) or [reply]
+        
+        async def event_stream():
+            # Time to first token is a fraction of the full latency
+            for _ in range(settings.stream_keepalives):
+                yield ": OPENROUTER PROCESSING\n\n"
+            await asyncio.sleep(latency * 0.3)
+            for i, word in enumerate(words):
+                if i == settings.stream_error_after:
+                    # Upstream failure after the 200 status has been sent
+                    stats["errors"] += 1
+                    error = {"error": {"code": 502, "message": "Provider disconnected (mock)"}}
+                    yield f"data: {json.dumps(error)}\n\n"
+                    return
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(settings.stream_chunk_ms / 1000.0)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+            stats["ok"] += 1
+        
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+    
+    await asyncio.sleep(latency)
+    stats["ok"] += 1
+    
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop"
+        }],
+        "usage": _usage(messages, reply)
+    }
+
+@app.get("/mock/stats")
+async def get_stats():
+    """Request counters since the last configure()"""
+    return {**stats, "settings": settings.__dict__}
+
+@app.post("/mock/configure")
+async def post_configure(request: Request):
+    """Change mock behaviour at runtime (JSON body of MockSettings fields)"""
+    configure(**(await request.json()))
+    return {"settings": settings.__dict__}
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Mock OpenRouter server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-median-ms", type=float, default=MockSettings.latency_median_ms)
+    parser.add_argument("--latency-sigma", type=float, default=MockSettings.latency_sigma)
+    parser.add_argument("--vision-latency-factor", type=float, default=MockSettings.vision_latency_factor)
+    parser.add_argument("--error-rate", type=float, default=MockSettings.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=MockSettings.rate_limit_rate)
+    parser.add_argument("--rate-limit-rps", type=float, default=MockSettings.rate_limit_rps)
+    parser.add_argument("--retry-after", type=float, default=MockSettings.retry_after_s)
+    parser.add_argument("--yes-rate", type=float, default=MockSettings.yes_rate)
+    parser.add_argument("--stream-chunk-ms", type=float, default=MockSettings.stream_chunk_ms)
+    parser.add_argument("--stream-keepalives", type=int, default=MockSettings.stream_keepalives)
+    parser.add_argument("--stream-error-after", type=int, default=MockSettings.stream_error_after)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    
+    configure(
+        latency_median_ms=args.latency_median_ms,
+        latency_sigma=args.latency_sigma,
+        vision_latency_factor=args.vision_latency_factor,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rate_limit_rps=args.rate_limit_rps,
+        retry_after_s=args.retry_after,
+        yes_rate=args.yes_rate,
+        stream_chunk_ms=args.stream_chunk_ms,
+        stream_keepalives=args.stream_keepalives,
+        stream_error_after=args.stream_error_after,
+        seed=args.seed
+    )
+    
+    import uvicorn
+    
+    print(f"🧪 Mock OpenRouter listening on http://{args.host}:{args.port}/api/v1")
+    print(f"   Point the client at it with OPENROUTER_BASE_URL=http://{args.host}:{args.port}/api/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Numeric Index
+Columnar index of reported hemoglobin fractions (HbA2, HbF, HbS, HbE, HbA)
+parsed from the case tables, reference report text and peak-analysis OCR,
+for range and compound queries like "HbA2 between 4 and 8%"
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+NUMERIC_INDEX_FILE = PROJECT_ROOT / "data" / "numeric_index.npz"
+
+ANALYTES = ("hba2", "hbf", "hbs", "hbe", "hba")
+ANALYTE_LABELS = {"hba2": "HbA2", "hbf": "HbF", "hbs": "HbS", "hbe": "HbE", "hba": "HbA"}
+
+# Labeled values in report remarks, e.g. "VII : F:90.0/90.0, A2:2.0/2.0",
+# "CE: HbA:97.7 HbA2:2.3", "HbE zone:25.1", "S-window (0.8%)"
+NUMBER = r"(\d{1,3}(?:\.\d+)?)"
+LABELED_PATTERNS = {
+    "hba2": [rf"\b(?:Hb\s*)?A2\s*(?:\(%\)|concentration)?\s*[:=]\s*{NUMBER}"],
+    "hbf": [rf"\bHb\s*F\s*(?:concentration)?\s*[:=]?\s*{NUMBER}", rf"\bF\s*(?:concentration)?\s*[:=]\s*{NUMBER}"],
+    "hbs": [rf"\bHb\s*S\s*[:=]\s*{NUMBER}", rf"\bS[\s-]*window\s*\(?\s*{NUMBER}\s*%"],
+    "hbe": [rf"\bHb\s*E\s*(?:zone)?\s*[:=]\s*{NUMBER}", rf"\bE\s*zone\s*[:=]?\s*{NUMBER}"],
+    "hba": [rf"\bHb\s*A\s*[:=]\s*{NUMBER}", rf"(?<![\w.])A\s*:\s*{NUMBER}"]
+}
+
+ROW_START = re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4}\s*$", re.MULTILINE)
+DECIMAL_LINE = re.compile(r"^\s*(\d{1,2}\.\d+)\s*$")
+
+def parse_labeled_values(text: str) -> Dict[str, float]:
+    """Extract labeled analyte percentages from free text (first match wins)"""
+    values = {}
+    for analyte, patterns in LABELED_PATTERNS.items():
+        for pattern in patterns:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                value = float(match.group(1))
+                if 0.0 <= value <= 100.0:
+                    values[analyte] = value
+                    break
+    return values
+
+def parse_case_table(text: str) -> List[Dict]:
+    """
+    Split a case-table page into rows and read each row's fractions
+    
+    Each row starts with a date line. The first two decimal cells are the
+    VII (HPLC) HbA2 and HbF columns; labeled values in the remarks override them.
+    
+    Returns:
+        List of {'text', 'values'} per row
+    """
+    starts = [match.start() for match in ROW_START.finditer(text)]
+    rows = []
+    for i, start in enumerate(starts):
+        block = text[start:starts[i + 1] if i + 1 < len(starts) else len(text)]
+        
+        decimals = [float(m.group(1)) for m in map(DECIMAL_LINE.match, block.splitlines()) if m]
+        values = {}
+        if len(decimals) >= 1:
+            values["hba2"] = decimals[0]
+        if len(decimals) >= 2:
+            values["hbf"] = decimals[1]
+        values.update(parse_labeled_values(block))
+        
+        if values:
+            rows.append({"text": " ".join(block.split()), "values": values})
+    return rows
+
+class NumericIndex:
+    """Column arrays (NaN = not reported) with vectorized range filters"""
+    
+    def __init__(self, records: List[Dict]):
+        """
+        Build the index
+        
+        Args:
+            records: Dicts with 'id', 'source', 'page', 'image_id', 'category',
+                'text' and any of the ANALYTES as floats
+        """
+        self.ids = np.array([r["id"] for r in records], dtype=str)
+        self.sources = np.array([r.get("source", "") for r in records], dtype=str)
+        self.pages = np.array([r.get("page") or 0 for r in records], dtype=np.int32)
+        self.image_ids = np.array([r.get("image_id", "") for r in records], dtype=str)
+        self.categories = np.array([r.get("category", "") for r in records], dtype=str)
+        self.texts = np.array([r.get("text", "")[:400] for r in records], dtype=str)
+        self.columns = {
+            analyte: np.array(
+                [r[analyte] if r.get(analyte) is not None else np.nan for r in records],
+                dtype=np.float32
+            )
+            for analyte in ANALYTES
+        }
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def mask(self, ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+             sources: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Boolean mask of records satisfying every range (inclusive bounds)
+        
+        Args:
+            ranges: analyte -> (low, high); None leaves that side open
+            sources: Restrict to these record sources
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for analyte, (low, high) in ranges.items():
+            column = self.columns[analyte]
+            mask &= ~np.isnan(column)  # Unreported values never match
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        if sources:
+            mask &= np.isin(self.sources, sources)
+        return mask
+    
+    def query(self, ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+              sources: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Records matching every range, in page order
+        
+        Returns:
+            List of record dicts (analytes not reported are omitted)
+        """
+        indices = np.flatnonzero(self.mask(ranges, sources))
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.record(i) for i in indices]
+    
+    def record(self, i: int) -> Dict:
+        """Record dict for row i"""
+        record = {
+            "id": str(self.ids[i]),
+            "source": str(self.sources[i]),
+            "page": int(self.pages[i]),
+            "image_id": str(self.image_ids[i]),
+            "category": str(self.categories[i]),
+            "text": str(self.texts[i])
+        }
+        for analyte in ANALYTES:
+            value = self.columns[analyte][i]
+            if not np.isnan(value):
+                record[analyte] = round(float(value), 2)
+        return record
+    
+    def image_ids_matching(self, ranges: Dict[str, Tuple[Optional[float], Optional[float]]]) -> Set[str]:
+        """Image ids (visual search collection ids) with at least one matching record"""
+        ids = self.image_ids[self.mask(ranges)]
+        return {str(image_id) for image_id in ids if image_id}
+    
+    def save(self, path: Path = NUMERIC_INDEX_FILE):
+        """Write the index to a single .npz file"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            ids=self.ids,
+            sources=self.sources,
+            pages=self.pages,
+            image_ids=self.image_ids,
+            categories=self.categories,
+            texts=self.texts,
+            **{f"col_{analyte}": column for analyte, column in self.columns.items()}
+        )
+    
+    @classmethod
+    def load(cls, path: Path = NUMERIC_INDEX_FILE) -> Optional["NumericIndex"]:
+        """Load a saved index (None if it has not been built)"""
+        if not Path(path).exists():
+            return None
+        index = cls([])
+        with np.load(path) as data:
+            index.ids = data["ids"]
+            index.sources = data["sources"]
+            index.pages = data["pages"]
+            index.image_ids = data["image_ids"]
+            index.categories = data["categories"]
+            index.texts = data["texts"]
+            index.columns = {analyte: data[f"col_{analyte}"] for analyte in ANALYTES}
+        return index
+
+# Natural-language range queries
+ANALYTE_QUERY = r"(?P<analyte>hb\s*a2|a2|hb\s*f|fetal\s+h(?:a)?emoglobin|hb\s*s|hb\s*e|hb\s*a)\b\s*(?:level|value|concentration|fraction|%)?\s*(?:of|is|=)?\s*"
+# A number is a percentage if it has a % or nothing unit-like follows it
+# ("HbF 5-10 cells" is a cell count, not a range)
+PERCENT_END = r"(?:\s*%|(?=\s*(?:$|[,;:?!)]|\.(?!\d)|(?:and|or|with|in|but)\b)))"
+ABOVE_WORDS = r"(?:above|over|more|higher|greater)"
+BELOW_WORDS = r"(?:below|under|less|lower)"
+RANGE_PATTERNS = [
+    (re.compile(ANALYTE_QUERY + rf"(?:between|from)\s+{NUMBER}\s*%?\s*(?:and|to|-)\s*{NUMBER}{PERCENT_END}", re.IGNORECASE), "between"),
+    (re.compile(ANALYTE_QUERY + rf"{NUMBER}\s*%?\s*(?:-|to)\s*{NUMBER}{PERCENT_END}", re.IGNORECASE), "between"),
+    # Single values need a comparator, before ("above 5") or after ("5% and above", "5+")
+    (re.compile(ANALYTE_QUERY + rf"(?:>=?|above|over|greater\s+than|more\s+than|higher\s+than|at\s+least|exceeding)\s*{NUMBER}", re.IGNORECASE), "above"),
+    (re.compile(ANALYTE_QUERY + rf"(?:<=?|below|under|less\s+than|lower\s+than|at\s+most)\s*{NUMBER}", re.IGNORECASE), "below"),
+    (re.compile(ANALYTE_QUERY + rf"{NUMBER}\s*%?\s*(?:\+|(?:and|or)\s+{ABOVE_WORDS}\b)", re.IGNORECASE), "above"),
+    (re.compile(ANALYTE_QUERY + rf"{NUMBER}\s*%?\s*(?:and|or)\s+{BELOW_WORDS}\b", re.IGNORECASE), "below")
+]
+
+def _analyte_key(name: str) -> str:
+    name = re.sub(r"\s+", "", name.lower())
+    if name in ("a2", "hba2"):
+        return "hba2"
+    if name.startswith("fetal") or name == "hbf":
+        return "hbf"
+    return {"hbs": "hbs", "hbe": "hbe", "hba": "hba"}[name]
+
+def parse_range_query(text: str) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """
+    Parse numeric constraints from a question
+    
+    "HbA2 between 4 and 8% and HbF < 2" -> {'hba2': (4.0, 8.0), 'hbf': (None, 2.0)}
+    "hba2 4-8", "HbA 95 and above" -> {'hba2': (4.0, 8.0)}, {'hba': (95.0, None)}
+    
+    A bare single value ("HbF 5 cells") is not a constraint.
+    """
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+    for pattern, kind in RANGE_PATTERNS:
+        for match in pattern.finditer(text):
+            analyte = _analyte_key(match.group("analyte"))
+            low, high = ranges.get(analyte, (None, None))
+            numbers = [float(n) for n in match.groups()[1:] if n is not None]
+            if kind == "between":
+                low, high = min(numbers), max(numbers)
+            elif kind == "above":
+                low = numbers[0]
+            else:
+                high = numbers[0]
+            ranges[analyte] = (low, high)
+    return ranges
+
+def describe_ranges(ranges: Dict[str, Tuple[Optional[float], Optional[float]]]) -> str:
+    """Human-readable form of parsed ranges"""
+    parts = []
+    for analyte, (low, high) in ranges.items():
+        label = ANALYTE_LABELS[analyte]
+        if low is not None and high is not None:
+            parts.append(f"{label} {low:g}-{high:g}%")
+        elif low is not None:
+            parts.append(f"{label} ≥ {low:g}%")
+        else:
+            parts.append(f"{label} ≤ {high:g}%")
+    return ", ".join(parts)
+
+def format_matches(ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+                   matches: List[Dict], limit: int = 15) -> str:
+    """Format matching records as a context block for the chat prompt"""
+    lines = [f"[Structured search - {len(matches)} cases with {describe_ranges(ranges)}]"]
+    for match in matches[:limit]:
+        values = ", ".join(f"{ANALYTE_LABELS[a]} {match[a]:g}%" for a in ANALYTES if a in match)
+        location = f"Page {match['page']}" if match["source"] == "main_text" else match["image_id"]
+        lines.append(f"- {location}: {values} | {match['text'][:160]}")
+    if len(matches) > limit:
+        lines.append(f"... and {len(matches) - limit} more")
+    return "\n".join(lines)
+
+def build_records(pdf_text: Dict, reference_texts: Dict[str, Dict], peak_features: Dict) -> List[Dict]:
+    """
+    Collect index records from every source
+    
+    Args:
+        pdf_text: data/pdf_text.json ("page_N" -> {'page', 'text'})
+        reference_texts: reference image id -> {'text', 'category', 'page'}
+        peak_features: data/peak_features.json (image id -> PeakAnalyzer features)
+    
+    Returns:
+        List of record dicts for NumericIndex
+    """
+    records = []
+    
+    # Main case tables: one record per row, linked to the page's cropped image
+    pages = pdf_text.values() if isinstance(pdf_text, dict) else pdf_text
+    for page_data in pages:
+        page = page_data["page"]
+        for row_index, row in enumerate(parse_case_table(page_data["text"])):
+            records.append({
+                "id": f"page_{page}_row_{row_index}",
+                "source": "main_text",
+                "page": page,
+                "image_id": f"main_cropped_page_{page}_full.png",
+                "text": row["text"],
+                **row["values"]
+            })
+    
+    # Reference report text layers: one record per report page
+    for image_id, info in reference_texts.items():
+        values = parse_labeled_values(info["text"])
+        if values:
+            records.append({
+                "id": f"{image_id}#text",
+                "source": "reference_text",
+                "page": info.get("page"),
+                "image_id": image_id,
+                "category": info.get("category", ""),
+                "text": " ".join(info["text"].split()),
+                **values
+            })
+    
+    # OCR of the printed concentrations on each cropped chromatograph
+    for image_id, features in peak_features.items():
+        a2 = features.get("a2_concentration")
+        f = features.get("f_concentration")
+        if a2 is None and f is None:
+            continue
+        page_match = re.search(r"page_(\d+)_", image_id)
+        records.append({
+            "id": f"{image_id}#ocr",
+            "source": "ocr",
+            "page": int(page_match.group(1)) if page_match else None,
+            "image_id": image_id,
+            "hba2": a2 if a2 is not None and 0 <= a2 <= 100 else None,
+            "hbf": f if f is not None and 0 <= f <= 100 else None
+        })
+    
+    return records
+
+def load_json(path: Path) -> Dict:
+    """Load a JSON file (empty dict if missing)"""
+    if not Path(path).exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Singleton instance
+_numeric_index = None
+_numeric_index_loaded = False
+
+def get_numeric_index() -> Optional[NumericIndex]:
+    """Get the numeric index (None if data/numeric_index.npz has not been built)"""
+    global _numeric_index, _numeric_index_loaded
+    if not _numeric_index_loaded:
+        _numeric_index = NumericIndex.load()
+        _numeric_index_loaded = True
+    return _numeric_index
@@ -3,13 +3,104 @@ OpenRouter API Client
 Handles communication with OpenRouter for LLM and Vision capabilities
 """
 
+import asyncio
+import json
 import os
+import random
+import time
+from collections import deque
+from typing import List, Dict, Optional, Any, AsyncIterator
 import httpx
-from typing import List, Dict, Optional
 from dotenv import load_dotenv
+from rate_limiter import get_governor, get_governor_stats, INTERACTIVE
+from llm_cache import ResponseCache, make_cache_key, LLM_CACHE_ENABLED
 
 load_dotenv()
 
+# Retry policy: jittered exponential backoff on 429 and 5xx responses
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+OPENROUTER_BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", "0.5"))
+OPENROUTER_BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", "8.0"))
+
+# Hedging: send a duplicate request once the first one is slower than this
+# percentile of the model's recent latencies (0 disables hedging)
+OPENROUTER_HEDGE_PERCENTILE = float(os.getenv("OPENROUTER_HEDGE_PERCENTILE", "95"))
+OPENROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("OPENROUTER_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker: fail fast after consecutive upstream failures
+OPENROUTER_BREAKER_THRESHOLD = int(os.getenv("OPENROUTER_BREAKER_THRESHOLD", "5"))
+OPENROUTER_BREAKER_RESET = float(os.getenv("OPENROUTER_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class OpenRouterError(Exception):
+    """OpenRouter request failure with the HTTP status (if any)"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+    
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+
+class CircuitOpenError(OpenRouterError):
+    """Raised without calling upstream while a model's breaker is open"""
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker (closed -> open -> half_open -> closed)"""
+    
+    def __init__(self, failure_threshold: int = OPENROUTER_BREAKER_THRESHOLD, reset_timeout: float = OPENROUTER_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None  # Half-open probe in flight
+        self.trips = 0
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self) -> bool:
+        """
+        Whether a request may be sent
+        
+        half_open lets a single probe through and rejects everyone else until
+        it succeeds or fails. A probe that never reports back (cancelled, or a
+        non-retryable error) is given up on after reset_timeout.
+        """
+        state = self.state
+        if state != "half_open":
+            return state == "closed"
+        now = time.monotonic()
+        if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+            return False
+        self.probe_started_at = now
+        return True
+    
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probe_started_at = None
+        # A failed probe re-opens immediately; otherwise open at the threshold
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
 
 class OpenRouterClient:
     """Client for interacting with OpenRouter API"""
@@ -18,7 +109,8 @@ class OpenRouterClient:
         self.api_key = os.getenv("OPENROUTER_API_KEY")
         self.app_name = os.getenv("OPENROUTER_APP_NAME", "HB-Pattern-Chatbot")
         self.site_url = os.getenv("OPENROUTER_SITE_URL", "http://localhost:8000")
-        self.base_url = "https://openrouter.ai/api/v1"
+        # Override to point at a local stand-in (src/mock_openrouter.py) for offline benchmarks
+        self.base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
         
         if not self.api_key:
             raise ValueError(
@@ -29,6 +121,26 @@ class OpenRouterClient:
         # Default models
         self.default_chat_model = "meta-llama/llama-3.1-8b-instruct"
         self.default_vision_model = "openai/gpt-4-vision-preview"
+        
+        # Opt-in response cache (LLM_CACHE_ENABLED=1) for deterministic calls
+        self.cache = ResponseCache() if LLM_CACHE_ENABLED else None
+        
+        # Resilience state, per model
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, deque] = {}
+        self.first_token_latencies: Dict[str, deque] = {}
+        self.metrics: Dict[str, int] = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "hedges_sent": 0,
+            "hedges_won": 0,
+            "breaker_rejections": 0,
+            "deadline_exceeded": 0,
+            "streams": 0
+        }
     
     def _get_headers(self) -> Dict[str, str]:
         """Get headers for OpenRouter API requests"""
@@ -39,12 +151,196 @@ class OpenRouterClient:
             "Content-Type": "application/json"
         }
     
+    def _cache_key(self, payload: Dict, cache: Optional[bool]) -> Optional[str]:
+        """Cache key for a request, or None when it should bypass the cache"""
+        if self.cache is None or cache is False:
+            return None
+        
+        # Sampled replies (temperature > 0 or the provider default) only when forced
+        temperature = payload.get("temperature")
+        if cache is not True and (temperature is None or temperature > 0):
+            return None
+        
+        return make_cache_key(payload["model"], payload["messages"], temperature, payload.get("max_tokens"))
+    
+    def _breaker(self, model: str) -> CircuitBreaker:
+        if model not in self.breakers:
+            self.breakers[model] = CircuitBreaker()
+        return self.breakers[model]
+    
+    def _hedge_delay(self, model: str) -> Optional[float]:
+        """Latency percentile after which a duplicate request is sent"""
+        samples = self.latencies.get(model)
+        if OPENROUTER_HEDGE_PERCENTILE <= 0 or not samples or len(samples) < OPENROUTER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * OPENROUTER_HEDGE_PERCENTILE / 100))
+        return ordered[index]
+    
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(OPENROUTER_BACKOFF_MAX, OPENROUTER_BACKOFF_BASE * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+    
+    async def _post_once(self, client: httpx.AsyncClient, payload: Dict, priority: int) -> Dict:
+        """Single HTTP attempt; raises OpenRouterError with the status code"""
+        model = payload["model"]
+        governor = get_governor(model)
+        try:
+            async with governor.slot(priority):
+                # Latency samples exclude time queued for a rate-limit slot
+                start = time.monotonic()
+                response = await client.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=self._get_headers(),
+                    json=payload
+                )
+                elapsed = time.monotonic() - start
+        except httpx.HTTPError as e:
+            raise OpenRouterError(f"{type(e).__name__}: {e}")
+        
+        self._raise_for_status(response, governor)
+        self.latencies.setdefault(model, deque(maxlen=200)).append(elapsed)
+        return response.json()
+    
+    def _raise_for_status(self, response: httpx.Response, governor):
+        """Raise OpenRouterError for an error response (body must already be read)"""
+        if response.status_code < 400:
+            return
+        
+        try:
+            error_detail = response.json()
+        except ValueError:
+            error_detail = response.text
+        retry_after = response.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        if response.status_code == 429:
+            governor.penalize(retry_after)  # Slow every caller of this model, not just this one
+        raise OpenRouterError(f"HTTP {response.status_code}: {error_detail}", response.status_code, retry_after)
+    
+    async def _post_hedged(self, client: httpx.AsyncClient, payload: Dict, model: str, priority: int) -> Dict:
+        """Send a request, plus a duplicate if the first is slower than usual"""
+        hedge_delay = self._hedge_delay(model)
+        primary = asyncio.create_task(self._post_once(client, payload, priority))
+        if hedge_delay is None:
+            return await primary
+        
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                hedge = asyncio.create_task(self._post_once(client, payload, priority))
+                tasks.add(hedge)
+                self.metrics["hedges_sent"] += 1
+            
+            # First success wins; an error only counts once both have failed
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.metrics["hedges_won"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _request(self, payload: Dict, timeout: float, priority: int = INTERACTIVE) -> Dict:
+        """
+        Send a chat completion payload with retries, hedging and a circuit breaker
+        
+        Args:
+            payload: Request body (must include 'model')
+            timeout: Overall deadline in seconds for all attempts (including queueing)
+            priority: Rate limiter lane (rate_limiter.INTERACTIVE, SCREENING, BACKGROUND)
+            
+        Returns:
+            Parsed response JSON
+        """
+        model = payload["model"]
+        breaker = self._breaker(model)
+        deadline = time.monotonic() + timeout
+        self.metrics["requests"] += 1
+        
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    self.metrics["breaker_rejections"] += 1
+                    self.metrics["failures"] += 1
+                    raise CircuitOpenError(f"Circuit open for {model}, failing fast")
+                
+                remaining = deadline - time.monotonic()
+                try:
+                    async with asyncio.timeout(max(remaining, 0)):
+                        data = await self._post_hedged(client, payload, model, priority)
+                except TimeoutError:
+                    self.metrics["deadline_exceeded"] += 1
+                    self.metrics["failures"] += 1
+                    breaker.record_failure()
+                    raise OpenRouterError(f"Deadline of {timeout:g}s exceeded")
+                except OpenRouterError as e:
+                    if e.status_code == 429:
+                        self.metrics["rate_limited"] += 1
+                    if not e.retryable:
+                        self.metrics["failures"] += 1
+                        raise
+                    breaker.record_failure()
+                    
+                    delay = self._backoff(attempt, e.retry_after)
+                    if attempt >= OPENROUTER_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                        self.metrics["failures"] += 1
+                        raise
+                    attempt += 1
+                    self.metrics["retries"] += 1
+                    await asyncio.sleep(delay)
+                    continue
+                
+                breaker.record_success()
+                self.metrics["successes"] += 1
+                return data
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Request counters plus per-model breaker state and latency"""
+        models = {}
+        for model in set(self.breakers) | set(self.latencies):
+            samples = sorted(self.latencies.get(model, []))
+            first_token = sorted(self.first_token_latencies.get(model, []))
+            breaker = self._breaker(model)
+            models[model] = {
+                "breaker": breaker.state,
+                "breaker_trips": breaker.trips,
+                "consecutive_failures": breaker.consecutive_failures,
+                "latency_samples": len(samples),
+                "p50_ms": round(samples[len(samples) // 2] * 1000) if samples else None,
+                "first_token_p50_ms": round(first_token[len(first_token) // 2] * 1000) if first_token else None,
+                "hedge_after_ms": round(self._hedge_delay(model) * 1000) if self._hedge_delay(model) else None
+            }
+        return {
+            **self.metrics,
+            "models": models,
+            "rate_limits": get_governor_stats(),
+            "cache": self.cache.stats() if self.cache else None
+        }
+    
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        timeout: float = 30.0,
+        priority: int = INTERACTIVE,
+        cache: Optional[bool] = None
     ) -> str:
         """
         Send chat completion request to OpenRouter
@@ -54,6 +350,9 @@ class OpenRouterClient:
             model: Model to use (defaults to Llama 3.1)
             temperature: Sampling temperature (0-1)
             max_tokens: Maximum tokens in response
+            timeout: Deadline in seconds, including retries
+            priority: Rate limiter lane (interactive by default)
+            cache: Response cache use (None: only when temperature is 0, True: force, False: bypass)
             
         Returns:
             AI response text
@@ -68,31 +367,165 @@ class OpenRouterClient:
             "max_tokens": max_tokens
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self._get_headers(),
-                    json=payload
-                )
-                
-                response.raise_for_status()
-                data = response.json()
+        cache_key = self._cache_key(payload, cache)
+        if cache_key:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            data = await self._request(payload, timeout, priority)
+        except CircuitOpenError:
+            raise
+        except OpenRouterError as e:
+            raise OpenRouterError(f"OpenRouter API error: {e}", e.status_code, e.retry_after)
+        
+        # Extract message from response
+        content = data["choices"][0]["message"]["content"]
+        if cache_key:
+            await asyncio.to_thread(self.cache.put, cache_key, model, content)
+        return content
+    
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        timeout: float = 30.0,
+        priority: int = INTERACTIVE,
+        cache: Optional[bool] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from OpenRouter (SSE), token by token
+        
+        Retries and the circuit breaker apply until the first token arrives;
+        after that an upstream error ends the stream with an exception.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            model: Model to use (defaults to Llama 3.1)
+            temperature: Sampling temperature (0-1)
+            max_tokens: Maximum tokens in response
+            timeout: Deadline in seconds for the first token (and per chunk after)
+            priority: Rate limiter lane (interactive by default)
+            cache: Response cache use (None: only when temperature is 0, True: force, False: bypass)
+            
+        Yields:
+            Text fragments as they are generated
+        """
+        if model is None:
+            model = self.default_chat_model
+        
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        
+        # A cached answer is replayed as a single chunk
+        cache_key = self._cache_key({**payload, "stream": False}, cache)
+        if cache_key:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        
+        breaker = self._breaker(model)
+        governor = get_governor(model)
+        deadline = time.monotonic() + timeout
+        self.metrics["requests"] += 1
+        self.metrics["streams"] += 1
+        
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    self.metrics["breaker_rejections"] += 1
+                    self.metrics["failures"] += 1
+                    raise CircuitOpenError(f"Circuit open for {model}, failing fast")
                 
-                # Extract message from response
-                return data["choices"][0]["message"]["content"]
+                started = False
+                try:
+                    async with governor.slot(priority):
+                        # First-token latency excludes time queued for a rate-limit slot
+                        start = time.monotonic()
+                        async with asyncio.timeout(max(deadline - start, 0)) as first_token_deadline:
+                            async with client.stream(
+                                "POST",
+                                f"{self.base_url}/chat/completions",
+                                headers=self._get_headers(),
+                                json=payload
+                            ) as response:
+                                if response.status_code >= 400:
+                                    await response.aread()
+                                    self._raise_for_status(response, governor)
+                                
+                                async for line in response.aiter_lines():
+                                    # Skip keep-alive comments (": OPENROUTER PROCESSING") and blanks
+                                    if not line.startswith("data:"):
+                                        continue
+                                    data = line[len("data:"):].strip()
+                                    if data == "[DONE]":
+                                        break
+                                    
+                                    try:
+                                        chunk = json.loads(data)
+                                    except ValueError:
+                                        # Counted and retried like any other upstream failure
+                                        raise OpenRouterError(f"Malformed stream chunk: {data[:80]!r}")
+                                    if "error" in chunk:
+                                        raise OpenRouterError(f"Stream error: {chunk['error']}")
+                                    choices = chunk.get("choices") or [{}]
+                                    delta = choices[0].get("delta", {}).get("content")
+                                    if delta:
+                                        if not started:
+                                            # First token: latency is what the user sees
+                                            started = True
+                                            first_token_deadline.reschedule(None)
+                                            self.first_token_latencies.setdefault(model, deque(maxlen=200)).append(time.monotonic() - start)
+                                        parts.append(delta)
+                                        yield delta
+                except TimeoutError:
+                    self.metrics["deadline_exceeded"] += 1
+                    self.metrics["failures"] += 1
+                    breaker.record_failure()
+                    raise OpenRouterError(f"OpenRouter API error: no tokens within {timeout:g}s")
+                except (OpenRouterError, httpx.HTTPError) as e:
+                    if isinstance(e, httpx.HTTPError):
+                        e = OpenRouterError(f"{type(e).__name__}: {e}")
+                    if e.status_code == 429:
+                        self.metrics["rate_limited"] += 1
+                    if e.retryable:
+                        breaker.record_failure()
+                    
+                    delay = self._backoff(attempt, e.retry_after)
+                    if (started or not e.retryable or attempt >= OPENROUTER_MAX_RETRIES
+                            or time.monotonic() + delay >= deadline):
+                        self.metrics["failures"] += 1
+                        raise OpenRouterError(f"OpenRouter API error: {e}", e.status_code, e.retry_after)
+                    attempt += 1
+                    self.metrics["retries"] += 1
+                    await asyncio.sleep(delay)
+                    continue
                 
-            except httpx.HTTPStatusError as e:
-                error_detail = e.response.json() if e.response.text else str(e)
-                raise Exception(f"OpenRouter API error: {error_detail}")
-            except Exception as e:
-                raise Exception(f"Request failed: {str(e)}")
+                breaker.record_success()
+                self.metrics["successes"] += 1
+                if cache_key:
+                    await asyncio.to_thread(self.cache.put, cache_key, model, "".join(parts))
+                return
     
     async def analyze_image(
         self,
         image_base64: str,
         prompt: str,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        timeout: float = 60.0,
+        priority: int = INTERACTIVE,
+        cache: Optional[bool] = None
     ) -> str:
         """
         Analyze image using Vision API
@@ -101,6 +534,9 @@ class OpenRouterClient:
             image_base64: Base64 encoded image
             prompt: Analysis prompt
             model: Vision model to use (defaults to GPT-4V)
+            timeout: Deadline in seconds, including retries
+            priority: Rate limiter lane (interactive by default)
+            cache: Response cache use (None: only when temperature is 0, True: force, False: bypass)
             
         Returns:
             Image analysis text
@@ -133,24 +569,23 @@ class OpenRouterClient:
             "max_tokens": 500
         }
         
-        async with httpx.AsyncClient(timeout=60.0) as client:  # Longer timeout for vision
-            try:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self._get_headers(),
-                    json=payload
-                )
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                return data["choices"][0]["message"]["content"]
-                
-            except httpx.HTTPStatusError as e:
-                error_detail = e.response.json() if e.response.text else str(e)
-                raise Exception(f"OpenRouter Vision API error: {error_detail}")
-            except Exception as e:
-                raise Exception(f"Vision request failed: {str(e)}")
+        cache_key = self._cache_key(payload, cache)
+        if cache_key:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            data = await self._request(payload, timeout, priority)  # Longer deadline for vision
+        except CircuitOpenError:
+            raise
+        except OpenRouterError as e:
+            raise OpenRouterError(f"OpenRouter Vision API error: {e}", e.status_code, e.retry_after)
+        
+        content = data["choices"][0]["message"]["content"]
+        if cache_key:
+            await asyncio.to_thread(self.cache.put, cache_key, model, content)
+        return content
     
     async def test_connection(self) -> bool:
         """
@@ -176,6 +611,17 @@ class OpenRouterClient:
             return False
 
 
+# Singleton instance (shares breakers, latency history and metrics process-wide)
+_openrouter_client = None
+
+def get_openrouter_client() -> OpenRouterClient:
+    """Get or create singleton OpenRouter client instance"""
+    global _openrouter_client
+    if _openrouter_client is None:
+        _openrouter_client = OpenRouterClient()
+    return _openrouter_client
+
+
 # Test function
 async def test_client():
     """Test the OpenRouter client"""
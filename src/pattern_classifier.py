@@ -0,0 +1,288 @@
+"""
+Pattern Classifier
+Local kNN + prototype classifier over the labeled reference library (CLIP
+embeddings and peak features), with temperature-calibrated confidence so
+analyze-image can skip the vision LLM for confident cases
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+CLASSIFIER_FILE = PROJECT_ROOT / "data" / "pattern_classifier.npz"
+
+# Confidence at or above which analyze-image answers without the vision LLM
+CLASSIFIER_CONFIDENCE_THRESHOLD = float(os.getenv("CLASSIFIER_CONFIDENCE_THRESHOLD", "0.85"))
+
+# Start the vision model alongside the search and cancel it on a confident
+# prediction (lower latency for uncertain images, but most requests then pay
+# for a vision call that may already be billed when it is cancelled)
+CLASSIFIER_SPECULATIVE_VISION = os.getenv("CLASSIFIER_SPECULATIVE_VISION", "0") == "1"
+
+# Weight of CLIP cosine vs peak-feature similarity in the neighbor score
+CLIP_WEIGHT = 0.7
+KNN_K = 7
+KNN_SHARPNESS = 0.05       # Softmax temperature over neighbor scores
+PROTOTYPE_SHARPNESS = 0.05  # Softmax temperature over prototype cosines
+KNN_BLEND = 0.5             # Share of the kNN vote in the raw class distribution
+
+# Peak feature vector: (HbA2 %, HbF %, number of peaks) and the scale of each
+PEAK_KEYS = ("a2_concentration", "f_concentration", "num_peaks")
+PEAK_SCALES = np.array([1.5, 3.0, 2.0], dtype=np.float32)
+
+# Candidate temperatures tried during leave-one-out calibration
+TEMPERATURE_GRID = np.round(np.arange(0.25, 4.01, 0.05), 2)
+
+def peak_vector(features: Optional[Dict]) -> np.ndarray:
+    """Peak features as a fixed-length vector (NaN where not reported)"""
+    vector = np.full(len(PEAK_KEYS), np.nan, dtype=np.float32)
+    for i, key in enumerate(PEAK_KEYS):
+        value = (features or {}).get(key)
+        if value is not None:
+            vector[i] = float(value)
+    return vector
+
+def display_name(category: str) -> str:
+    """Human-readable category name ("hb_q_thailand" -> "Hb Q Thailand")"""
+    return category.replace("_", " ").title()
+
+class PatternClassifier:
+    """kNN + class-prototype classifier over reference chromatographs"""
+    
+    def __init__(self, ids: List[str], categories: List[str], embeddings: np.ndarray,
+                 peak_vectors: np.ndarray, temperature: float = 1.0):
+        """
+        Build the classifier in memory
+        
+        Args:
+            ids: Reference image ids (visual search collection ids)
+            categories: Category label per reference
+            embeddings: (N, dim) CLIP embeddings
+            peak_vectors: (N, 3) peak vectors from peak_vector()
+            temperature: Calibration temperature applied to the class distribution
+        """
+        self.ids = np.asarray(ids)
+        self.categories = np.asarray(categories)
+        self.classes = np.array(sorted(set(categories)))
+        self.labels = np.searchsorted(self.classes, self.categories)
+        self.one_hot = np.eye(len(self.classes), dtype=np.float32)[self.labels]
+        
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        self.embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        self.peak_vectors = np.asarray(peak_vectors, dtype=np.float32).reshape(len(self.ids), len(PEAK_KEYS))
+        self.temperature = float(temperature)
+        
+        # Pages of the same report are near-duplicates; leave-one-out drops the whole report
+        self.groups = np.array([re.sub(r"_page\d+\.png$", "", str(image_id)) for image_id in self.ids])
+        
+        # Per-class embedding sums (prototypes are their normalized directions)
+        self.class_sums = self.one_hot.T @ self.embeddings
+        self.labels_by_id = dict(zip(self.ids.tolist(), self.categories.tolist()))
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def label_of(self, image_id: str, category: Optional[str] = None) -> Optional[str]:
+        """
+        Category of a collection image, as the classifier names it
+        
+        Args:
+            image_id: Visual search collection id
+            category: The image's collection metadata category (fallback)
+        
+        Returns:
+            The classifier's label for a reference, else a category the
+            classifier knows, else None (unlabeled, e.g. main database pages)
+        """
+        label = self.labels_by_id.get(image_id, category)
+        return label if label in self.classes else None
+    
+    def _peak_similarity(self, query_peaks: np.ndarray) -> np.ndarray:
+        """Mean exp(-|difference| / scale) over the peak features both sides report"""
+        diff = np.abs(self.peak_vectors - query_peaks) / PEAK_SCALES
+        available = ~np.isnan(diff)
+        similarity = np.where(available, np.exp(-np.nan_to_num(diff)), 0.0).sum(axis=1)
+        counts = available.sum(axis=1)
+        return np.where(counts > 0, similarity / np.maximum(counts, 1), 0.5)
+    
+    def _raw_distribution(self, query_embedding: np.ndarray, query_peaks: np.ndarray,
+                          exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Uncalibrated class distribution and per-reference scores
+        
+        Args:
+            exclude: Boolean mask of references to leave out (leave-one-out calibration)
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        
+        scores = CLIP_WEIGHT * (self.embeddings @ query) + (1.0 - CLIP_WEIGHT) * self._peak_similarity(query_peaks)
+        class_sums = self.class_sums
+        available = len(self.ids)
+        if exclude is not None:
+            scores = np.where(exclude, -np.inf, scores)
+            class_sums = class_sums - self.one_hot[exclude].T @ self.embeddings[exclude]
+            available -= int(exclude.sum())
+        
+        # kNN vote, softmax-weighted by neighbor score
+        k = min(KNN_K, available)
+        neighbors = np.argpartition(-scores, k - 1)[:k]
+        weights = np.exp((scores[neighbors] - scores[neighbors].max()) / KNN_SHARPNESS)
+        knn = weights @ self.one_hot[neighbors]
+        knn /= knn.sum()
+        
+        # Nearest prototype (classes emptied by leave-one-out get no mass)
+        norms = np.linalg.norm(class_sums, axis=1)
+        prototype_sims = np.where(norms > 1e-6, (class_sums @ query) / np.maximum(norms, 1e-12), -np.inf)
+        prototypes = np.exp((prototype_sims - prototype_sims.max()) / PROTOTYPE_SHARPNESS)
+        prototypes /= prototypes.sum()
+        
+        return KNN_BLEND * knn + (1.0 - KNN_BLEND) * prototypes, scores
+    
+    def _calibrate(self, distribution: np.ndarray, temperature: float) -> np.ndarray:
+        """Temperature-scale a class distribution (p ** (1 / T), renormalized)"""
+        logits = np.log(np.maximum(distribution, 1e-12)) / temperature
+        probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return probabilities / probabilities.sum(axis=-1, keepdims=True)
+    
+    def predict(self, query_embedding: np.ndarray, query_features: Optional[Dict] = None,
+                top_n: int = 3) -> Dict:
+        """
+        Classify a chromatograph
+        
+        Args:
+            query_embedding: CLIP embedding of the cropped chromatograph
+            query_features: Peak features from PeakAnalyzer.analyze_image (optional)
+            top_n: Number of alternative classes and neighbors to report
+        
+        Returns:
+            Dict with 'category', 'pattern_type', 'confidence' (calibrated),
+            'alternatives' [(category, probability)] and 'neighbors'
+            [(reference id, category, score)]
+        """
+        distribution, scores = self._raw_distribution(query_embedding, peak_vector(query_features))
+        probabilities = self._calibrate(distribution, self.temperature)
+        ranked = np.argsort(-probabilities)
+        nearest = np.argsort(-scores)[:top_n]
+        
+        category = str(self.classes[ranked[0]])
+        return {
+            'category': category,
+            'pattern_type': display_name(category),
+            'confidence': float(probabilities[ranked[0]]),
+            'alternatives': [(str(self.classes[i]), float(probabilities[i])) for i in ranked[1:top_n + 1]],
+            'neighbors': [(str(self.ids[i]), str(self.categories[i]), float(scores[i])) for i in nearest]
+        }
+    
+    def leave_one_out(self) -> np.ndarray:
+        """Uncalibrated leave-one-report-out class distributions for every reference"""
+        return np.stack([
+            self._raw_distribution(self.embeddings[i], self.peak_vectors[i], exclude=self.groups == self.groups[i])[0]
+            for i in range(len(self.ids))
+        ])
+    
+    def calibrate(self) -> Dict:
+        """
+        Fit the temperature minimizing leave-one-out negative log-likelihood
+        
+        Returns:
+            Dict with 'temperature', 'nll', 'accuracy' and 'ece' (expected
+            calibration error, 10 bins) on the leave-one-out predictions
+        """
+        distributions = self.leave_one_out()
+        rows = np.arange(len(self.ids))
+        
+        best_temperature, best_nll = 1.0, np.inf
+        for temperature in TEMPERATURE_GRID:
+            probabilities = self._calibrate(distributions, temperature)
+            nll = float(-np.log(np.maximum(probabilities[rows, self.labels], 1e-12)).mean())
+            if nll < best_nll:
+                best_temperature, best_nll = float(temperature), nll
+        self.temperature = best_temperature
+        
+        probabilities = self._calibrate(distributions, best_temperature)
+        confidence = probabilities.max(axis=1)
+        correct = probabilities.argmax(axis=1) == self.labels
+        bins = np.minimum((confidence * 10).astype(int), 9)
+        ece = sum(
+            abs(correct[bins == b].mean() - confidence[bins == b].mean()) * (bins == b).mean()
+            for b in range(10) if (bins == b).any()
+        )
+        return {
+            'temperature': best_temperature,
+            'nll': best_nll,
+            'accuracy': float(correct.mean()),
+            'ece': float(ece),
+            'confidence': confidence,
+            'correct': correct
+        }
+    
+    def save(self, path: Path = CLASSIFIER_FILE):
+        """Write the classifier to a single .npz file"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path,
+            ids=self.ids,
+            categories=self.categories,
+            embeddings=self.embeddings,
+            peak_vectors=self.peak_vectors,
+            temperature=np.float32(self.temperature)
+        )
+    
+    @classmethod
+    def load(cls, path: Path = CLASSIFIER_FILE) -> Optional["PatternClassifier"]:
+        """Load a saved classifier (None if it does not exist)"""
+        if not Path(path).exists():
+            return None
+        with np.load(path) as data:
+            return cls(
+                data["ids"].tolist(), data["categories"].tolist(), data["embeddings"],
+                data["peak_vectors"], float(data["temperature"])
+            )
+    
+    @classmethod
+    def from_collection(cls, collection, peak_features: Dict, reference_metadata: Dict) -> "PatternClassifier":
+        """
+        Build from the reference images in the visual search collection
+        
+        Args:
+            collection: hb_image_embeddings Chroma collection
+            peak_features: data/peak_features.json contents (id -> features)
+            reference_metadata: data/reference_metadata.json contents (labels)
+        """
+        data = collection.get(where={'source': 'reference_pdfs'}, include=["metadatas", "embeddings"])
+        labels = {
+            f"reference_cropped_{name}": info['category']
+            for name, info in reference_metadata.get('images', {}).items()
+        }
+        
+        ids, categories, embeddings, peaks = [], [], [], []
+        for image_id, metadata, embedding in zip(data["ids"], data["metadatas"], data["embeddings"]):
+            category = labels.get(image_id) or metadata.get('category')
+            if not category or category == 'unknown':
+                continue
+            ids.append(image_id)
+            categories.append(category)
+            embeddings.append(embedding)
+            peaks.append(peak_vector(peak_features.get(image_id)))
+        
+        return cls(ids, categories, np.asarray(embeddings), np.stack(peaks))
+
+
+# Singleton instance (loaded lazily; None until src/9_build_pattern_classifier.py has run)
+_pattern_classifier = None
+_pattern_classifier_loaded = False
+
+def get_pattern_classifier() -> Optional[PatternClassifier]:
+    """Get the saved pattern classifier, or None if it has not been built"""
+    global _pattern_classifier, _pattern_classifier_loaded
+    if not _pattern_classifier_loaded:
+        _pattern_classifier = PatternClassifier.load()
+        _pattern_classifier_loaded = True
+        if _pattern_classifier is not None:
+            print(f"✅ Pattern classifier loaded ({len(_pattern_classifier)} references, "
+                  f"{len(_pattern_classifier.classes)} categories, T={_pattern_classifier.temperature:.2f})")
+    return _pattern_classifier
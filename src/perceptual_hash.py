@@ -0,0 +1,182 @@
+"""
+Perceptual Hash Index
+256-bit pHash + dHash of every cropped corpus chromatograph, so a query that
+is already in the library (or a lightly re-encoded copy of it) is recognized
+in a few milliseconds and answered with its precomputed neighbours
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+PROJECT_ROOT = Path(__file__).parent.parent
+PHASH_INDEX_FILE = PROJECT_ROOT / "data" / "phash_index.json"
+
+PHASH_ENABLED = os.getenv("PHASH_ENABLED", "1") == "1"
+
+# Maximum differing bits (of 256) in BOTH hashes for a near-exact match.
+# Distinct reports of the same pattern on the same analyzer template come
+# within 5-8 bits of each other, so this only admits copies and re-encodings.
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "4"))
+
+# Precomputed CLIP neighbours stored per image (covers top_k * 3 for top_k=10)
+PHASH_NEIGHBOURS = 30
+
+HASH_SIZE = 16     # 16x16 = 256-bit hashes (8x8 cannot tell chromatographs apart)
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+PHASH_SAMPLE = 64  # pHash DCT input side
+
+def _gray(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    """Grayscale, resized pixel array"""
+    image = image if image.mode == 'L' else image.convert('L')
+    return np.asarray(image.resize(size, Image.LANCZOS, reducing_gap=2.0), dtype=np.float32)
+
+def _pack(bits: np.ndarray) -> bytes:
+    """Pack a boolean array (row-major) into bytes"""
+    return np.packbits(bits.reshape(-1)).tobytes()
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> bytes:
+    """Difference hash: is each pixel brighter than its right neighbour"""
+    pixels = _gray(image, (hash_size + 1, hash_size))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis"""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+DCT_MATRIX = _dct_matrix(PHASH_SAMPLE)
+
+def phash(image: Image.Image, hash_size: int = HASH_SIZE) -> bytes:
+    """DCT hash: low-frequency coefficients above their median"""
+    pixels = _gray(image, (PHASH_SAMPLE, PHASH_SAMPLE))
+    low = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:hash_size, :hash_size]
+    return _pack(low > np.median(low.reshape(-1)[1:]))  # Median without the DC term
+
+def image_hashes(image: Image.Image) -> Tuple[bytes, bytes]:
+    """(pHash, dHash) of an image"""
+    image = image.convert('L')
+    return phash(image), dhash(image)
+
+def hamming_distances(hashes: np.ndarray, value: bytes) -> np.ndarray:
+    """Differing bits between every packed hash (N, bytes) and one hash"""
+    xor = np.bitwise_xor(hashes, np.frombuffer(value, dtype=np.uint8))
+    return np.unpackbits(xor, axis=1).sum(axis=1)
+
+def _stack(hashes: List[bytes]) -> np.ndarray:
+    """Packed hashes as an (N, HASH_BYTES) uint8 array"""
+    return np.frombuffer(b"".join(hashes), dtype=np.uint8).reshape(len(hashes), HASH_BYTES)
+
+def load_aliases(collection) -> Dict[str, str]:
+    """
+    Near-duplicates collapsed at ingestion (src/5_build_vectordb_with_images.py)
+    
+    Args:
+        collection: hb_image_embeddings Chroma collection
+    
+    Returns:
+        Dict of alias image_file -> canonical image_file it is indexed under
+    """
+    aliased = collection.get(where={'alias_count': {'$gt': 0}}, include=["metadatas"])
+    return {
+        alias: canonical
+        for canonical, metadata in zip(aliased['ids'], aliased['metadatas'])
+        for alias in filter(None, metadata.get('aliases', '').split(','))
+    }
+
+class PerceptualHashIndex:
+    """Hashes of the corpus images plus their precomputed neighbours"""
+    
+    def __init__(self, hashes: Dict[str, Tuple[bytes, bytes]], neighbours: Dict[str, List[Tuple[str, float]]] = None,
+                 aliases: Dict[str, str] = None):
+        """
+        Build the index in memory
+        
+        Args:
+            hashes: image_file (collection id) -> (pHash, dHash)
+            neighbours: image_file -> [(neighbour image_file, CLIP similarity)], best first
+            aliases: Near-duplicate image_file -> canonical image_file it was
+                indexed under (matches on an alias report the canonical)
+        """
+        self.ids = list(hashes)
+        self.phashes = _stack([hashes[image_id][0] for image_id in self.ids])
+        self.dhashes = _stack([hashes[image_id][1] for image_id in self.ids])
+        self.neighbours = neighbours or {}
+        self.aliases = aliases or {}
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def match(self, image: Image.Image, max_distance: int = PHASH_MAX_DISTANCE) -> Optional[Tuple[str, int]]:
+        """
+        Find the corpus image this query is a copy or re-scan of
+        
+        Args:
+            image: Cropped query chromatograph
+            max_distance: Maximum differing bits in each hash
+        
+        Returns:
+            (canonical image_file, distance) of the closest match, or None
+        """
+        if not self.ids:
+            return None
+        
+        query_phash, query_dhash = image_hashes(image)
+        distances = np.maximum(
+            hamming_distances(self.phashes, query_phash),
+            hamming_distances(self.dhashes, query_dhash)
+        )
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None
+        return self.aliases.get(self.ids[best], self.ids[best]), int(distances[best])
+    
+    def save(self, path: Path = PHASH_INDEX_FILE):
+        """Write the index as JSON (hashes as hex)"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'hashes': {
+                image_id: [p.tobytes().hex(), d.tobytes().hex()]
+                for image_id, p, d in zip(self.ids, self.phashes, self.dhashes)
+            },
+            'neighbours': self.neighbours,
+            'aliases': self.aliases
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+    
+    @classmethod
+    def load(cls, path: Path = PHASH_INDEX_FILE) -> Optional["PerceptualHashIndex"]:
+        """Load a saved index (None if it does not exist)"""
+        if not Path(path).exists():
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        hashes = {image_id: (bytes.fromhex(p), bytes.fromhex(d)) for image_id, (p, d) in data['hashes'].items()}
+        neighbours = {
+            image_id: [(other, float(similarity)) for other, similarity in items]
+            for image_id, items in data.get('neighbours', {}).items()
+        }
+        return cls(hashes, neighbours, data.get('aliases', {}))
+
+
+# Singleton instance (loaded lazily; None until src/11_build_phash_index.py has run)
+_phash_index = None
+_phash_index_loaded = False
+
+def get_phash_index() -> Optional[PerceptualHashIndex]:
+    """Get the saved perceptual hash index, or None if it is disabled or not built"""
+    global _phash_index, _phash_index_loaded
+    if not PHASH_ENABLED:
+        return None
+    if not _phash_index_loaded:
+        _phash_index = PerceptualHashIndex.load()
+        _phash_index_loaded = True
+        if _phash_index is not None:
+            print(f"✅ Perceptual hash index loaded ({len(_phash_index)} images)")
+    return _phash_index
@@ -3,10 +3,80 @@ RAG Search Module
 Handles vector database search for Retrieval-Augmented Generation
 """
 
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+import numpy as np
 import chromadb
 from sentence_transformers import SentenceTransformer
+from hybrid_index import HybridTextIndex
+import context_builder
+
+# Memory budget for cached query embeddings (MiniLM vectors are ~1.5 KB each)
+RAG_QUERY_CACHE_BYTES = int(os.getenv("RAG_QUERY_CACHE_BYTES", str(8 * 1024 * 1024)))
+
+# Search the in-process hybrid (BM25 + dense) index instead of querying Chroma
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") == "1"
+
+class QueryEmbeddingCache:
+    """Byte-budgeted LRU cache of normalized query text -> embedding"""
+    
+    def __init__(self, max_bytes: int = RAG_QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Collapse whitespace and case (MiniLM is uncased, so embeddings are identical)"""
+        return re.sub(r"\s+", " ", query).strip().lower()
+    
+    @staticmethod
+    def _entry_size(key: str, embedding: np.ndarray) -> int:
+        return embedding.nbytes + len(key.encode("utf-8"))
+    
+    def get(self, key: str):
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, key: str, embedding: np.ndarray):
+        size = self._entry_size(key, embedding)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self._entry_size(key, self.entries.pop(key))
+            self.entries[key] = embedding
+            self.bytes += size
+            
+            # Evict least recently used until back under budget
+            while self.bytes > self.max_bytes:
+                old_key, old_embedding = self.entries.popitem(last=False)
+                self.bytes -= self._entry_size(old_key, old_embedding)
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
 
 class RAGSearchEngine:
     """Search engine for RAG using ChromaDB"""
@@ -29,6 +99,7 @@ class RAGSearchEngine:
         # Initialize embedding model
         print("📥 Loading embedding model for RAG...")
         self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.query_cache = QueryEmbeddingCache()
         
         # Initialize ChromaDB client
         print(f"💾 Connecting to ChromaDB at {persist_dir}")
@@ -40,12 +111,69 @@ class RAGSearchEngine:
             print(f"✅ Connected to collection: {collection_name} ({self.collection.count()} vectors)")
         except Exception as e:
             raise Exception(f"Failed to load collection '{collection_name}': {e}")
+        
+        # In-process hybrid index (Chroma query path is the fallback)
+        self.hybrid_index = None
+        if RAG_HYBRID_SEARCH:
+            self.load_hybrid_index()
+        
+        self.index_version = None
+        self.refresh_index_version()
+    
+    def refresh_index_version(self) -> str:
+        """
+        Recompute the text index version (hash of the content-hashed chunk ids)
+        
+        Caches keyed on retrieval results compare this to detect rebuilds.
+        """
+        ids = self.hybrid_index.ids if self.hybrid_index is not None else self.collection.get(include=[])['ids']
+        self.index_version = hashlib.sha1("\n".join(sorted(ids)).encode('utf-8')).hexdigest()[:12]
+        return self.index_version
+    
+    def load_hybrid_index(self):
+        """Load the hybrid index snapshot, rebuilding from the collection if missing or stale"""
+        try:
+            index = HybridTextIndex.load()
+            # Chunk ids are content hashes, so equal id sets mean equal content
+            if index is None or set(index.ids) != set(self.collection.get(include=[])['ids']):
+                index = HybridTextIndex.from_collection(self.collection)
+                index.save()
+            self.hybrid_index = index
+            print(f"✅ Hybrid BM25 + dense index ready ({len(index)} chunks)")
+        except Exception as e:
+            print(f"⚠️ Hybrid index unavailable, using ChromaDB queries: {e}")
+            self.hybrid_index = None
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed queries, reusing cached embeddings and encoding misses in one batch
+        
+        Args:
+            queries: Query texts
+            
+        Returns:
+            Array of shape (len(queries), dim)
+        """
+        keys = [QueryEmbeddingCache.normalize(query) for query in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        
+        # Encode each distinct missing query once
+        missing = list(dict.fromkeys(key for key, embedding in zip(keys, embeddings) if embedding is None))
+        if missing:
+            encoded = self.embedding_model.encode(missing, batch_size=64)
+            fresh = dict(zip(missing, encoded))
+            for key, embedding in fresh.items():
+                self.query_cache.put(key, embedding)
+            embeddings = [fresh[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+        
+        return np.stack(embeddings)
     
     def search(
         self, 
         query: str, 
         top_k: int = 5, 
-        min_similarity: float = 0.0
+        min_similarity: float = 0.0,
+        query_embedding: Optional[np.ndarray] = None
     ) -> Tuple[List[str], List[Dict], List[float]]:
         """
         Search vector database for relevant documents
@@ -54,16 +182,21 @@ class RAGSearchEngine:
             query: Search query
             top_k: Number of results to return
             min_similarity: Minimum similarity score (0-1)
+            query_embedding: Embedding of query if the caller already has it
             
         Returns:
             Tuple of (documents, metadatas, distances)
         """
-        # Embed query
-        query_embedding = self.embedding_model.encode([query])
+        # Embed query (cached for repeated questions)
+        if query_embedding is None:
+            query_embedding = self.encode_queries([query])[0]
+        
+        if self.hybrid_index is not None:
+            return self._search_hybrid(query, query_embedding, top_k, min_similarity)
         
         # Search database
         results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
+            query_embeddings=[query_embedding.tolist()],
             n_results=top_k
         )
         
@@ -93,46 +226,55 @@ class RAGSearchEngine:
         
         return documents, metadatas, similarities
     
+    def _search_hybrid(
+        self,
+        query: str,
+        query_embedding: np.ndarray,
+        top_k: int,
+        min_similarity: float
+    ) -> Tuple[List[str], List[Dict], List[float]]:
+        """
+        Search the in-process hybrid index (ranked by reciprocal-rank fusion)
+        
+        Reported similarities stay on the dense 1 / (1 + L2) scale so
+        min_similarity means the same as on the Chroma path; strong keyword
+        matches are kept even when their dense similarity is below it.
+        """
+        hits = self.hybrid_index.search(query, query_embedding, top_k=top_k)
+        best_bm25 = max((bm25 for _, _, _, bm25 in hits), default=0.0)
+        
+        documents, metadatas, similarities = [], [], []
+        for index, _, dense, bm25 in hits:
+            if dense >= min_similarity or (best_bm25 > 0 and bm25 >= 0.5 * best_bm25):
+                documents.append(self.hybrid_index.documents[index])
+                metadatas.append(self.hybrid_index.metadatas[index])
+                similarities.append(dense)
+        
+        return documents, metadatas, similarities
+    
     def build_context(
         self, 
         documents: List[str], 
         metadatas: List[Dict],
         similarities: List[float],
-        max_length: int = 3000
-    ) -> str:
+        model: Optional[str] = None
+    ) -> Dict:
         """
         Build context string from retrieved documents
         
+        Overlapping chunks of a page are merged and deduplicated, ordered by
+        MMR and packed into the model's token budget (see context_builder).
+        
         Args:
             documents: Retrieved document texts
             metadatas: Document metadata
             similarities: Similarity scores
-            max_length: Maximum context length in characters
+            model: Chat model the context is built for
             
         Returns:
-            Formatted context string
+            Dict with 'context', 'passages' and 'tokens'
         """
-        context_parts = []
-        current_length = 0
-        
-        for i, (doc, meta, sim) in enumerate(zip(documents, metadatas, similarities), 1):
-            page = meta.get('page', 'Unknown')
-            
-            # Format source
-            source_text = f"[Source {i} - Page {page}, Relevance: {sim:.2f}]\n{doc}\n"
-            
-            # Check if adding this would exceed max length
-            if current_length + len(source_text) > max_length:
-                break
-            
-            context_parts.append(source_text)
-            current_length += len(source_text)
-        
-        if not context_parts:
-            return "No relevant information found in the database."
-        
-        context = "\n---\n\n".join(context_parts)
-        return context
+        return context_builder.build_context(documents, metadatas, similarities, model=model)
     
     def format_sources(
         self, 
@@ -163,7 +305,8 @@ class RAGSearchEngine:
         self, 
         query: str, 
         top_k: int = 5, 
-        min_similarity: float = 0.3
+        min_similarity: float = 0.3,
+        model: Optional[str] = None
     ) -> Dict:
         """
         Search and return formatted results
@@ -172,27 +315,39 @@ class RAGSearchEngine:
             query: Search query
             top_k: Number of results
             min_similarity: Minimum similarity threshold
+            model: Chat model (sets the context token budget)
             
         Returns:
             Dict with context, sources, and metadata
         """
+        # Embed once: the embedding is searched with and returned for the answer cache
+        query_embedding = self.encode_queries([query])[0]
+        
         # Search
         documents, metadatas, similarities = self.search(
             query, 
             top_k=top_k, 
-            min_similarity=min_similarity
+            min_similarity=min_similarity,
+            query_embedding=query_embedding
         )
         
-        # Build context
-        context = self.build_context(documents, metadatas, similarities)
+        # Build context (merged, deduplicated and token-budgeted)
+        built = self.build_context(documents, metadatas, similarities, model=model)
+        passages = built['passages']
         
-        # Format sources
-        sources = self.format_sources(metadatas, similarities)
+        # Format sources (one per passage in the context)
+        sources = self.format_sources(
+            [passage['metadata'] for passage in passages],
+            [passage['similarity'] for passage in passages]
+        )
         
         return {
-            "context": context,
+            "context": built['context'],
             "sources": sources,
+            "source_pages": sorted({str(passage['page']) for passage in passages}),
             "num_results": len(documents),
+            "context_tokens": built['tokens'],
+            "query_embedding": query_embedding,
             "query": query
         }
 
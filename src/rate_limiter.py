@@ -0,0 +1,179 @@
+"""
+OpenRouter Rate Limiter
+Process-wide token bucket and concurrency governor per model, with priority
+lanes so interactive requests are served ahead of screening bursts
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Priority lanes (lower value is served first)
+INTERACTIVE = 0   # Chat and single-image analysis a user is waiting on
+SCREENING = 1     # LLM screening fan-out inside visual search
+BACKGROUND = 2    # Batch jobs and offline precomputation
+
+LANE_NAMES = {INTERACTIVE: "interactive", SCREENING: "screening", BACKGROUND: "background"}
+
+# Defaults for models without an explicit entry in OPENROUTER_RATE_LIMITS
+DEFAULT_RPS = float(os.getenv("OPENROUTER_DEFAULT_RPS", "5"))
+DEFAULT_BURST = int(os.getenv("OPENROUTER_DEFAULT_BURST", "10"))
+DEFAULT_CONCURRENCY = int(os.getenv("OPENROUTER_DEFAULT_CONCURRENCY", "8"))
+
+# Concurrency slots only the interactive lane may use
+INTERACTIVE_RESERVE = int(os.getenv("OPENROUTER_INTERACTIVE_RESERVE", "2"))
+
+# Per-model overrides, e.g. '{"openai/gpt-4o": {"rps": 3, "burst": 6, "concurrency": 6}}'
+MODEL_LIMITS: Dict[str, Dict] = json.loads(os.getenv("OPENROUTER_RATE_LIMITS", "{}"))
+
+class RateGovernor:
+    """Token bucket (requests/second) plus concurrency cap for one model"""
+    
+    def __init__(self, rps: float, burst: int, concurrency: int, interactive_reserve: int = INTERACTIVE_RESERVE):
+        """
+        Initialize governor
+        
+        Args:
+            rps: Sustained requests per second
+            burst: Bucket size (requests allowed back to back)
+            concurrency: Maximum requests in flight
+            interactive_reserve: Slots held back for the interactive lane
+        """
+        self.rps = rps
+        self.burst = burst
+        self.concurrency = concurrency
+        self.interactive_reserve = min(interactive_reserve, max(concurrency - 1, 0))
+        
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        
+        self.granted = {lane: 0 for lane in LANE_NAMES}
+        self.wait_seconds = {lane: 0.0 for lane in LANE_NAMES}
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rps)
+        self.updated = now
+    
+    def _slot_limit(self, priority: int) -> int:
+        """Concurrency available to a lane"""
+        if priority == INTERACTIVE:
+            return self.concurrency
+        return self.concurrency - self.interactive_reserve
+    
+    def _dispatch(self):
+        """Grant permits to waiting requests in priority order"""
+        self.timer = None
+        self._refill()
+        
+        while self.waiters:
+            priority, _, future = self.waiters[0]
+            if future.done():  # Cancelled while waiting
+                heapq.heappop(self.waiters)
+                continue
+            if self.in_flight >= self._slot_limit(priority):
+                return  # Woken again by release()
+            
+            now = time.monotonic()
+            if now < self.paused_until or self.tokens < 1.0:
+                wait = max(self.paused_until - now, (1.0 - self.tokens) / self.rps if self.rps > 0 else 1.0)
+                self.timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            
+            heapq.heappop(self.waiters)
+            self.tokens -= 1.0
+            self.in_flight += 1
+            future.set_result(None)
+    
+    def _wake(self):
+        if self.timer is None:
+            self._dispatch()
+    
+    async def acquire(self, priority: int = INTERACTIVE):
+        """Wait for a rate token and a concurrency slot"""
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self._wake()
+        
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Granted just as the caller gave up
+            raise
+        
+        self.granted[priority] = self.granted.get(priority, 0) + 1
+        self.wait_seconds[priority] = self.wait_seconds.get(priority, 0.0) + time.monotonic() - start
+    
+    def release(self):
+        """Return a concurrency slot"""
+        self.in_flight -= 1
+        self._wake()
+    
+    def penalize(self, retry_after: Optional[float]):
+        """Back off the whole model after a 429 (drain tokens, honour Retry-After)"""
+        self._refill()
+        self.tokens = 0.0
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+    
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        """Hold a permit for the duration of one request"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def stats(self) -> Dict:
+        """Queue depth, in-flight count and per-lane wait times"""
+        self._refill()
+        queued = {LANE_NAMES[lane]: 0 for lane in LANE_NAMES}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                queued[LANE_NAMES.get(priority, str(priority))] += 1
+        return {
+            "rps": self.rps,
+            "burst": self.burst,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "tokens": round(self.tokens, 2),
+            "queued": queued,
+            "granted": {LANE_NAMES[lane]: count for lane, count in self.granted.items()},
+            "avg_wait_ms": {
+                LANE_NAMES[lane]: round(1000 * self.wait_seconds[lane] / self.granted[lane]) if self.granted[lane] else 0
+                for lane in self.granted
+            }
+        }
+
+
+# Process-wide governors, one per model
+_governors: Dict[str, RateGovernor] = {}
+
+def get_governor(model: str) -> RateGovernor:
+    """Get or create the governor for a model"""
+    if model not in _governors:
+        limits = MODEL_LIMITS.get(model, {})
+        _governors[model] = RateGovernor(
+            rps=float(limits.get("rps", DEFAULT_RPS)),
+            burst=int(limits.get("burst", DEFAULT_BURST)),
+            concurrency=int(limits.get("concurrency", DEFAULT_CONCURRENCY))
+        )
+    return _governors[model]
+
+def get_governor_stats() -> Dict[str, Dict]:
+    """Stats for every model that has sent traffic"""
+    return {model: governor.stats() for model, governor in _governors.items()}
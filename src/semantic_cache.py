@@ -0,0 +1,126 @@
+"""
+Semantic Answer Cache
+Reuses chat answers for paraphrased questions: a question whose embedding is
+close to a cached question, with the same retrieved sources, gets the cached
+answer. Entries are tied to the text index version and dropped when it changes.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+import numpy as np
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+
+class SemanticAnswerCache:
+    """In-memory LRU of (question embedding, answer), bucketed by source set"""
+    
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, ttl: float = SEMANTIC_CACHE_TTL):
+        """
+        Initialize cache
+        
+        Args:
+            threshold: Minimum cosine similarity between questions for a hit
+            max_entries: Maximum cached answers before LRU eviction
+            ttl: Seconds an answer stays valid
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index_version = None
+        
+        # bucket key -> OrderedDict of entry id -> (unit embedding, answer, created_at)
+        self.buckets: Dict[Hashable, OrderedDict] = {}
+        self.lru: OrderedDict = OrderedDict()  # (bucket key, entry id) in use order
+        self.next_id = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        """L2-normalize an embedding so a dot product is the cosine"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+    
+    def _check_version(self, index_version: str):
+        """Drop every entry when the text index has changed"""
+        if index_version != self.index_version:
+            if self.lru:
+                self.invalidations += 1
+                print(f"🧹 Text index changed - dropped {len(self.lru)} cached answers")
+            self.buckets.clear()
+            self.lru.clear()
+            self.index_version = index_version
+    
+    def get(self, bucket: Hashable, embedding: np.ndarray, index_version: str) -> Optional[str]:
+        """
+        Return the cached answer for the closest question in the bucket, or None
+        
+        Args:
+            bucket: Hashable key of everything besides the question that shapes
+                the answer (model, sampling settings, retrieved source set)
+            embedding: Query embedding (as computed for RAG search)
+            index_version: Current text index version
+        """
+        query = self._unit(embedding)
+        now = time.time()
+        with self.lock:
+            self._check_version(index_version)
+            entries = self.buckets.get(bucket)
+            
+            best_id, best_similarity = None, self.threshold
+            for entry_id, (vector, _, created_at) in list((entries or {}).items()):
+                if now - created_at > self.ttl:
+                    del entries[entry_id]
+                    self.lru.pop((bucket, entry_id), None)
+                    continue
+                similarity = float(vector @ query)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            
+            if best_id is None:
+                self.misses += 1
+                return None
+            
+            self.lru.move_to_end((bucket, best_id))
+            self.hits += 1
+            print(f"♻️  Semantic cache hit (similarity {best_similarity:.3f})")
+            return entries[best_id][1]
+    
+    def put(self, bucket: Hashable, embedding: np.ndarray, answer: str, index_version: str):
+        """Store an answer and evict least recently used entries over the cap"""
+        with self.lock:
+            self._check_version(index_version)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.buckets.setdefault(bucket, OrderedDict())[entry_id] = (self._unit(embedding), answer, time.time())
+            self.lru[(bucket, entry_id)] = None
+            
+            while len(self.lru) > self.max_entries:
+                (old_bucket, old_id), _ = self.lru.popitem(last=False)
+                self.buckets[old_bucket].pop(old_id, None)
+                if not self.buckets[old_bucket]:
+                    del self.buckets[old_bucket]
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.lru),
+            "buckets": len(self.buckets),
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,80 @@
+"""
+Similarity Graph
+Precomputed LLM screening verdicts between corpus images (built offline by
+src/10_build_similarity_graph.py). Once a query's nearest candidate is
+confirmed similar by the LLM, the verdicts of the other candidates are read
+from that anchor's edges instead of being screened online.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SIMILARITY_GRAPH_FILE = PROJECT_ROOT / "data" / "similarity_graph.json"
+
+SIMILARITY_GRAPH_ENABLED = os.getenv("SIMILARITY_GRAPH_ENABLED", "1") == "1"
+
+# Corpus neighbours screened per image by the offline job
+SIMILARITY_GRAPH_NEIGHBOURS = int(os.getenv("SIMILARITY_GRAPH_NEIGHBOURS", "20"))
+
+# Candidates tried as anchor before screening falls back to the LLM
+SIMILARITY_GRAPH_MAX_ANCHORS = int(os.getenv("SIMILARITY_GRAPH_MAX_ANCHORS", "2"))
+
+class SimilarityGraph:
+    """Symmetric image_file -> image_file -> similar (bool) verdict map"""
+    
+    def __init__(self, edges: Dict[str, Dict[str, bool]] = None):
+        self.edges: Dict[str, Dict[str, bool]] = edges or {}
+    
+    def __len__(self) -> int:
+        """Number of verdicts (each pair counted once)"""
+        return sum(len(neighbours) for neighbours in self.edges.values()) // 2
+    
+    def __contains__(self, image_file: str) -> bool:
+        return image_file in self.edges
+    
+    def verdict(self, a: str, b: str) -> Optional[bool]:
+        """Precomputed verdict for a pair (None if the pair was never screened)"""
+        if a == b:
+            return True
+        return self.edges.get(a, {}).get(b)
+    
+    def add(self, a: str, b: str, similar: bool):
+        """Record a verdict for both directions"""
+        self.edges.setdefault(a, {})[b] = bool(similar)
+        self.edges.setdefault(b, {})[a] = bool(similar)
+    
+    def save(self, path: Path = SIMILARITY_GRAPH_FILE):
+        """Write the graph as JSON (verdicts stored as 1/0)"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        edges = {a: {b: int(v) for b, v in neighbours.items()} for a, neighbours in self.edges.items()}
+        with open(path, 'w') as f:
+            json.dump({'edges': edges}, f)
+    
+    @classmethod
+    def load(cls, path: Path = SIMILARITY_GRAPH_FILE) -> Optional["SimilarityGraph"]:
+        """Load a saved graph (None if it does not exist)"""
+        if not Path(path).exists():
+            return None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls({a: {b: bool(v) for b, v in neighbours.items()} for a, neighbours in data['edges'].items()})
+
+
+# Singleton instance (loaded lazily; None until src/10_build_similarity_graph.py has run)
+_similarity_graph = None
+_similarity_graph_loaded = False
+
+def get_similarity_graph() -> Optional[SimilarityGraph]:
+    """Get the saved similarity graph, or None if it is disabled or not built"""
+    global _similarity_graph, _similarity_graph_loaded
+    if not SIMILARITY_GRAPH_ENABLED:
+        return None
+    if not _similarity_graph_loaded:
+        _similarity_graph = SimilarityGraph.load()
+        _similarity_graph_loaded = True
+        if _similarity_graph is not None:
+            print(f"✅ Similarity graph loaded ({len(_similarity_graph.edges)} images, {len(_similarity_graph)} verdicts)")
+    return _similarity_graph
@@ -11,14 +11,50 @@ import chromadb
 import os
 from openai import OpenAI
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, AsyncIterator, Callable, Optional
 import io
+import json
+import hashlib
+import itertools
 import fitz  # PyMuPDF
 import pytesseract
 from peak_analyzer import get_peak_analyzer
-import base64
 import asyncio
-from openrouter_client import OpenRouterClient
+from concurrent.futures import ThreadPoolExecutor
+from openrouter_client import get_openrouter_client
+from rate_limiter import SCREENING
+from llm_payloads import encode_image_for_llm, load_llm_payloads, parse_batch_verdicts
+from numeric_index import get_numeric_index, describe_ranges
+from similarity_graph import get_similarity_graph, SIMILARITY_GRAPH_MAX_ANCHORS
+from perceptual_hash import get_phash_index, load_aliases, PHASH_INDEX_FILE
+from pattern_classifier import get_pattern_classifier
+
+# Directories holding the cropped chromatographs referenced by the image collection
+PROJECT_ROOT = Path(__file__).parent.parent
+CROPPED_MAIN_DIR = PROJECT_ROOT / "data" / "cropped_images_main"
+CROPPED_REFERENCE_DIR = PROJECT_ROOT / "data" / "cropped_images_reference"
+
+# LLM screening limits per search request: max comparisons in flight, and
+# overall deadline (seconds) after which unscreened candidates are kept
+LLM_SCREEN_CONCURRENCY = int(os.getenv("LLM_SCREEN_CONCURRENCY", "6"))
+LLM_SCREEN_DEADLINE = float(os.getenv("LLM_SCREEN_DEADLINE", "30"))
+
+# Candidates sent per screening request alongside one copy of the query image
+# (1 = pairwise). Larger batches mean fewer calls but bigger payloads.
+LLM_SCREEN_BATCH_SIZE = int(os.getenv("LLM_SCREEN_BATCH_SIZE", "4"))
+
+# Local screening tier: candidates that the hybrid score, the strict peak
+# filter and the query's predicted category decide on their own are
+# accepted/rejected without an LLM call; only the ambiguous band is sent.
+# LOCAL_SCREEN_CONSENSUS is the pattern classifier confidence required to
+# use its prediction as the expected category.
+LOCAL_SCREEN_ENABLED = os.getenv("LOCAL_SCREEN_ENABLED", "1") == "1"
+LOCAL_SCREEN_ACCEPT_SCORE = float(os.getenv("LOCAL_SCREEN_ACCEPT_SCORE", "0.80"))
+LOCAL_SCREEN_REJECT_SCORE = float(os.getenv("LOCAL_SCREEN_REJECT_SCORE", "0.55"))
+LOCAL_SCREEN_CONSENSUS = float(os.getenv("LOCAL_SCREEN_CONSENSUS", "0.6"))
+
+# Candidate peak features precomputed at ingestion (src/6_precompute_peak_features.py)
+PEAK_FEATURES_FILE = PROJECT_ROOT / "data" / "peak_features.json"
 
 class VisualSearchEngine:
     """Visual similarity search using CLIP embeddings"""
@@ -51,8 +87,8 @@ class VisualSearchEngine:
         else:
             self.device = 'cpu'
         
-        # Initialize OpenRouter client for LLM screening
-        self.openrouter_client = OpenRouterClient()
+        # Shared OpenRouter client for LLM screening (retries, hedging, circuit breaker)
+        self.openrouter_client = get_openrouter_client()
         
         self.model.to(self.device)
         
@@ -61,6 +97,26 @@ class VisualSearchEngine:
         self.peak_analyzer = get_peak_analyzer()
         print("✅ Peak analyzer ready!")
         
+        # Peak analysis is dominated by OCR subprocesses and NumPy, so a thread
+        # pool lets candidates (and query pages) be analyzed in parallel
+        self.peak_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+        
+        # Candidate peak features keyed by image_file (candidate images never change)
+        self.candidate_features_cache: Dict[str, Dict] = {}
+        if PEAK_FEATURES_FILE.exists():
+            try:
+                with open(PEAK_FEATURES_FILE, 'r') as f:
+                    self.candidate_features_cache.update(json.load(f))
+                print(f"✅ Loaded precomputed peak features for {len(self.candidate_features_cache)} images")
+            except Exception as e:
+                print(f"⚠️ Failed to load precomputed peak features: {e}")
+        
+        # Candidate image payloads for LLM screening (precomputed at ingestion,
+        # otherwise encoded on first use and kept)
+        self.candidate_payloads: Dict[str, str] = load_llm_payloads()
+        if self.candidate_payloads:
+            print(f"✅ Loaded precomputed LLM payloads for {len(self.candidate_payloads)} images")
+        
         # Initialize LLM client (OpenRouter via OpenAI SDK)
         self.llm_client = None
         openrouter_key = os.environ.get("OPENROUTER_API_KEY")
@@ -81,6 +137,43 @@ class VisualSearchEngine:
             print(f"✅ Connected to collection: {collection_name} ({self.collection.count()} images)")
         except Exception as e:
             raise Exception(f"Failed to load collection '{collection_name}': {e}")
+        
+        # Near-duplicates collapsed at ingestion: alias image_file -> canonical
+        self.canonical_of: Dict[str, str] = load_aliases(self.collection)
+        if self.canonical_of:
+            print(f"✅ {len(self.canonical_of)} near-duplicate images indexed under "
+                  f"{len(set(self.canonical_of.values()))} canonical images")
+        
+        # Image index version, so cached job results are not reused across a rebuild
+        self.collection_name = collection_name
+        self.index_version = None
+        self.refresh_index_version()
+    
+    def refresh_index_version(self) -> str:
+        """
+        Recompute the image index version from the stored index
+        
+        Hashes the indexed ids, the near-duplicate aliases and the saved
+        perceptual hash index, re-attaching to the collection first, so an
+        offline rebuild (src/5_build_vectordb_with_images.py,
+        src/11_build_phash_index.py) changes the version without a restart.
+        
+        Returns:
+            The new index version
+        """
+        collection = self.client.get_collection(name=self.collection_name)
+        canonical_of = load_aliases(collection)
+        
+        indexed = sorted(collection.get(include=[])['ids'])
+        indexed += sorted(f"{alias}>{canonical}" for alias, canonical in canonical_of.items())
+        if PHASH_INDEX_FILE.exists():
+            stat = PHASH_INDEX_FILE.stat()
+            indexed.append(f"phash:{stat.st_size}:{stat.st_mtime_ns}")
+        
+        self.collection = collection
+        self.canonical_of = canonical_of
+        self.index_version = hashlib.sha1("\n".join(indexed).encode('utf-8')).hexdigest()[:12]
+        return self.index_version
     
     def detect_system_type(self, image: Image.Image) -> str:
         """
@@ -139,13 +232,28 @@ class VisualSearchEngine:
         
         return cropped
     
-    def extract_from_pdf(self, pdf_bytes: bytes, page_number: int = 0) -> Image.Image:
+    def _render_page(self, page) -> Image.Image:
+        """Render a PyMuPDF page at high resolution and crop the chromatograph"""
+        # Render at high resolution
+        zoom = 2.0
+        mat = fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(matrix=mat, alpha=False)
+        
+        # Convert to PIL Image
+        img_bytes = pix.tobytes("png")
+        image = Image.open(io.BytesIO(img_bytes))
+        
+        # Crop chromatograph region
+        return self.crop_chromatograph(image)
+    
+    def extract_from_pdf(self, pdf_bytes: bytes, page_number: int = 0, strict: bool = False) -> Image.Image:
         """
         Extract and crop chromatograph from PDF
         
         Args:
             pdf_bytes: PDF file as bytes
             page_number: Which page to extract (0-indexed, default: 0 = first page)
+            strict: Raise ValueError for an out-of-range page instead of using page 0
             
         Returns:
             Cropped chromatograph image
@@ -155,6 +263,10 @@ class VisualSearchEngine:
         
         # Validate page number
         if page_number < 0 or page_number >= len(doc):
+            if strict:
+                page_count = len(doc)
+                doc.close()
+                raise ValueError(f"Page {page_number + 1} out of range (PDF has {page_count} pages)")
             print(f"⚠️  Page {page_number} out of range (PDF has {len(doc)} pages), using page 0")
             page_number = 0
         
@@ -162,21 +274,76 @@ class VisualSearchEngine:
         page = doc[page_number]
         print(f"📄 Extracting page {page_number + 1} of {len(doc)}")
         
-        # Render at high resolution
-        zoom = 2.0
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
+        cropped = self._render_page(page)
         
-        # Convert to PIL Image
-        img_bytes = pix.tobytes("png")
-        image = Image.open(io.BytesIO(img_bytes))
+        doc.close()
+        
+        return cropped
+    
+    def extract_all_from_pdf(self, pdf_bytes: bytes, page_numbers: List[int] = None) -> List[Tuple[int, Image.Image]]:
+        """
+        Extract and crop chromatographs from several PDF pages in one pass
+        
+        Args:
+            pdf_bytes: PDF file as bytes
+            page_numbers: Pages to extract (0-indexed, default: all pages)
+        
+        Returns:
+            List of (page_number, cropped chromatograph image)
+        """
+        # Open PDF once for all pages
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        
+        if page_numbers is None:
+            page_numbers = list(range(len(doc)))
+        else:
+            valid = [p for p in page_numbers if 0 <= p < len(doc)]
+            if len(valid) < len(page_numbers):
+                print(f"⚠️  Skipping out-of-range pages (PDF has {len(doc)} pages)")
+            page_numbers = sorted(set(valid))
+        
+        print(f"📄 Extracting {len(page_numbers)} of {len(doc)} pages")
+        pages = [(page_number, self._render_page(doc[page_number])) for page_number in page_numbers]
         
         doc.close()
         
-        # Crop chromatograph region
-        cropped = self.crop_chromatograph(image)
+        return pages
+    
+    def prepare_query_image(
+        self,
+        image: Image.Image = None,
+        pdf_bytes: bytes = None,
+        page_number: int = 0
+    ) -> Image.Image:
+        """
+        Get the cropped query chromatograph from an image or PDF upload
         
-        return cropped
+        Args:
+            image: PIL Image (for image uploads)
+            pdf_bytes: PDF file bytes (for PDF uploads)
+            page_number: Which page to extract from PDF (0-indexed)
+        
+        Returns:
+            Cropped chromatograph image
+        """
+        # Handle PDF input
+        if pdf_bytes is not None:
+            print("📄 Processing PDF...")
+            image = self.extract_from_pdf(pdf_bytes, page_number=page_number)
+            print(f"✅ Extracted and cropped chromatograph from PDF")
+        
+        # Handle image input (crop if it looks like a full page)
+        elif image is not None:
+            # If image is large (likely a full page), try to crop
+            width, height = image.size
+            if height > 800:  # Likely a full page scan
+                print("📸 Cropping chromatograph from image...")
+                image = self.crop_chromatograph(image)
+                print(f"✅ Cropped to chromatograph region")
+        else:
+            raise ValueError("Must provide either image or pdf_bytes")
+        
+        return image
     
     def embed_image(self, image: Image.Image) -> List[float]:
         """
@@ -184,30 +351,101 @@ class VisualSearchEngine:
         
         Args:
             image: PIL Image
-            
+        
         Returns:
             List of floats (512-dim embedding)
         """
-        # Preprocess image
-        image_input = self.preprocess(image).unsqueeze(0).to(self.device)
+        return self.embed_images([image])[0]
+    
+    def embed_images(self, images: List[Image.Image]) -> List[List[float]]:
+        """
+        Generate CLIP embeddings for several images in one forward pass
         
-        # Generate embedding
+        Args:
+            images: List of PIL Images
+        
+        Returns:
+            List of 512-dim embeddings, in the same order as images
+        """
+        # Preprocess images into a single batch
+        image_input = torch.stack([self.preprocess(image) for image in images]).to(self.device)
+        
+        # Generate embeddings
         with torch.no_grad():
-            embedding = self.model.encode_image(image_input)
+            embeddings = self.model.encode_image(image_input)
             # Normalize
-            embedding = embedding / embedding.norm(dim=-1, keepdim=True)
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
             # Convert to list
-            embedding_list = embedding.cpu().numpy()[0].tolist()
+            embedding_lists = embeddings.cpu().numpy().tolist()
+        
+        return embedding_lists
+    
+    def _candidate_image_path(self, result: Dict) -> Path:
+        """Resolve the cropped image file backing a search result"""
+        image_file = result['image_file']
+        if result['source'] == 'main_database':
+            return CROPPED_MAIN_DIR / image_file.replace('main_', '')
+        return CROPPED_REFERENCE_DIR / image_file.replace('reference_', '')
+    
+    def get_candidate_features(self, result: Dict) -> Dict:
+        """
+        Get peak features for a candidate image (cached per image_file)
+        
+        Args:
+            result: Search result dict with 'image_file' and 'source'
+        
+        Returns:
+            Peak features dict from PeakAnalyzer.analyze_image
+        """
+        image_file = result['image_file']
+        features = self.candidate_features_cache.get(image_file)
+        if features is None:
+            result_image = Image.open(self._candidate_image_path(result))
+            features = self.peak_analyzer.analyze_image(result_image)
+            self.candidate_features_cache[image_file] = features
+        return features
+    
+    async def _analyze_in_pool(self, func, *args):
+        """Run a blocking analysis function on the peak thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.peak_executor, func, *args)
+    
+    async def prefetch_candidate_features(self, results: List[Dict]) -> Dict[str, object]:
+        """
+        Analyze candidate peaks in parallel, computing each unique image once
+        
+        Args:
+            results: Search results (may contain duplicates across queries)
+        
+        Returns:
+            Dict of image_file -> features dict, or the Exception raised for it
+        """
+        unique = {}
+        for result in results:
+            unique.setdefault(result['image_file'], result)
         
-        return embedding_list
+        outcomes = await asyncio.gather(
+            *[self._analyze_in_pool(self.get_candidate_features, result) for result in unique.values()],
+            return_exceptions=True
+        )
+        return dict(zip(unique.keys(), outcomes))
     
-    def _image_to_base64(self, image: Image.Image) -> str:
-        """Convert PIL Image to base64 string"""
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_bytes = buffered.getvalue()
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-        return img_base64
+    def get_candidate_payload(self, result: Dict) -> str:
+        """
+        Get the LLM screening payload (image data URL) for a candidate
+        
+        Args:
+            result: Search result dict with 'image_file' and 'source'
+        
+        Returns:
+            Downscaled JPEG data URL
+        """
+        image_file = result['image_file']
+        payload = self.candidate_payloads.get(image_file)
+        if payload is None:
+            payload = encode_image_for_llm(Image.open(self._candidate_image_path(result)))
+            self.candidate_payloads[image_file] = payload
+        return payload
     
     async def llm_compare_chromatographs(self, query_image: Image.Image, candidate_image: Image.Image) -> bool:
         """
@@ -216,14 +454,27 @@ class VisualSearchEngine:
         Args:
             query_image: Query chromatograph (PIL Image)
             candidate_image: Candidate chromatograph (PIL Image)
-            
+        
         Returns:
             True if LLM says they are clinically similar, False otherwise
         """
-        # Encode images to base64
-        query_b64 = self._image_to_base64(query_image)
-        candidate_b64 = self._image_to_base64(candidate_image)
+        return await self._compare_payloads(
+            encode_image_for_llm(query_image),
+            encode_image_for_llm(candidate_image)
+        )
+    
+    async def _compare_payloads(self, query_url: str, candidate_url: str, permissive: bool = True) -> Optional[bool]:
+        """
+        Ask the LLM whether two encoded chromatographs are clinically similar
+        
+        Args:
+            query_url: Query image data URL
+            candidate_url: Candidate image data URL
+            permissive: Accept on request failure (otherwise return None)
         
+        Returns:
+            True if LLM says they are clinically similar, False otherwise
+        """
         # Create comparison prompt
         prompt = """You are a clinical laboratory expert analyzing hemoglobin chromatographs.
 
@@ -252,9 +503,9 @@ Second image is the CANDIDATE (from our database)."""
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{query_b64}"}},
+                    {"type": "image_url", "image_url": {"url": query_url}},
                     {"type": "text", "text": "↑ QUERY image (user uploaded)"},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{candidate_b64}"}},
+                    {"type": "image_url", "image_url": {"url": candidate_url}},
                     {"type": "text", "text": "↑ CANDIDATE image (from database)\n\nAre these clinically similar? Answer YES or NO only:"}
                 ]
             }
@@ -262,191 +513,356 @@ Second image is the CANDIDATE (from our database)."""
         
         # Call OpenRouter vision API
         try:
-            payload = {
-                "model": "openai/gpt-4o",  # GPT-4o supports multiple images
-                "messages": messages,
-                "max_tokens": 10,
-                "temperature": 0.3  # Low temperature for consistent YES/NO
-            }
+            llm_response = await self._screening_request(messages, max_tokens=10)
             
-            async with asyncio.timeout(30):
-                import httpx
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{self.openrouter_client.base_url}/chat/completions",
-                        headers=self.openrouter_client._get_headers(),
-                        json=payload
-                    )
-                    
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    llm_response = data["choices"][0]["message"]["content"].strip().upper()
-                    
-                    # Parse YES/NO
-                    if "YES" in llm_response:
-                        return True
-                    else:
-                        return False
-                    
+            # Parse YES/NO
+            if "YES" in llm_response:
+                return True
+            else:
+                return False
+        
         except Exception as e:
+            if not permissive:
+                print(f"   ⚠️ LLM screening failed: {e}")
+                return None
             print(f"   ⚠️ LLM screening failed: {e}, defaulting to ACCEPT")
             return True  # If LLM fails, don't filter out (permissive fallback)
     
-    def search_similar(
-        self,
-        image: Image.Image = None,
-        pdf_bytes: bytes = None,
-        top_k: int = 10,
-        category_filter: str = None,
-        page_number: int = 0
-    ) -> Tuple[List[Dict], List[float]]:
+    async def _screening_request(self, messages: List[Dict], max_tokens: int) -> str:
         """
-        Search for visually similar chromatographs
+        Send a screening request to the OpenRouter vision model
         
         Args:
-            image: PIL Image to search for (for image uploads)
-            pdf_bytes: PDF file bytes (for PDF uploads)
-            top_k: Number of results to return
-            category_filter: Optional category to filter by (e.g., 'hb_e')
-            page_number: Which page to extract from PDF (0-indexed, default: 0)
-            
+            messages: Chat messages (with image parts)
+            max_tokens: Maximum tokens in the reply
+        
         Returns:
-            Tuple of (results, similarities)
+            Upper-cased reply text
         """
-        # Handle PDF input
-        if pdf_bytes is not None:
-            print("📄 Processing PDF...")
-            image = self.extract_from_pdf(pdf_bytes, page_number=page_number)
-            print(f"✅ Extracted and cropped chromatograph from PDF")
+        llm_response = await self.openrouter_client.chat_completion(
+            messages=messages,
+            model="openai/gpt-4o",  # GPT-4o supports multiple images
+            temperature=0.3,  # Low temperature for consistent YES/NO
+            max_tokens=max_tokens,
+            timeout=30.0,
+            priority=SCREENING  # Queued behind interactive chat and image analysis
+        )
         
-        # Handle image input (crop if it looks like a full page)
-        elif image is not None:
-            # If image is large (likely a full page), try to crop
-            width, height = image.size
-            if height > 800:  # Likely a full page scan
-                print("📸 Cropping chromatograph from image...")
-                image = self.crop_chromatograph(image)
-                print(f"✅ Cropped to chromatograph region")
-        else:
-            raise ValueError("Must provide either image or pdf_bytes")
+        return llm_response.strip().upper()
+    
+    async def llm_compare_batch(self, query_image: Image.Image, candidate_images: List[Image.Image]) -> Optional[List[bool]]:
+        """
+        Use LLM vision model to compare one query against several candidates
         
-        # Embed query image
-        query_embedding = self.embed_image(image)
+        Args:
+            query_image: Query chromatograph (PIL Image)
+            candidate_images: Candidate chromatographs (PIL Images)
+        
+        Returns:
+            One verdict per candidate (True if clinically similar), or None if
+            the reply could not be parsed (caller should fall back to pairwise)
+        """
+        return await self._compare_payloads_batch(
+            encode_image_for_llm(query_image),
+            [encode_image_for_llm(candidate_image) for candidate_image in candidate_images]
+        )
+    
+    async def _compare_payloads_batch(self, query_url: str, candidate_urls: List[str],
+                                      permissive: bool = True) -> Optional[List[bool]]:
+        """
+        Ask the LLM to screen several encoded candidates against one query
+        
+        The query image is sent once, followed by the candidates labeled
+        CANDIDATE 1..K, and the model answers one YES/NO line per candidate.
+        
+        Args:
+            query_url: Query image data URL
+            candidate_urls: Candidate image data URLs
+            permissive: Accept every candidate on request failure (otherwise
+                return None)
+        
+        Returns:
+            One verdict per candidate (True if clinically similar), or None if
+            the reply could not be parsed (caller should fall back to pairwise)
+        """
+        num_candidates = len(candidate_urls)
+        
+        prompt = f"""You are a clinical laboratory expert analyzing hemoglobin chromatographs.
+
+I will show you ONE QUERY chromatograph followed by {num_candidates} CANDIDATE chromatographs (CANDIDATE 1 to CANDIDATE {num_candidates}).
+
+Your task: For EACH candidate, determine if it is clinically SIMILAR enough to the QUERY to be helpful for diagnosis.
+
+Focus on:
+1. **A2 peak height** (usually 2nd peak): Are they comparable? (e.g., both small, or both large)
+2. **F peak height** (if present): Are they similar?
+3. **Overall pattern**: Do they show the same general hemoglobin pattern?
+
+**IMPORTANT RULES:**
+- If the A2 peak is VERY DIFFERENT (e.g., one tiny, one huge), say NO
+- If the overall pattern is clearly different, say NO
+- Small variations are OK, but major differences are NOT
+- Judge each candidate against the QUERY only, independently of the other candidates
+
+**Answer with exactly {num_candidates} lines, one per candidate, in this format:**
+1: YES
+2: NO
+..."""
+        
+        content = [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": query_url}},
+            {"type": "text", "text": "↑ QUERY image (user uploaded)"}
+        ]
+        for i, candidate_url in enumerate(candidate_urls, 1):
+            content.append({"type": "image_url", "image_url": {"url": candidate_url}})
+            content.append({"type": "text", "text": f"↑ CANDIDATE {i} (from database)"})
+        content.append({"type": "text", "text": f"Answer one line per candidate (1 to {num_candidates}), YES or NO only:"})
+        
+        try:
+            llm_response = await self._screening_request(
+                [{"role": "user", "content": content}],
+                max_tokens=8 * num_candidates + 10
+            )
+        except Exception as e:
+            if not permissive:
+                print(f"   ⚠️ Batched LLM screening failed: {e}")
+                return None
+            print(f"   ⚠️ Batched LLM screening failed: {e}, defaulting to ACCEPT")
+            return [True] * num_candidates  # Same permissive fallback as pairwise
+        
+        # Parse "N: YES/NO" lines; every candidate must be answered exactly once
+        verdicts = parse_batch_verdicts(llm_response, num_candidates)
+        if verdicts is None:
+            print(f"   ⚠️ Could not parse batched LLM reply: {llm_response[:80]!r}")
+        return verdicts
+    
+    def _query_collection(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        category_filter: str = None,
+        image_ids: List[str] = None
+    ) -> List[Tuple[List[Dict], List[float]]]:
+        """
+        Query the image collection with one or more embeddings in one call
+        
+        Args:
+            query_embeddings: List of query embeddings
+            n_results: Number of results per query
+            category_filter: Optional category to filter by
+            image_ids: Optional allow-list of image files (e.g. from the numeric index)
+        
+        Returns:
+            List of (results, similarities), one per query embedding
+        """
+        # An empty allow-list cannot match anything - skip the query
+        if image_ids is not None and not image_ids:
+            return [([], []) for _ in query_embeddings]
         
         # Prepare search parameters
         search_kwargs = {
-            'query_embeddings': [query_embedding],
-            'n_results': top_k
+            'query_embeddings': query_embeddings,
+            'n_results': n_results
         }
         
-        # Add category filter if specified
+        # Add category / image filters if specified
+        conditions = []
         if category_filter:
-            search_kwargs['where'] = {'category': category_filter}
+            conditions.append({'category': category_filter})
+        if image_ids is not None:
+            conditions.append({'image_file': {'$in': sorted(image_ids)}})
+        if len(conditions) == 1:
+            search_kwargs['where'] = conditions[0]
+        elif conditions:
+            search_kwargs['where'] = {'$and': conditions}
         
         # Search vector database
         results = self.collection.query(**search_kwargs)
         
         # Extract and format results
-        formatted_results = []
-        similarities = []
-        
-        if results['ids'] and len(results['ids']) > 0:
-            for i in range(len(results['ids'][0])):
-                result_id = results['ids'][0][i]
-                metadata = results['metadatas'][0][i]
-                distance = results['distances'][0][i]
-                
-                # Convert distance to similarity (cosine similarity for ChromaDB)
-                # ChromaDB uses L2 distance by default, but we set cosine in collection
-                # For cosine: distance is actually 1 - similarity, so similarity = 1 - distance
-                # But since we normalized embeddings, let's use 1/(1+distance) for safety
-                similarity = 1.0 / (1.0 + distance)
-                
-                formatted_results.append({
-                    'id': result_id,
-                    'category': metadata.get('category', 'unknown'),
-                    'source': metadata.get('source', 'unknown'),
-                    'system_type': metadata.get('system_type', 'unknown'),
-                    'image_file': metadata.get('image_file', ''),
-                    'page': metadata.get('page', 0),
-                    'original_file': metadata.get('original_file', ''),
-                    'similarity': similarity
-                })
-                
-                similarities.append(similarity)
+        per_query = []
+        for q in range(len(query_embeddings)):
+            formatted_results = []
+            similarities = []
+            
+            if results['ids'] and len(results['ids']) > q:
+                for i in range(len(results['ids'][q])):
+                    result_id = results['ids'][q][i]
+                    metadata = results['metadatas'][q][i]
+                    distance = results['distances'][q][i]
+                    
+                    # Convert distance to similarity (cosine similarity for ChromaDB)
+                    # ChromaDB uses L2 distance by default, but we set cosine in collection
+                    # For cosine: distance is actually 1 - similarity, so similarity = 1 - distance
+                    # But since we normalized embeddings, let's use 1/(1+distance) for safety
+                    similarity = 1.0 / (1.0 + distance)
+                    
+                    formatted_results.append(self._format_result(result_id, metadata, similarity))
+                    similarities.append(similarity)
+            
+            per_query.append((formatted_results, similarities))
         
-        return formatted_results, similarities
+        return per_query
     
-    async def search_similar_with_peaks(
+    @staticmethod
+    def _format_result(result_id: str, metadata: Dict, similarity: float) -> Dict:
+        """Search result dict for a collection item"""
+        return {
+            'id': result_id,
+            'category': metadata.get('category', 'unknown'),
+            'source': metadata.get('source', 'unknown'),
+            'system_type': metadata.get('system_type', 'unknown'),
+            'image_file': metadata.get('image_file', ''),
+            'page': metadata.get('page', 0),
+            'original_file': metadata.get('original_file', ''),
+            'similarity': similarity
+        }
+    
+    def _known_image_search(
         self,
-        image: Image.Image = None,
-        pdf_bytes: bytes = None,
-        top_k: int = 10,
-        clip_weight: float = 0.6,
-        peak_weight: float = 0.4,
+        query_image: Image.Image,
+        n_results: int,
         category_filter: str = None,
-        llm_screen: bool = False,
-        page_number: int = 0
-    ) -> Tuple[List[Dict], List[float], Dict]:
+        numeric_filter: Dict = None
+    ) -> Optional[Tuple[str, List[Dict], List[float], List[float]]]:
         """
-        Search with hybrid CLIP + peak-based similarity
+        Answer a query that is a copy of a library image from the perceptual hash index
         
         Args:
-            image: PIL Image to search for
-            pdf_bytes: PDF file bytes
-            top_k: Number of results
-            clip_weight: Weight for CLIP similarity (0-1)
-            peak_weight: Weight for peak similarity (0-1)
-            category_filter: Optional category filter
-            llm_screen: Enable LLM vision screening (default: False)
-            page_number: Which page to extract from PDF (0-indexed, default: 0)
-            
+            query_image: Cropped query chromatograph
+            n_results: Number of results (the match plus its nearest neighbours)
+            category_filter: Optional category to filter by
+            numeric_filter: Numeric range filter (not supported - skips the fast path)
+        
         Returns:
-            Tuple of (results, hybrid_scores, query_features)
+            Tuple of (matched image_file, results, similarities, stored embedding
+            of the match), or None when the query is not a known image
         """
-        # Get initial CLIP-based results (fetch more for re-ranking)
-        initial_results, clip_similarities = self.search_similar(
-            image=image,
-            pdf_bytes=pdf_bytes,
-            top_k=top_k * 3,  # Get 3x results for re-ranking
-            category_filter=category_filter,
-            page_number=page_number
-        )
+        phash_index = get_phash_index()
+        if phash_index is None or numeric_filter:
+            return None
         
-        # Handle PDF/image input
-        if pdf_bytes is not None:
-            query_image = self.extract_from_pdf(pdf_bytes, page_number=page_number)
-        elif image is not None:
-            width, height = image.size
-            if height > 800:
-                query_image = self.crop_chromatograph(image)
-            else:
-                query_image = image
+        match = phash_index.match(query_image)
+        if match is None:
+            return None
+        image_file, distance = match
         
-        # Analyze query image peaks
-        print("🔬 Analyzing query chromatograph peaks...")
-        query_features = self.peak_analyzer.analyze_image(query_image)
-        print(f"   Found {query_features['num_peaks']} peaks in query | heights={query_features.get('heights')} | A2={query_features.get('a2_concentration')} | F={query_features.get('f_concentration')}")
+        # The match itself first, then its precomputed CLIP neighbours
+        scores = {image_file: 1.0}
+        for other, similarity in phash_index.neighbours.get(image_file, []):
+            scores.setdefault(other, similarity)
+        
+        data = self.collection.get(ids=list(scores), include=["metadatas", "embeddings"])
+        metadatas = dict(zip(data['ids'], data['metadatas']))
+        if image_file not in metadatas:
+            return None  # Hash index is older than the collection
+        
+        results, similarities = [], []
+        for result_id, similarity in scores.items():
+            metadata = metadatas.get(result_id)
+            if metadata is None or (category_filter and metadata.get('category') != category_filter):
+                continue
+            results.append(self._format_result(result_id, metadata, similarity))
+            similarities.append(similarity)
+            if len(results) == n_results:
+                break
+        if not results:
+            return None
+        
+        embedding = data['embeddings'][list(data['ids']).index(image_file)]
+        print(f"🔑 Query matches library image {image_file} ({distance} bits) - using precomputed neighbours")
+        return image_file, results, similarities, [float(x) for x in embedding]
+    
+    def _numeric_image_ids(self, numeric_filter: Dict) -> Optional[List[str]]:
+        """
+        Resolve a numeric range filter to the image files that satisfy it
+        
+        Args:
+            numeric_filter: Ranges from numeric_index.parse_range_query,
+                e.g. {'hba2': (4.0, 8.0)}
+        
+        Returns:
+            Matching image files, or None when there is no filter to apply
+        """
+        if not numeric_filter:
+            return None
+        
+        numeric_index = get_numeric_index()
+        if numeric_index is None:
+            print("⚠️  Numeric index not built - ignoring numeric filter (run src/8_build_numeric_index.py)")
+            return None
+        
+        # Aliases are not in the collection; their canonical image stands in
+        image_ids = sorted({self.canonical_of.get(i, i) for i in numeric_index.image_ids_matching(numeric_filter)})
+        print(f"🔢 Numeric filter {describe_ranges(numeric_filter)}: {len(image_ids)} candidate images")
+        return image_ids
+    
+    def search_similar(
+        self,
+        image: Image.Image = None,
+        pdf_bytes: bytes = None,
+        top_k: int = 10,
+        category_filter: str = None,
+        page_number: int = 0
+    ) -> Tuple[List[Dict], List[float]]:
+        """
+        Search for visually similar chromatographs
+        
+        Args:
+            image: PIL Image to search for (for image uploads)
+            pdf_bytes: PDF file bytes (for PDF uploads)
+            top_k: Number of results to return
+            category_filter: Optional category to filter by (e.g., 'hb_e')
+            page_number: Which page to extract from PDF (0-indexed, default: 0)
+        
+        Returns:
+            Tuple of (results, similarities)
+        """
+        image = self.prepare_query_image(image=image, pdf_bytes=pdf_bytes, page_number=page_number)
+        
+        known = self._known_image_search(image, top_k, category_filter)
+        if known is not None:
+            return known[1], known[2]
+        
+        # Embed query image
+        query_embedding = self.embed_image(image)
+        
+        return self._query_collection([query_embedding], top_k, category_filter)[0]
+    
+    async def _rerank_with_peaks(
+        self,
+        query_features: Dict,
+        initial_results: List[Dict],
+        clip_similarities: List[float],
+        clip_weight: float,
+        peak_weight: float
+    ) -> List[Tuple[Dict, float]]:
+        """
+        Re-rank CLIP results with peak-based similarity
+        
+        Args:
+            query_features: Peak features of the query chromatograph
+            initial_results: CLIP search results
+            clip_similarities: CLIP similarity per result
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+        
+        Returns:
+            List of (result_with_scores, hybrid_score), best first
+        """
+        # Analyze all candidates in parallel (cached candidates return immediately)
+        candidate_features = await self.prefetch_candidate_features(initial_results)
         
-        # Re-rank with peak similarity
-        print("🔄 Re-ranking with peak-based similarity...")
         hybrid_results = []
         
         for result, clip_sim in zip(initial_results, clip_similarities):
-            # Load result image
             image_file = result['image_file']
             
-            # Determine image path
-            if result['source'] == 'main_database':
-                img_path = Path(__file__).parent.parent / "data" / "cropped_images_main" / image_file.replace('main_', '')
-            else:
-                img_path = Path(__file__).parent.parent / "data" / "cropped_images_reference" / image_file.replace('reference_', '')
-            
             try:
-                # Load and analyze result image
-                result_image = Image.open(img_path)
-                result_features = self.peak_analyzer.analyze_image(result_image)
+                result_features = candidate_features[image_file]
+                if isinstance(result_features, Exception):
+                    raise result_features
                 
                 # STEP 1: Permissive filter (catch only extreme outliers)
                 # Let most results through - Step 2 will do strict F%/A2% filtering
@@ -498,71 +914,764 @@ Second image is the CANDIDATE (from our database)."""
         # Sort by hybrid score
         hybrid_results.sort(key=lambda x: x[1], reverse=True)
         
-        # STEP 2: LLM Vision Screening (if enabled)
-        if llm_screen:
-            print("🤖 STEP 2: Applying LLM vision screening...")
-            filtered_results = []
+        return hybrid_results
+    
+    def _local_screen(
+        self,
+        query_embedding: List[float],
+        query_features: Dict,
+        hybrid_results: List[Tuple[Dict, float]],
+        candidates: int
+    ) -> Dict[int, bool]:
+        """
+        Decide the clear-cut candidates without the LLM
+        
+        The expected category comes from the query itself: the pattern
+        classifier's prediction, used only at confidence of at least
+        LOCAL_SCREEN_CONSENSUS (never the vote of the candidates being
+        decided). A candidate is
+        - accepted when its hybrid score is at least LOCAL_SCREEN_ACCEPT_SCORE,
+          it passes the strict clinical filter (2.5x concentration, 3 peaks)
+          and its label is the predicted category
+        - rejected when it fails even a looser filter (5x, 4 peaks), or when
+          its score is at most LOCAL_SCREEN_REJECT_SCORE and it is labeled
+          with another category
+        Everything else is left to the LLM. Without a confident prediction
+        (or classifier) only the loose-filter rejections apply.
+        
+        Args:
+            query_embedding: CLIP embedding of the query chromatograph
+            query_features: Peak features of the query chromatograph
+            hybrid_results: Re-ranked (result, score) pairs, best first
+            candidates: Number of leading results being screened
+        
+        Returns:
+            Dict of rank -> verdict for the candidates decided locally
+        """
+        classifier = get_pattern_classifier()
+        expected = None
+        if classifier is not None and query_embedding is not None:
+            prediction = classifier.predict(query_embedding, query_features)
+            if prediction['confidence'] >= LOCAL_SCREEN_CONSENSUS:
+                expected = prediction['category']
+        
+        verdicts = {}
+        for rank, (result, score) in enumerate(hybrid_results[:candidates]):
+            features = self.candidate_features_cache.get(result['image_file'])
+            if features is None:
+                continue
             
-            # Screen top 2x results with LLM
+            strict_ok, _ = self.peak_analyzer.is_clinically_similar(query_features, features)
+            loose_ok, _ = self.peak_analyzer.is_clinically_similar(
+                query_features, features, max_concentration_ratio=5.0, max_peak_count_diff=4
+            )
+            label = classifier.label_of(result['image_file'], result.get('category')) if classifier else None
+            agrees = expected is not None and label == expected
+            contradicts = expected is not None and label is not None and label != expected
+            
+            if not loose_ok or (score <= LOCAL_SCREEN_REJECT_SCORE and contradicts):
+                verdicts[rank] = False
+            elif strict_ok and agrees and score >= LOCAL_SCREEN_ACCEPT_SCORE:
+                verdicts[rank] = True
+        
+        return verdicts
+    
+    async def _iter_llm_screen(
+        self,
+        query_image: Image.Image,
+        hybrid_results: List[Tuple[Dict, float]],
+        top_k: int,
+        query_features: Dict = None,
+        query_embedding: List[float] = None
+    ) -> AsyncIterator[Tuple[int, bool]]:
+        """
+        Screen re-ranked results with the LLM, yielding verdicts as they arrive
+        
+        With query_features, clear-cut candidates are first decided by the
+        local screening tier (see _local_screen). If a similarity graph has
+        been built, the best-ranked graph member the local tier left open is
+        screened by the LLM as an anchor and, once the LLM confirms it similar,
+        the other candidates inherit its precomputed verdicts. Only the rest go
+        to the LLM. Candidates are screened in rank order, LLM_SCREEN_BATCH_SIZE
+        per request, with at most LLM_SCREEN_CONCURRENCY requests in flight.
+        Screening stops (and outstanding requests are cancelled) as soon as
+        the top_k best-ranked approvals are confirmed, i.e. every candidate
+        ranked above them has a verdict. If the LLM_SCREEN_DEADLINE passes first,
+        unscreened candidates are kept.
+        
+        Args:
+            query_image: Cropped query chromatograph
+            hybrid_results: Re-ranked (result, score) pairs, best first
+            top_k: Number of results wanted (at most top 2x are screened)
+            query_features: Peak features of the query (enables the local tier)
+            query_embedding: CLIP embedding of the query (lets the local tier
+                accept candidates and reject off-category ones)
+        
+        Yields:
+            (rank, verdict) in completion order; verdict is True (keep),
+            False (rejected) or None (candidate image could not be loaded)
+        """
+        def log_verdict(image_file: str, is_similar: bool):
+            if is_similar:
+                print(f"   ✅ LLM APPROVED: {image_file}")
+            else:
+                print(f"   ❌ LLM REJECTED: {image_file}")
+        
+        async def compare_pairwise(rank: int, candidate_url: str, image_file: str) -> Tuple[int, bool]:
             try:
-                tasks = []
-                for result, score in hybrid_results[:top_k * 2]:  # Screen top 2x results
-                    # Load result image
-                    image_file = result['image_file']
-                    if result['source'] == 'main_database':
-                        img_path = Path(__file__).parent.parent / "data" / "cropped_images_main" / image_file.replace('main_', '')
-                    else:
-                        img_path = Path(__file__).parent.parent / "data" / "cropped_images_reference" / image_file.replace('reference_', '')
-                    
-                    try:
-                        result_image = Image.open(img_path)
-                        # Create task for LLM comparison
-                        task = self.llm_compare_chromatographs(query_image, result_image)
-                        tasks.append((result, score, task, image_file))
-                    except Exception as e:
-                        print(f"   ⚠️ Failed to load {image_file}: {e}")
-                        continue
+                is_similar = await self._compare_payloads(query_url, candidate_url)
+            except Exception as e:
+                print(f"   ⚠️ LLM screening failed for {image_file}: {e}, keeping result")
+                return rank, True
+            
+            log_verdict(image_file, is_similar)
+            return rank, is_similar
+        
+        async def compare_group(ranks: List[int]) -> List[Tuple[int, bool]]:
+            outcomes = []
+            loaded = []
+            for rank in ranks:
+                result = candidates[rank][0]
+                image_file = result['image_file']
+                try:
+                    candidate_url = self.candidate_payloads.get(image_file)
+                    if candidate_url is None:
+                        candidate_url = await self._analyze_in_pool(self.get_candidate_payload, result)
+                    loaded.append((rank, candidate_url, image_file))
+                except Exception as e:
+                    print(f"   ⚠️ Failed to load {image_file}: {e}")
+                    outcomes.append((rank, None))
+            
+            verdicts = None
+            if len(loaded) > 1:
+                verdicts = await self._compare_payloads_batch(query_url, [url for _, url, _ in loaded])
+            
+            if verdicts is None:
+                # Pairwise mode (batch size 1, single candidate, or unparseable batch reply)
+                outcomes.extend(await asyncio.gather(*[
+                    compare_pairwise(rank, url, image_file) for rank, url, image_file in loaded
+                ]))
+            else:
+                for (rank, _, image_file), is_similar in zip(loaded, verdicts):
+                    log_verdict(image_file, is_similar)
+                    outcomes.append((rank, is_similar))
+            
+            return outcomes
+        
+        candidates = hybrid_results[:top_k * 2]  # Screen at most top 2x results
+        verdicts: Dict[int, bool] = {}
+        
+        # Ranks [0, confirmed) all have verdicts; approved counts keeps among them
+        confirmed = 0
+        approved = 0
+        
+        def advance() -> bool:
+            """Extend the confirmed prefix; True once top_k results are approved"""
+            nonlocal confirmed, approved
+            while confirmed in verdicts:
+                if verdicts[confirmed]:
+                    approved += 1
+                confirmed += 1
+            return approved >= top_k
+        
+        if LOCAL_SCREEN_ENABLED and query_features is not None:
+            local = self._local_screen(query_embedding, query_features, hybrid_results, len(candidates))
+            if local:
+                accepted = sum(local.values())
+                print(f"   ⚡ Local screening: {accepted} accepted, {len(local) - accepted} rejected, "
+                      f"{len(candidates) - len(local)} left for the LLM")
+            for rank, verdict in sorted(local.items()):
+                verdicts[rank] = verdict
+                yield rank, verdict
+            
+            if advance():
+                print(f"   ⏹️  Top {top_k} confirmed by local screening")
+                return
+        
+        if len(verdicts) == len(candidates):
+            return
+        
+        # Encode the query once for every screening request
+        query_url = await self._analyze_in_pool(encode_image_for_llm, query_image)
+        
+        # The deadline covers anchor screening as well as the batched phase
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LLM_SCREEN_DEADLINE
+        
+        async def screen_anchor(rank: int) -> Optional[bool]:
+            """Strict LLM verdict for an anchor (None on failure or timeout)"""
+            result = candidates[rank][0]
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            try:
+                candidate_url = self.candidate_payloads.get(result['image_file'])
+                if candidate_url is None:
+                    candidate_url = await self._analyze_in_pool(self.get_candidate_payload, result)
+                return await asyncio.wait_for(
+                    self._compare_payloads(query_url, candidate_url, permissive=False), remaining
+                )
+            except asyncio.TimeoutError:
+                print(f"   ⏱️  Anchor screening timed out for {result['image_file']}")
+                return None
+            except Exception as e:
+                print(f"   ⚠️ Anchor screening failed for {result['image_file']}: {e}")
+                return None
+        
+        graph = get_similarity_graph()
+        if graph:
+            # Only an LLM-confirmed anchor may propagate verdicts: ranks decided
+            # by the local tier are heuristic, and failures must not count as YES
+            anchors = [
+                rank for rank in range(len(candidates))
+                if rank not in verdicts and candidates[rank][0]['image_file'] in graph
+            ]
+            for rank in anchors[:SIMILARITY_GRAPH_MAX_ANCHORS]:
+                verdict = await screen_anchor(rank)
+                if verdict is None:
+                    continue  # Left for the batched phase
+                log_verdict(candidates[rank][0]['image_file'], verdict)
+                verdicts[rank] = verdict
+                yield rank, verdict
+                if not verdict:
+                    continue
                 
-                # Run all comparisons in parallel using asyncio.gather
-                results_to_process = await asyncio.gather(*[task for _, _, task, _ in tasks], return_exceptions=True)
+                # Query ~ anchor, so candidates inherit the anchor's verdicts
+                anchor = candidates[rank][0]['image_file']
+                inferred = {}
+                for other in range(len(candidates)):
+                    if other not in verdicts:
+                        verdict = graph.verdict(anchor, candidates[other][0]['image_file'])
+                        if verdict is not None:
+                            inferred[other] = verdict
+                print(f"   🕸️  Anchor {anchor}: inferred {len(inferred)} verdicts from the similarity graph")
+                for other, verdict in sorted(inferred.items()):
+                    verdicts[other] = verdict
+                    yield other, verdict
+                break
+            
+            if advance():
+                print(f"   ⏹️  Top {top_k} confirmed from the similarity graph")
+                return
+        
+        pending = [rank for rank in range(len(candidates)) if rank not in verdicts]
+        batch_size = max(1, LLM_SCREEN_BATCH_SIZE)
+        groups = iter([pending[start:start + batch_size] for start in range(0, len(pending), batch_size)])
+        running: Dict[asyncio.Task, List[int]] = {}
+        
+        def launch():
+            while len(running) < LLM_SCREEN_CONCURRENCY:
+                ranks = next(groups, None)
+                if ranks is None:
+                    return
+                running[asyncio.create_task(compare_group(ranks))] = ranks
+        
+        try:
+            launch()
+            while running:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
                 
-                # Process results
-                for i, (result, score, _, image_file) in enumerate(tasks):
-                    try:
-                        is_similar = results_to_process[i]
-                        if isinstance(is_similar, Exception):
-                            print(f"   ⚠️ LLM screening failed for {image_file}: {is_similar}, keeping result")
-                            filtered_results.append((result, score))
-                        elif is_similar:
-                            print(f"   ✅ LLM APPROVED: {image_file}")
-                            filtered_results.append((result, score))
-                        else:
-                            print(f"   ❌ LLM REJECTED: {image_file}")
-                    except Exception as e:
-                        print(f"   ⚠️ Processing failed for {image_file}: {e}, keeping result")
-                        filtered_results.append((result, score))
+                done, _ = await asyncio.wait(running, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+                    for rank, verdict in task.result():
+                        verdicts[rank] = verdict
+                        yield rank, verdict
                 
+                if advance():
+                    print(f"   ⏹️  Top {top_k} confirmed after {len(verdicts)}/{len(candidates)} LLM verdicts")
+                    return
+                
+                launch()
+            
+            # Deadline reached: keep whatever has not been screened yet
+            undecided = [rank for rank in range(len(candidates)) if rank not in verdicts]
+            if undecided:
+                print(f"   ⏱️  LLM screening deadline reached, keeping {len(undecided)} unscreened results")
+                for rank in undecided:
+                    yield rank, True
+        finally:
+            # Stopped early, hit the deadline, or consumer went away
+            for task in running:
+                task.cancel()
+    
+    async def _llm_screen(
+        self,
+        query_image: Image.Image,
+        hybrid_results: List[Tuple[Dict, float]],
+        top_k: int,
+        query_features: Dict = None,
+        query_embedding: List[float] = None
+    ) -> List[Tuple[Dict, float]]:
+        """
+        Screen re-ranked results with the LLM vision model
+        
+        Args:
+            query_image: Cropped query chromatograph
+            hybrid_results: Re-ranked (result, score) pairs, best first
+            top_k: Number of results wanted
+            query_features: Peak features of the query (enables the local tier)
+            query_embedding: CLIP embedding of the query (see _iter_llm_screen)
+        
+        Returns:
+            LLM-approved (result, score) pairs, best first
+        """
+        try:
+            verdicts = {
+                rank: verdict async for rank, verdict in
+                self._iter_llm_screen(query_image, hybrid_results, top_k, query_features, query_embedding)
+            }
+            filtered_results = [hybrid_results[rank] for rank in sorted(verdicts) if verdicts[rank]]
+        except Exception as e:
+            print(f"   ⚠️ LLM screening failed: {e}, using all results")
+            filtered_results = hybrid_results
+        
+        return filtered_results
+    
+    async def stream_search_with_peaks(
+        self,
+        image: Image.Image = None,
+        pdf_bytes: bytes = None,
+        top_k: int = 10,
+        clip_weight: float = 0.6,
+        peak_weight: float = 0.4,
+        category_filter: str = None,
+        llm_screen: bool = False,
+        page_number: int = 0,
+        numeric_filter: Dict = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Hybrid CLIP + peak search that yields each stage as soon as it is ready
+        
+        Args:
+            image: PIL Image to search for
+            pdf_bytes: PDF file bytes
+            top_k: Number of results
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+            category_filter: Optional category filter
+            llm_screen: Enable LLM vision screening (default: False)
+            page_number: Which page to extract from PDF (0-indexed, default: 0)
+            numeric_filter: Optional HbA2/HbF/... ranges restricting the candidates
+        
+        A query that is a copy of a library image (perceptual hash match) is
+        answered from precomputed neighbours, features and verdicts instead.
+        
+        Yields:
+            Event dicts, in order:
+            - {'event': 'clip', 'results', 'scores', 'query_embedding'}: CLIP-ranked top-k
+            - {'event': 'peaks', 'results', 'scores', 'query_features'}: peak re-ranked top-k
+            - {'event': 'llm', 'rank', 'result', 'score', 'approved'}: one per LLM verdict
+            - {'event': 'done', 'results', 'scores', 'query_features'}: final results
+        """
+        # Extract the query chromatograph once (used for CLIP, peaks and LLM).
+        # Cropping (OCR), hashing, CLIP and the collection query all run in
+        # worker threads so callers' concurrent work (e.g. a vision request)
+        # proceeds meanwhile
+        query_image = await asyncio.to_thread(
+            self.prepare_query_image, image=image, pdf_bytes=pdf_bytes, page_number=page_number
+        )
+        
+        # Copies of library images are answered from precomputed data
+        known = await asyncio.to_thread(self._known_image_search, query_image, top_k * 3, category_filter, numeric_filter)
+        if known is not None and known[0] in self.candidate_features_cache:
+            async for event in self._stream_known_image(known, top_k, clip_weight, peak_weight, llm_screen):
+                yield event
+            return
+        
+        # Get initial CLIP-based results (fetch more for re-ranking)
+        query_embedding = await asyncio.to_thread(self.embed_image, query_image)
+        numeric_ids = await asyncio.to_thread(self._numeric_image_ids, numeric_filter)
+        initial_results, clip_similarities = (await asyncio.to_thread(
+            self._query_collection,
+            [query_embedding],
+            top_k * 3,  # Get 3x results for re-ranking
+            category_filter,
+            numeric_ids
+        ))[0]
+        
+        yield {
+            'event': 'clip',
+            'results': initial_results[:top_k],
+            'scores': clip_similarities[:top_k],
+            'query_embedding': query_embedding
+        }
+        
+        # Analyze query image peaks
+        print("🔬 Analyzing query chromatograph peaks...")
+        query_features = await self._analyze_in_pool(self.peak_analyzer.analyze_image, query_image)
+        print(f"   Found {query_features['num_peaks']} peaks in query | heights={query_features.get('heights')} | A2={query_features.get('a2_concentration')} | F={query_features.get('f_concentration')}")
+        
+        # Re-rank with peak similarity
+        print("🔄 Re-ranking with peak-based similarity...")
+        hybrid_results = await self._rerank_with_peaks(
+            query_features, initial_results, clip_similarities, clip_weight, peak_weight
+        )
+        
+        yield {
+            'event': 'peaks',
+            'results': [r[0] for r in hybrid_results[:top_k]],
+            'scores': [r[1] for r in hybrid_results[:top_k]],
+            'query_features': query_features
+        }
+        
+        # STEP 2: LLM Vision Screening (if enabled)
+        if llm_screen:
+            print("🤖 STEP 2: Applying LLM vision screening...")
+            verdicts = {}
+            try:
+                async for rank, verdict in self._iter_llm_screen(
+                    query_image, hybrid_results, top_k, query_features, query_embedding
+                ):
+                    verdicts[rank] = verdict
+                    if verdict is None:
+                        continue
+                    result, score = hybrid_results[rank]
+                    yield {
+                        'event': 'llm',
+                        'rank': rank,
+                        'result': result,
+                        'score': score,
+                        'approved': verdict
+                    }
+                filtered_results = [hybrid_results[rank] for rank in sorted(verdicts) if verdicts[rank]]
             except Exception as e:
                 print(f"   ⚠️ LLM screening failed: {e}, using all results")
                 filtered_results = hybrid_results
             
             # Take top-k from LLM-approved results
             top_results = filtered_results[:top_k]
-            final_results = [r[0] for r in top_results]
-            final_scores = [r[1] for r in top_results]
             
-            print(f"✅ Re-ranked {len(initial_results)} → LLM screened {len(hybrid_results)} → Approved {len(filtered_results)} → Final {len(final_results)}")
+            print(f"✅ Re-ranked {len(initial_results)} → LLM screened {len(hybrid_results)} → Approved {len(filtered_results)} → Final {len(top_results)}")
         
         else:
             # No LLM screening - just take top-k
             print("⏭️  Skipping LLM screening (disabled)")
             top_results = hybrid_results[:top_k]
-            final_results = [r[0] for r in top_results]
-            final_scores = [r[1] for r in top_results]
             
-            print(f"✅ Re-ranked {len(initial_results)} → Final {len(final_results)}")
+            print(f"✅ Re-ranked {len(initial_results)} → Final {len(top_results)}")
+        
+        yield {
+            'event': 'done',
+            'results': [r[0] for r in top_results],
+            'scores': [r[1] for r in top_results],
+            'query_features': query_features
+        }
+    
+    async def _stream_known_image(
+        self,
+        known: Tuple[str, List[Dict], List[float], List[float]],
+        top_k: int,
+        clip_weight: float,
+        peak_weight: float,
+        llm_screen: bool
+    ) -> AsyncIterator[Dict]:
+        """
+        stream_search_with_peaks events for a query that is a copy of a library image
+        
+        The match's precomputed peak features stand in for the query's, and
+        LLM screening is answered from the similarity graph with the match as
+        anchor (pairs the graph has not screened are kept).
+        
+        Args:
+            known: Result of _known_image_search
+            top_k: Number of results
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+            llm_screen: Apply the precomputed LLM verdicts
+        
+        Yields:
+            Same events as stream_search_with_peaks
+        """
+        image_file, initial_results, clip_similarities, query_embedding = known
+        
+        yield {
+            'event': 'clip',
+            'results': initial_results[:top_k],
+            'scores': clip_similarities[:top_k],
+            'query_embedding': query_embedding
+        }
+        
+        query_features = self.candidate_features_cache[image_file]
+        hybrid_results = await self._rerank_with_peaks(
+            query_features, initial_results, clip_similarities, clip_weight, peak_weight
+        )
+        
+        yield {
+            'event': 'peaks',
+            'results': [r[0] for r in hybrid_results[:top_k]],
+            'scores': [r[1] for r in hybrid_results[:top_k]],
+            'query_features': query_features
+        }
+        
+        top_results = hybrid_results[:top_k]
+        if llm_screen:
+            graph = get_similarity_graph()
+            top_results = []
+            for rank, (result, score) in enumerate(hybrid_results[:top_k * 2]):
+                verdict = graph.verdict(image_file, result['image_file']) if graph else None
+                approved = verdict is not False
+                yield {
+                    'event': 'llm',
+                    'rank': rank,
+                    'result': result,
+                    'score': score,
+                    'approved': approved
+                }
+                if approved:
+                    top_results.append((result, score))
+                    if len(top_results) == top_k:
+                        break
+        
+        print(f"✅ Known image {image_file} → Final {len(top_results)} (no CLIP, peak analysis or LLM calls)")
+        
+        yield {
+            'event': 'done',
+            'results': [r[0] for r in top_results],
+            'scores': [r[1] for r in top_results],
+            'query_features': query_features
+        }
+    
+    async def search_similar_with_peaks(
+        self,
+        image: Image.Image = None,
+        pdf_bytes: bytes = None,
+        top_k: int = 10,
+        clip_weight: float = 0.6,
+        peak_weight: float = 0.4,
+        category_filter: str = None,
+        llm_screen: bool = False,
+        page_number: int = 0,
+        progress: Callable[[str, float], None] = None,
+        numeric_filter: Dict = None
+    ) -> Tuple[List[Dict], List[float], Dict]:
+        """
+        Search with hybrid CLIP + peak-based similarity
+        
+        Args:
+            image: PIL Image to search for
+            pdf_bytes: PDF file bytes
+            top_k: Number of results
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+            category_filter: Optional category filter
+            llm_screen: Enable LLM vision screening (default: False)
+            page_number: Which page to extract from PDF (0-indexed, default: 0)
+            progress: Optional callback(stage, fraction) for long-running callers
+            numeric_filter: Optional HbA2/HbF/... ranges restricting the candidates
+        
+        Returns:
+            Tuple of (results, hybrid_scores, query_features)
+        """
+        if progress is None:
+            progress = lambda stage, fraction: None
+        
+        progress("clip_search", 0.1)
+        async for event in self.stream_search_with_peaks(
+            image=image,
+            pdf_bytes=pdf_bytes,
+            top_k=top_k,
+            clip_weight=clip_weight,
+            peak_weight=peak_weight,
+            category_filter=category_filter,
+            llm_screen=llm_screen,
+            page_number=page_number,
+            numeric_filter=numeric_filter
+        ):
+            if event['event'] == 'clip':
+                progress("peak_analysis", 0.3)
+            elif event['event'] == 'peaks' and llm_screen:
+                progress("llm_screening", 0.6)
+            elif event['event'] == 'done':
+                return event['results'], event['scores'], event['query_features']
+    
+    async def search_similar_multipage(
+        self,
+        pdf_bytes: bytes,
+        top_k: int = 10,
+        clip_weight: float = 0.6,
+        peak_weight: float = 0.4,
+        category_filter: str = None,
+        llm_screen: bool = False,
+        page_numbers: List[int] = None,
+        progress: Callable[[str, float], None] = None,
+        numeric_filter: Dict = None
+    ) -> Dict:
+        """
+        Search every page of a multi-page report in one batched pass
+        
+        The PDF is opened once, all page crops are embedded in a single CLIP
+        forward pass and queried together, query and candidate peaks are
+        analyzed in parallel, and each candidate is analyzed only once even if
+        it is retrieved for several pages.
+        
+        Args:
+            pdf_bytes: PDF file bytes
+            top_k: Number of results per page (and merged)
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+            category_filter: Optional category filter
+            llm_screen: Enable LLM vision screening (default: False)
+            page_numbers: Pages to search (0-indexed, default: all pages)
+            progress: Optional callback(stage, fraction) for long-running callers
+            numeric_filter: Optional HbA2/HbF/... ranges restricting the candidates
+        
+        Returns:
+            Dict with 'pages' (per-page results, scores and query_features)
+            and 'merged' (results and scores across all pages)
+        """
+        if progress is None:
+            progress = lambda stage, fraction: None
+        
+        pages = self.extract_all_from_pdf(pdf_bytes, page_numbers=page_numbers)
+        if not pages:
+            raise ValueError("PDF has no pages to search")
+        
+        page_images = [page_image for _, page_image in pages]
+        
+        # One CLIP forward pass and one collection query for all pages
+        progress("clip_search", 0.1)
+        print(f"🎨 Embedding {len(pages)} pages in one batch...")
+        query_embeddings = self.embed_images(page_images)
+        per_page_initial = self._query_collection(
+            query_embeddings, top_k * 3, category_filter, self._numeric_image_ids(numeric_filter)
+        )
+        
+        # Analyze all query pages and all unique candidates in parallel
+        progress("peak_analysis", 0.3)
+        print("🔬 Analyzing query and candidate peaks in parallel...")
+        all_candidates = [result for results, _ in per_page_initial for result in results]
+        query_features_list, _ = await asyncio.gather(
+            asyncio.gather(*[
+                self._analyze_in_pool(self.peak_analyzer.analyze_image, page_image)
+                for page_image in page_images
+            ]),
+            self.prefetch_candidate_features(all_candidates)
+        )
+        
+        # Re-rank each page (candidate features now come from the cache)
+        per_page_hybrid = await asyncio.gather(*[
+            self._rerank_with_peaks(query_features, initial_results, clip_similarities, clip_weight, peak_weight)
+            for query_features, (initial_results, clip_similarities) in zip(query_features_list, per_page_initial)
+        ])
+        
+        if llm_screen:
+            progress("llm_screening", 0.6)
+            print("🤖 STEP 2: Applying LLM vision screening to all pages...")
+            per_page_hybrid = await asyncio.gather(*[
+                self._llm_screen(page_image, hybrid_results, top_k, query_features, query_embedding)
+                for page_image, hybrid_results, query_features, query_embedding
+                in zip(page_images, per_page_hybrid, query_features_list, query_embeddings)
+            ])
+        
+        page_outputs = []
+        merged = {}
+        for (page_number, _), query_features, hybrid_results in zip(pages, query_features_list, per_page_hybrid):
+            top_results = hybrid_results[:top_k]
+            page_outputs.append({
+                'page_number': page_number,
+                'results': [r[0] for r in top_results],
+                'scores': [r[1] for r in top_results],
+                'query_features': query_features
+            })
+            
+            # Merge: keep each candidate's best score across pages
+            for result, score in top_results:
+                current = merged.get(result['id'])
+                if current is None or score > current[1]:
+                    merged[result['id']] = ({**result, 'matched_page': page_number}, score)
+        
+        merged_results = sorted(merged.values(), key=lambda x: x[1], reverse=True)[:top_k]
+        
+        print(f"✅ Searched {len(pages)} pages → Merged {len(merged)} unique → Final {len(merged_results)}")
+        
+        return {
+            'pages': page_outputs,
+            'merged': {
+                'results': [r[0] for r in merged_results],
+                'scores': [r[1] for r in merged_results]
+            }
+        }
+    
+    async def search_batch(
+        self,
+        queries: Iterable[Tuple[str, Image.Image]],
+        top_k: int = 10,
+        clip_weight: float = 0.6,
+        peak_weight: float = 0.4,
+        category_filter: str = None,
+        llm_screen: bool = False,
+        batch_size: int = 32
+    ) -> AsyncIterator[Dict]:
+        """
+        Search many query chromatographs, yielding results as each batch finishes
+        
+        Queries are consumed lazily in batches: each batch is embedded in one
+        CLIP forward pass and one collection query, query and candidate peaks
+        are analyzed in parallel, and candidate features are shared across the
+        whole run through the candidate feature cache. Only one batch of images
+        is held in memory at a time. Pulling a batch (which runs the caller's
+        decoding, e.g. PDF rendering and cropping), CLIP and the collection
+        query all run in worker threads, off the event loop.
         
-        return final_results, final_scores, query_features
+        Args:
+            queries: Iterable of (query_id, cropped chromatograph image)
+            top_k: Number of results per query
+            clip_weight: Weight for CLIP similarity (0-1)
+            peak_weight: Weight for peak similarity (0-1)
+            category_filter: Optional category filter
+            llm_screen: Enable LLM vision screening (default: False)
+            batch_size: Number of queries embedded per CLIP forward pass
+        
+        Yields:
+            Dict with 'query_id', 'results', 'scores' and 'query_features'
+        """
+        query_iter = iter(queries)
+        
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(query_iter, batch_size))
+            if not batch:
+                break
+            
+            query_ids = [query_id for query_id, _ in batch]
+            query_images = [query_image for _, query_image in batch]
+            
+            query_embeddings = await asyncio.to_thread(self.embed_images, query_images)
+            per_query_initial = await asyncio.to_thread(
+                self._query_collection, query_embeddings, top_k * 3, category_filter
+            )
+            
+            all_candidates = [result for results, _ in per_query_initial for result in results]
+            query_features_list, _ = await asyncio.gather(
+                asyncio.gather(*[
+                    self._analyze_in_pool(self.peak_analyzer.analyze_image, query_image)
+                    for query_image in query_images
+                ]),
+                self.prefetch_candidate_features(all_candidates)
+            )
+            
+            per_query_hybrid = await asyncio.gather(*[
+                self._rerank_with_peaks(query_features, initial_results, clip_similarities, clip_weight, peak_weight)
+                for query_features, (initial_results, clip_similarities) in zip(query_features_list, per_query_initial)
+            ])
+            
+            if llm_screen:
+                per_query_hybrid = await asyncio.gather(*[
+                    self._llm_screen(query_image, hybrid_results, top_k, query_features, query_embedding)
+                    for query_image, hybrid_results, query_features, query_embedding
+                    in zip(query_images, per_query_hybrid, query_features_list, query_embeddings)
+                ])
+            
+            for query_id, query_features, hybrid_results in zip(query_ids, query_features_list, per_query_hybrid):
+                top_results = hybrid_results[:top_k]
+                yield {
+                    'query_id': query_id,
+                    'results': [r[0] for r in top_results],
+                    'scores': [r[1] for r in top_results],
+                    'query_features': query_features
+                }
     
     def format_search_results(
         self,
@@ -0,0 +1,24 @@
+"""
+Shared test fixtures
+"""
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+
+def draw_chromatograph(peaks, size=(600, 400)):
+    """Synthetic chromatograph: Gaussian peaks at (position, height, width)"""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    x = np.arange(size[0])
+    trace = sum(height * np.exp(-((x - position) / width) ** 2) for position, height, width in peaks)
+    points = [(int(i), int(size[1] - 20 - y)) for i, y in zip(x, trace)]
+    draw.line(points, fill="black", width=3)
+    return image
+
+
+@pytest.fixture
+def make_chromatograph():
+    """Factory for synthetic chromatograph images (see draw_chromatograph)"""
+    return draw_chromatograph
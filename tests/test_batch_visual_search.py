@@ -0,0 +1,71 @@
+"""
+Test batch visual search query loading
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+for module in ("torch", "open_clip", "chromadb", "fitz", "pytesseract", "openai"):
+    pytest.importorskip(module)
+
+import fitz
+from PIL import Image
+from visual_search import VisualSearchEngine
+from batch_visual_search import iter_queries
+
+
+def make_engine():
+    """Engine whose page rendering returns a placeholder image tagged with the page number"""
+    engine = VisualSearchEngine.__new__(VisualSearchEngine)
+    engine._render_page = lambda page: Image.new('RGB', (10 + page.number, 10))
+    return engine
+
+
+def write_pdf(path: Path, pages: int) -> Path:
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    path.write_bytes(doc.tobytes())
+    doc.close()
+    return path
+
+
+def test_page_out_of_range_is_an_error(tmp_path):
+    """Test a missing page is reported for that file instead of falling back to page 0"""
+    engine = make_engine()
+    short = write_pdf(tmp_path / "short.pdf", pages=2)
+    long = write_pdf(tmp_path / "long.pdf", pages=6)
+    
+    errors = []
+    queries = list(iter_queries(engine, [short, long], page_number=4, errors=errors))
+    
+    assert [query_id for query_id, _ in queries] == [f"{long}#page5"]
+    assert queries[0][1].size == (14, 10)
+    assert errors == [(str(short), "Page 5 out of range (PDF has 2 pages)")]
+
+
+def test_strict_extraction(tmp_path):
+    """Test interactive extraction still falls back to page 0 unless strict"""
+    engine = make_engine()
+    pdf_bytes = write_pdf(tmp_path / "report.pdf", pages=1).read_bytes()
+    
+    assert engine.extract_from_pdf(pdf_bytes, page_number=3).size == (10, 10)
+    with pytest.raises(ValueError, match="out of range"):
+        engine.extract_from_pdf(pdf_bytes, page_number=3, strict=True)
+
+
+def test_images_go_through_prepare_query_image(tmp_path):
+    """Test image reports are loaded through the public prepare_query_image"""
+    engine = make_engine()
+    path = tmp_path / "report.png"
+    Image.new('RGB', (200, 100)).save(path)
+    
+    queries = list(iter_queries(engine, [path]))
+    
+    assert [query_id for query_id, _ in queries] == [str(path)]
+    assert queries[0][1].size == (200, 100)
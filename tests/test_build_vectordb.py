@@ -0,0 +1,92 @@
+"""
+Test incremental text index building
+"""
+
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+import build_vectordb
+from build_vectordb import chunk_text, chunk_id, encode_adaptive, build_vector_database
+
+
+class StubModel:
+    """Embedding model returning length-based vectors and recording every batch"""
+    
+    batches = []
+    
+    def __init__(self, *args, **kwargs):
+        pass
+    
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        StubModel.batches.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype=np.float32)
+
+
+def make_pages(page_2="HbE trait shows an elevated A2 window. " * 40):
+    """Three pages of text, page 2 replaceable"""
+    return [
+        {"page": 1, "text": "Normal adult pattern with HbA and a small A2 peak. " * 40},
+        {"page": 2, "text": page_2},
+        {"page": 3, "text": "Beta thalassemia major has high HbF and little HbA. " * 40}
+    ]
+
+
+def test_chunk_ids_are_stable():
+    """Test identical text yields identical ids, and edits only change that page's ids"""
+    first = [chunk_id(chunk) for chunk in chunk_text(make_pages())]
+    again = [chunk_id(chunk) for chunk in chunk_text(make_pages())]
+    edited = chunk_text(make_pages(page_2="Hb Q Thailand elutes in the S window. " * 40))
+    
+    assert first == again
+    assert len(set(first)) == len(first)
+    unchanged = {chunk_id(chunk) for chunk in edited if chunk["metadata"]["page"] != 2}
+    assert unchanged == {key for key in first if not key.startswith("p2_")}
+    assert not {chunk_id(chunk) for chunk in edited if chunk["metadata"]["page"] == 2} & set(first)
+
+
+def test_editing_one_page_touches_only_its_chunks(tmp_path, monkeypatch):
+    """Test a rebuild after editing page 2 embeds, upserts and deletes only page 2 chunks"""
+    monkeypatch.setattr(build_vectordb, "SentenceTransformer", StubModel)
+    chunks = chunk_text(make_pages())
+    page_2 = [chunk for chunk in chunks if chunk["metadata"]["page"] == 2]
+    
+    collection, stats = build_vector_database(chunks, str(tmp_path), "test_patterns")
+    assert stats == {"added": len(chunks), "deleted": 0, "unchanged": 0}
+    
+    StubModel.batches = []
+    edited = chunk_text(make_pages(page_2="Hb Q Thailand elutes in the S window. " * 40))
+    new_page_2 = [chunk for chunk in edited if chunk["metadata"]["page"] == 2]
+    collection, stats = build_vector_database(edited, str(tmp_path), "test_patterns")
+    
+    assert stats == {"added": len(new_page_2), "deleted": len(page_2), "unchanged": len(chunks) - len(page_2)}
+    encoded = [text for batch in StubModel.batches for text in batch]
+    assert sorted(encoded) == sorted(chunk["text"] for chunk in new_page_2)
+    assert set(collection.get(include=[])["ids"]) == {chunk_id(chunk) for chunk in edited}
+    
+    # Nothing changed: nothing is embedded
+    StubModel.batches = []
+    _, stats = build_vector_database(edited, str(tmp_path), "test_patterns")
+    assert stats["added"] == stats["deleted"] == 0 and StubModel.batches == []
+
+
+def test_encode_adaptive_respects_token_budget(monkeypatch):
+    """Test every batch's padded cost (size x longest text) fits the budget"""
+    monkeypatch.setattr(build_vectordb, "ENCODE_BATCH_TOKENS", 4000)
+    StubModel.batches = []
+    rng = np.random.default_rng(0)
+    texts = ["x" * int(length) for length in rng.integers(40, 4000, size=300)]
+    
+    embeddings = encode_adaptive(StubModel(), texts)
+    
+    assert [vector[0] for vector in embeddings] == [len(text) for text in texts]  # Original order
+    for batch in StubModel.batches:
+        padded = len(batch) * max(len(text) // 4 for text in batch)
+        assert padded <= 4000 or len(batch) <= build_vectordb.ENCODE_BATCH_MIN
@@ -0,0 +1,115 @@
+"""
+Test chat session compaction
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from chat_sessions import ChatSessionStore
+
+
+class FakeClient:
+    """Summarizer that answers when released (or fails if told to)"""
+    
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = []
+        self.release = asyncio.Event()
+    
+    async def chat_completion(self, messages, **kwargs):
+        self.calls.append(messages[-1]["content"])
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return f"summary #{len(self.calls)} "
+
+
+def record_turns(store, session, start, count):
+    """Record count exchanges numbered from start"""
+    for i in range(start, start + count):
+        store.record(session, f"question {i}", f"answer {i}")
+
+
+def test_compaction_races_new_turns():
+    """Test turns recorded while a summary is running are kept, in order"""
+    async def run():
+        client = FakeClient()
+        store = ChatSessionStore(client=client, window=4, slack=2)
+        session = store.get_or_create("s1")
+        
+        record_turns(store, session, 0, 3)  # 6 messages: overflow 2 starts a compaction
+        compaction = session.compaction
+        assert compaction is not None
+        
+        await asyncio.sleep(0)
+        record_turns(store, session, 3, 2)  # Recorded while the summary is in flight
+        assert session.compaction is compaction  # No second compaction meanwhile
+        
+        client.release.set()
+        await compaction
+        
+        assert session.summary == "summary #1"
+        assert session.summarized_messages == 2
+        assert "question 0" in client.calls[0] and "question 1" not in client.calls[0]
+        assert [turn["content"] for turn in session.turns[::2]] == [f"question {i}" for i in range(1, 5)]
+        
+        history = session.history()
+        assert history[0]["role"] == "system" and "summary #1" in history[0]["content"]
+        assert history[1] == {"role": "user", "content": "question 1"}
+    
+    asyncio.run(run())
+
+
+def test_next_exchange_compacts_again():
+    """Test the window overflow left after a compaction triggers the next one"""
+    async def run():
+        client = FakeClient()
+        client.release.set()
+        store = ChatSessionStore(client=client, window=4, slack=2)
+        session = store.get_or_create("s1")
+        
+        record_turns(store, session, 0, 3)
+        await session.compaction
+        record_turns(store, session, 3, 1)
+        await session.compaction
+        
+        assert store.compactions == 2
+        assert "summary #1" in client.calls[1]  # Existing summary is merged
+        assert len(session.turns) == 4
+    
+    asyncio.run(run())
+
+
+def test_failed_compaction_keeps_turns():
+    """Test a failed summary leaves every turn verbatim"""
+    async def run():
+        client = FakeClient(fail=True)
+        client.release.set()
+        store = ChatSessionStore(client=client, window=4, slack=2)
+        session = store.get_or_create("s1")
+        
+        record_turns(store, session, 0, 3)
+        await session.compaction
+        
+        assert session.summary == ""
+        assert len(session.turns) == 6
+        assert store.stats()["compaction_failures"] == 1
+    
+    asyncio.run(run())
+
+
+def test_session_lru_and_delete():
+    """Test the oldest session is evicted over max_sessions"""
+    store = ChatSessionStore(client=FakeClient(), max_sessions=2)
+    store.get_or_create("a")
+    store.get_or_create("b")
+    store.get("a")
+    store.get_or_create("c")
+    
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.delete("c") and store.get("c") is None
@@ -0,0 +1,96 @@
+"""
+Test token-budgeted context building
+"""
+
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from context_builder import allocate_budget, merge_chunks, dedupe_passages, build_context, MIN_PASSAGE_TOKENS
+
+
+PAGE_TEXT = " ".join(f"HbE trait case {i} shows an elevated A2 window with HbF {i % 7}.0%." for i in range(60))
+
+
+def chunk(start, end, page=1):
+    """Chunk of PAGE_TEXT with the metadata build_vectordb stores"""
+    return PAGE_TEXT[start:end], {"page": page, "char_start": start, "char_end": end}
+
+
+def test_allocate_budget_fits():
+    """Test passages that fit the budget keep their full size"""
+    assert allocate_budget([100, 200], 500) == [100, 200]
+
+
+def test_allocate_budget_water_filling():
+    """Test short passages keep their size and long ones split the rest"""
+    allocation = allocate_budget([50, 400, 400], 450)
+    
+    assert allocation == [50, 200, 200]
+    assert sum(allocation) <= 450
+
+
+def test_allocate_budget_drops_tail():
+    """Test passages that cannot get MIN_PASSAGE_TOKENS are dropped from the end"""
+    budget = 3 * MIN_PASSAGE_TOKENS
+    allocation = allocate_budget([500, 500, 500, 500], budget)
+    
+    assert allocation == [MIN_PASSAGE_TOKENS] * 3 + [0]
+
+
+def test_allocate_budget_empty():
+    """Test nothing is allocated without passages or budget"""
+    assert allocate_budget([], 100) == []
+    assert allocate_budget([100, 100], 0) == [0, 0]
+
+
+def test_merge_overlapping_chunks():
+    """Test overlapping chunks of a page are joined without repeating the seam"""
+    (first, first_meta), (second, second_meta) = chunk(0, 1000), chunk(800, 1800)
+    
+    passages = merge_chunks([second, first], [second_meta, first_meta], [0.9, 0.5])
+    
+    assert len(passages) == 1
+    assert passages[0]["text"] == PAGE_TEXT[:1800]
+    assert passages[0]["similarity"] == 0.9
+
+
+def test_merge_keeps_distant_chunks_and_pages_apart():
+    """Test chunks with a gap, or on other pages, stay separate passages"""
+    documents, metadatas = zip(chunk(0, 500), chunk(1500, 2000), chunk(0, 500, page=2))
+    
+    passages = merge_chunks(list(documents), list(metadatas), [0.4, 0.8, 0.6])
+    
+    assert [(p["page"], p["similarity"]) for p in passages] == [(1, 0.8), (2, 0.6), (1, 0.4)]
+
+
+def test_merge_adjacent_chunks_without_overlap():
+    """Test touching chunks are concatenated at the seam"""
+    documents, metadatas = zip(chunk(0, 500), chunk(500, 1000))
+    
+    passages = merge_chunks(list(documents), list(metadatas), [0.5, 0.5])
+    
+    assert len(passages) == 1
+    assert passages[0]["text"] == PAGE_TEXT[:500] + "\n" + PAGE_TEXT[500:1000]
+
+
+def test_dedupe_contained_passages():
+    """Test a passage contained in a better-ranked one is dropped"""
+    passages = [
+        {"text": "HbE trait with  elevated A2", "similarity": 0.9},
+        {"text": "elevated A2", "similarity": 0.5}
+    ]
+    assert len(dedupe_passages(passages)) == 1
+
+
+def test_build_context_respects_budget():
+    """Test the built context stays within the token budget"""
+    documents, metadatas = zip(chunk(0, 2000), chunk(2500, 4000, page=2))
+    
+    built = build_context(list(documents), list(metadatas), [0.8, 0.7], max_tokens=200)
+    
+    assert built["tokens"] <= 200
+    assert [p["page"] for p in built["passages"]] == [1, 2]
+    assert built["context"].startswith("[Source 1 - Page 1")
@@ -0,0 +1,75 @@
+"""
+Test hybrid BM25 + dense text index
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from hybrid_index import HybridTextIndex, tokenize
+
+
+def make_index():
+    """Small index with random embeddings"""
+    documents = [
+        "HbE trait with elevated A2 window and normal HbF",
+        "Hb Q Thailand variant eluting in the S window",
+        "Constant Spring detected on capillary electrophoresis",
+        "Beta thalassemia major with high HbF and low HbA"
+    ]
+    metadatas = [{"page": i + 1} for i in range(len(documents))]
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(len(documents), 8)).astype(np.float32)
+    return HybridTextIndex([f"doc_{i}" for i in range(len(documents))], documents, metadatas, embeddings)
+
+
+def test_tokenize():
+    """Test tokenization keeps analyte names as single tokens"""
+    assert tokenize("Elevated HbA2 (%)") == ["elevated", "hba2"]
+    assert tokenize("Hb Q Thailand") == ["hb", "q", "thailand"]
+
+
+def test_keyword_query_ranks_first():
+    """Test a rare keyword wins even with an unrelated query embedding"""
+    index = make_index()
+    query_embedding = index.embeddings[0]  # Dense ranking favors document 0
+    
+    hits = index.search("Hb Q Thailand", query_embedding, top_k=2)
+    
+    assert hits[0][0] == 1
+    assert hits[0][3] > 0
+
+
+def test_dense_matches_l2_similarity():
+    """Test dense scores use the same 1 / (1 + L2) scale as Chroma"""
+    index = make_index()
+    query = index.embeddings[2] + 0.1
+    
+    expected = 1.0 / (1.0 + np.linalg.norm(index.embeddings - query, axis=1))
+    
+    assert np.allclose(index.dense_scores(query), expected, atol=1e-5)
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test save/load preserves search results"""
+    index = make_index()
+    path = tmp_path / "hybrid.npz"
+    index.save(path)
+    
+    loaded = HybridTextIndex.load(path)
+    
+    query = index.embeddings[3]
+    assert loaded.ids == index.ids
+    assert loaded.search("high HbF", query) == index.search("high HbF", query)
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_keyword_query_ranks_first()
+    test_dense_matches_l2_similarity()
+    test_snapshot_round_trip(Path(tempfile.mkdtemp()))
+    print("✅ Hybrid index tests passed")
@@ -0,0 +1,207 @@
+"""
+Test the SQLite-backed background job queue
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from job_queue import JobManager, QUEUED, RUNNING, SUCCEEDED, FAILED, FINISHED_STATES
+
+
+async def wait_finished(manager, job_id, timeout=2.0):
+    """Poll a job until it succeeds or fails"""
+    async def poll():
+        while True:
+            job = manager.get(job_id)
+            if job["status"] in FINISHED_STATES:
+                return job
+            await asyncio.sleep(0.005)
+    return await asyncio.wait_for(poll(), timeout)
+
+
+async def echo(params, payload, progress):
+    progress("working", 0.5)
+    return {"params": params, "size": len(payload or b"")}
+
+
+async def fail(params, payload, progress):
+    raise RuntimeError("boom")
+
+
+def test_identical_submissions_share_a_job(tmp_path):
+    """Test submissions are deduplicated by kind, params and payload"""
+    async def run():
+        manager = JobManager(db_path=str(tmp_path / "jobs.db"))
+        manager.register("echo", echo)
+        await manager.start()
+        try:
+            first = manager.submit("echo", {"top_k": 5}, b"image")
+            assert manager.submit("echo", {"top_k": 5}, b"image")["job_id"] == first["job_id"]
+            assert manager.submit("echo", {"top_k": 6}, b"image")["job_id"] != first["job_id"]
+            assert manager.submit("echo", {"top_k": 5}, b"other")["job_id"] != first["job_id"]
+            
+            job = await wait_finished(manager, first["job_id"])
+            assert job["status"] == SUCCEEDED
+            assert job["result"] == {"params": {"top_k": 5}, "size": 5}
+            
+            # A finished, unexpired job is the cached answer
+            assert manager.submit("echo", {"top_k": 5}, b"image")["job_id"] == first["job_id"]
+        finally:
+            await manager.stop()
+    
+    asyncio.run(run())
+
+
+def test_failed_jobs_are_not_reused(tmp_path):
+    """Test resubmitting after a failure starts a new job"""
+    async def run():
+        manager = JobManager(db_path=str(tmp_path / "jobs.db"))
+        manager.register("fail", fail)
+        await manager.start()
+        try:
+            first = manager.submit("fail", {"n": 1})
+            job = await wait_finished(manager, first["job_id"])
+            assert job["status"] == FAILED
+            assert job["error"] == "boom"
+            
+            second = manager.submit("fail", {"n": 1})
+            assert second["job_id"] != first["job_id"]
+        finally:
+            await manager.stop()
+    
+    asyncio.run(run())
+
+
+def test_interrupted_jobs_resume_on_start(tmp_path):
+    """Test jobs left queued or running by a stopped process run on the next start"""
+    db_path = str(tmp_path / "jobs.db")
+    
+    async def hang(params, payload, progress):
+        await asyncio.sleep(60)
+    
+    async def first_process():
+        manager = JobManager(db_path=db_path, max_workers=1)
+        manager.register("echo", hang)
+        await manager.start()
+        running = manager.submit("echo", {"n": 1})
+        queued = manager.submit("echo", {"n": 2})
+        await asyncio.sleep(0.05)
+        assert manager.get(running["job_id"])["status"] == RUNNING
+        assert manager.get(queued["job_id"])["status"] == QUEUED
+        await manager.stop()
+        return running["job_id"], queued["job_id"]
+    
+    async def second_process(job_ids):
+        manager = JobManager(db_path=db_path, max_workers=1)
+        manager.register("echo", echo)
+        await manager.start()
+        try:
+            for job_id in job_ids:
+                job = await wait_finished(manager, job_id)
+                assert job["status"] == SUCCEEDED
+        finally:
+            await manager.stop()
+    
+    job_ids = asyncio.run(first_process())
+    asyncio.run(second_process(job_ids))
+
+
+def test_expired_results_are_purged(tmp_path):
+    """Test finished jobs older than the TTL disappear and are not reused"""
+    async def run():
+        manager = JobManager(db_path=str(tmp_path / "jobs.db"), result_ttl=60)
+        manager.register("echo", echo)
+        await manager.start()
+        try:
+            first = manager.submit("echo", {"n": 1})
+            await wait_finished(manager, first["job_id"])
+            
+            # Age the result past the TTL
+            manager.db.execute("UPDATE jobs SET finished_at = finished_at - 120 WHERE id = ?", (first["job_id"],))
+            manager.db.commit()
+            
+            second = manager.submit("echo", {"n": 1})
+            assert second["job_id"] != first["job_id"]
+            assert manager.get(first["job_id"]) is None
+            count = manager.db.execute("SELECT COUNT(*) FROM jobs WHERE id = ?", (first["job_id"],)).fetchone()[0]
+            assert count == 0
+        finally:
+            await manager.stop()
+    
+    asyncio.run(run())
+
+
+def test_subscribe_ends_on_finished_state(tmp_path):
+    """Test subscribers see progress updates and the stream ends when the job finishes"""
+    async def run():
+        manager = JobManager(db_path=str(tmp_path / "jobs.db"))
+        release = asyncio.Event()
+        
+        async def gated(params, payload, progress):
+            await release.wait()
+            progress("working", 0.5)
+            return {"ok": True}
+        
+        manager.register("gated", gated)
+        await manager.start()
+        try:
+            job = manager.submit("gated", {})
+            
+            async def collect():
+                return [update async for update in manager.subscribe(job["job_id"])]
+            
+            subscriber = asyncio.create_task(collect())
+            await asyncio.sleep(0.02)
+            release.set()
+            updates = await asyncio.wait_for(subscriber, 2.0)
+            
+            assert updates[-1]["status"] == SUCCEEDED
+            assert [u["status"] for u in updates].count(SUCCEEDED) == 1
+            assert any(u["stage"] == "working" and u["progress"] == 0.5 for u in updates)
+            assert job["job_id"] not in manager.subscribers
+            
+            # A finished job yields its final state once
+            replay = [update async for update in manager.subscribe(job["job_id"])]
+            assert [u["status"] for u in replay] == [SUCCEEDED]
+        finally:
+            await manager.stop()
+    
+    asyncio.run(run())
+
+
+def test_exclusive_kind_runs_one_at_a_time(tmp_path):
+    """Test jobs of an exclusive kind never overlap, while other kinds still run concurrently"""
+    async def run():
+        manager = JobManager(db_path=str(tmp_path / "jobs.db"), max_workers=2)
+        active = {"rebuild": 0, "search": 0}
+        peak = {"rebuild": 0, "search": 0}
+        
+        def tracked(kind):
+            async def handler(params, payload, progress):
+                active[kind] += 1
+                peak[kind] = max(peak[kind], active[kind])
+                await asyncio.sleep(0.05)
+                active[kind] -= 1
+                return {}
+            return handler
+        
+        manager.register("rebuild", tracked("rebuild"), exclusive=True)
+        manager.register("search", tracked("search"))
+        await manager.start()
+        try:
+            rebuilds = [manager.submit("rebuild", {"n": n}) for n in range(2)]
+            for job in rebuilds:
+                assert (await wait_finished(manager, job["job_id"]))["status"] == SUCCEEDED
+            searches = [manager.submit("search", {"n": n}) for n in range(2)]
+            for job in searches:
+                assert (await wait_finished(manager, job["job_id"]))["status"] == SUCCEEDED
+        finally:
+            await manager.stop()
+        
+        assert peak == {"rebuild": 1, "search": 2}
+    
+    asyncio.run(run())
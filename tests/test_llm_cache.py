@@ -0,0 +1,85 @@
+"""
+Test LLM response cache
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from llm_cache import ResponseCache, make_cache_key
+
+
+def make_cache(tmp_path, **kwargs):
+    """Cache in a fresh temporary database"""
+    return ResponseCache(db_path=str(tmp_path / "llm_cache.db"), **kwargs)
+
+
+def test_cache_key_is_canonical():
+    """Test key order does not change the key, but any parameter does"""
+    messages = [{"role": "user", "content": "Hi"}]
+    reordered = [{"content": "Hi", "role": "user"}]
+    
+    assert make_cache_key("m", messages, 0.0, 10) == make_cache_key("m", reordered, 0.0, 10)
+    assert make_cache_key("m", messages, 0.0, 10) != make_cache_key("m", messages, 0.0, 11)
+    assert make_cache_key("m", messages, 0.0, 10) != make_cache_key("other", messages, 0.0, 10)
+
+
+def test_put_get(tmp_path):
+    """Test a stored response is returned and counted as a hit"""
+    cache = make_cache(tmp_path)
+    assert cache.get("a") is None
+    
+    cache.put("a", "m", "answer")
+    
+    assert cache.get("a") == "answer"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_expiry(tmp_path):
+    """Test responses older than the TTL are dropped"""
+    cache = make_cache(tmp_path, ttl=0.05)
+    cache.put("a", "m", "answer")
+    time.sleep(0.1)
+    
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_entries(tmp_path):
+    """Test the least recently used entry is evicted over max_entries"""
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("a", "m", "1")
+    time.sleep(0.01)
+    cache.put("b", "m", "2")
+    time.sleep(0.01)
+    cache.get("a")  # "b" is now least recently used
+    time.sleep(0.01)
+    cache.put("c", "m", "3")
+    
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    """Test old entries are evicted until the total size fits max_bytes"""
+    cache = make_cache(tmp_path, max_bytes=10)
+    cache.put("a", "m", "x" * 6)
+    time.sleep(0.01)
+    cache.put("b", "m", "y" * 6)
+    
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+    assert cache.stats()["bytes"] == 6
+
+
+def test_clear(tmp_path):
+    """Test clear removes every entry"""
+    cache = make_cache(tmp_path)
+    cache.put("a", "m", "1")
+    cache.clear()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,47 @@
+"""
+Test LLM screening payloads and batched reply parsing
+"""
+
+import base64
+import io
+import sys
+from pathlib import Path
+import pytest
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from llm_payloads import encode_image_for_llm, parse_batch_verdicts
+
+
+BATCH_REPLIES = [
+    ("1: YES\n2: NO\n3: YES", 3, [True, False, True]),
+    ("CANDIDATE 1: NO\nCANDIDATE 2: **YES**", 2, [False, True]),
+    ("**Candidate 1**: Yes\n**Candidate 2**: no", 2, [True, False]),
+    ("1) yes 2) no", 2, [True, False]),
+    ("Candidate #2 - NO\nCandidate #1 - YES", 2, [True, False]),
+    ("1: YES\n1: YES\n2: NO", 2, [True, False]),  # Repeated but consistent
+    # Unusable replies fall back to pairwise screening
+    ("1: YES\n2: NO", 3, None),                   # Candidate missing
+    ("1: YES\n1: NO\n2: NO", 2, None),             # Contradiction
+    ("1: YES\n2: NO\n3: YES", 2, None),            # Unknown candidate
+    ("Both look similar.", 2, None),
+]
+
+
+@pytest.mark.parametrize("reply, num_candidates, expected", BATCH_REPLIES)
+def test_parse_batch_verdicts(reply, num_candidates, expected):
+    """Test each reply parses to the expected verdicts"""
+    assert parse_batch_verdicts(reply, num_candidates) == expected
+
+
+def test_encode_image_downscales_to_grayscale_jpeg():
+    """Test payloads are downscaled grayscale JPEG data URLs"""
+    url = encode_image_for_llm(Image.new("RGB", (2000, 500), "white"), max_side=1000)
+    
+    prefix = "data:image/jpeg;base64,"
+    assert url.startswith(prefix)
+    image = Image.open(io.BytesIO(base64.b64decode(url[len(prefix):])))
+    assert image.size == (1000, 250)
+    assert image.mode == "L"
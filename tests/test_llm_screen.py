@@ -0,0 +1,183 @@
+"""
+Test incremental LLM screening (early stop, cancellation, deadline, graph anchors)
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+for module in ("torch", "open_clip", "chromadb", "fitz", "pytesseract", "openai"):
+    pytest.importorskip(module)
+
+import visual_search
+from visual_search import VisualSearchEngine
+from similarity_graph import SimilarityGraph
+
+
+class StubScreener:
+    """Stand-in for the LLM: per-candidate delay and verdict (None = request failed), recording every call"""
+    
+    def __init__(self, plan):
+        self.plan = plan  # candidate url -> (delay seconds, verdict)
+        self.calls = []
+        self.completed = []
+        self.cancelled = []
+    
+    async def compare(self, query_url, candidate_url, permissive=True):
+        self.calls.append((candidate_url, permissive))
+        delay, verdict = self.plan[candidate_url]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(candidate_url)
+            raise
+        self.completed.append(candidate_url)
+        if verdict is None and permissive:
+            return True  # Same permissive fallback as the real request failure path
+        return verdict
+    
+    async def compare_batch(self, query_url, candidate_urls, permissive=True):
+        raise AssertionError("batched screening is disabled in these tests")
+
+
+def make_engine(monkeypatch, plan, deadline=5.0, graph=None):
+    """Engine with only the screening state, candidates img0..imgN pre-encoded"""
+    monkeypatch.setattr(visual_search, "LLM_SCREEN_BATCH_SIZE", 1)
+    monkeypatch.setattr(visual_search, "LLM_SCREEN_CONCURRENCY", 8)
+    monkeypatch.setattr(visual_search, "LLM_SCREEN_DEADLINE", deadline)
+    monkeypatch.setattr(visual_search, "encode_image_for_llm", lambda image: "query")
+    monkeypatch.setattr(visual_search, "get_similarity_graph", lambda: graph)
+    
+    engine = VisualSearchEngine.__new__(VisualSearchEngine)
+    engine.candidate_payloads = {f"img{rank}.png": f"img{rank}" for rank in range(len(plan))}
+    
+    async def analyze_inline(func, *args):
+        return func(*args)
+    
+    screener = StubScreener(plan)
+    engine._analyze_in_pool = analyze_inline
+    engine._compare_payloads = screener.compare
+    engine._compare_payloads_batch = screener.compare_batch
+    engine.llm_compare_chromatographs = screener.compare
+    return engine, screener
+
+
+def hybrid_results(count):
+    return [({'image_file': f"img{rank}.png"}, 1.0 - rank * 0.01) for rank in range(count)]
+
+
+def screen(engine, top_k, count):
+    """Collect (rank, verdict) pairs in yield order, then let cancellations land"""
+    async def run():
+        verdicts = []
+        async for rank, verdict in engine._iter_llm_screen(None, hybrid_results(count), top_k):
+            verdicts.append((rank, verdict))
+        await asyncio.sleep(0.01)
+        return verdicts
+    
+    start = time.monotonic()
+    verdicts = asyncio.run(run())
+    return verdicts, time.monotonic() - start
+
+
+def test_stops_once_top_k_confirmed_in_rank_order(monkeypatch):
+    """Test screening waits for higher-ranked verdicts, then stops and cancels the rest"""
+    plan = {
+        "img0": (0.01, True),
+        "img1": (0.2, False),   # Slow rejection ranked above fast approvals
+        "img2": (0.01, True),
+        "img3": (0.01, True),
+        "img4": (0.4, True),
+        "img5": (5.0, True),
+    }
+    engine, screener = make_engine(monkeypatch, plan)
+    
+    verdicts, elapsed = screen(engine, top_k=3, count=6)
+    
+    assert dict(verdicts) == {0: True, 1: False, 2: True, 3: True}
+    assert verdicts[-1] == (1, False)  # The stop waited for rank 1
+    assert elapsed < 0.35
+    assert sorted(screener.cancelled) == ["img4", "img5"]
+
+
+def test_screens_at_most_twice_top_k(monkeypatch):
+    """Test only the top 2x results are sent to the LLM"""
+    plan = {f"img{rank}": (0.01, False) for rank in range(8)}
+    engine, screener = make_engine(monkeypatch, plan)
+    
+    verdicts, _ = screen(engine, top_k=2, count=8)
+    
+    assert sorted(rank for rank, _ in verdicts) == [0, 1, 2, 3]
+    assert sorted(url for url, _ in screener.calls) == ["img0", "img1", "img2", "img3"]
+    assert all(verdict is False for _, verdict in verdicts)
+
+
+def test_deadline_keeps_unscreened_candidates(monkeypatch):
+    """Test candidates without a verdict at the deadline are kept and their requests cancelled"""
+    plan = {
+        "img0": (0.01, True),
+        "img1": (0.01, False),
+        "img2": (5.0, False),
+        "img3": (5.0, False),
+    }
+    engine, screener = make_engine(monkeypatch, plan, deadline=0.1)
+    
+    verdicts, elapsed = screen(engine, top_k=2, count=4)
+    
+    assert dict(verdicts) == {0: True, 1: False, 2: True, 3: True}
+    assert elapsed < 1.0
+    assert sorted(screener.cancelled) == ["img2", "img3"]
+
+
+def test_graph_anchor_propagates_verdicts(monkeypatch):
+    """Test a confirmed anchor's graph verdicts replace LLM calls for its neighbours"""
+    graph = SimilarityGraph()
+    graph.add("img1.png", "img2.png", True)
+    graph.add("img1.png", "img3.png", False)
+    plan = {f"img{rank}": (0.01, True) for rank in range(4)}
+    engine, screener = make_engine(monkeypatch, plan, graph=graph)
+    
+    verdicts, _ = screen(engine, top_k=2, count=4)
+    
+    # img0 is not in the graph, so img1 is the anchor, screened strictly
+    assert screener.calls[0] == ("img1", False)
+    assert dict(verdicts) == {0: True, 1: True, 2: True, 3: False}
+    assert sorted(url for url, _ in screener.calls) == ["img0", "img1"]
+
+
+def test_rejected_anchor_tries_next_anchor(monkeypatch):
+    """Test a NO from the first anchor propagates nothing and the next anchor is tried"""
+    monkeypatch.setattr(visual_search, "SIMILARITY_GRAPH_MAX_ANCHORS", 2)
+    graph = SimilarityGraph()
+    graph.add("img0.png", "img2.png", True)
+    graph.add("img1.png", "img2.png", False)
+    graph.add("img1.png", "img3.png", True)
+    plan = {"img0": (0.01, False), "img1": (0.01, True), "img2": (0.01, True), "img3": (0.01, False)}
+    engine, screener = make_engine(monkeypatch, plan, graph=graph)
+    
+    verdicts, _ = screen(engine, top_k=2, count=4)
+    
+    assert screener.calls[:2] == [("img0", False), ("img1", False)]
+    assert dict(verdicts) == {0: False, 1: True, 2: False, 3: True}
+    assert len(screener.calls) == 2
+
+
+def test_failed_anchor_is_not_trusted(monkeypatch):
+    """Test an anchor failure (None) propagates nothing and falls back to normal screening"""
+    graph = SimilarityGraph()
+    graph.add("img0.png", "img1.png", True)
+    plan = {"img0": (0.01, None), "img1": (0.01, False)}
+    engine, screener = make_engine(monkeypatch, plan, graph=graph)
+    
+    verdicts, _ = screen(engine, top_k=1, count=2)
+    
+    # img1 is screened itself (NO) instead of inheriting YES from the failed anchor,
+    # and img0 is retried in the batched phase where failures are kept
+    assert screener.calls == [("img0", False), ("img1", False), ("img0", True)]
+    assert dict(verdicts) == {0: True, 1: False}
@@ -0,0 +1,73 @@
+"""
+Test near-duplicate collapsing at ingestion
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+chromadb = pytest.importorskip("chromadb")
+
+from perceptual_hash import load_aliases
+
+# Step 5 starts with a digit, so it is loaded from its path
+spec = importlib.util.spec_from_file_location(
+    "build_vectordb_with_images", Path(__file__).parent.parent / "src" / "5_build_vectordb_with_images.py"
+)
+step5 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(step5)
+
+
+def make_library(monkeypatch, image_dir, make_chromatograph):
+    """Two byte-identical reference crops plus one distinct main-database crop"""
+    hbe = make_chromatograph([(120, 180, 25), (300, 150, 20)])
+    hbe.save(image_dir / "hbe_a.png")
+    (image_dir / "hbe_b.png").write_bytes((image_dir / "hbe_a.png").read_bytes())
+    make_chromatograph([(120, 300, 25), (380, 40, 10)]).save(image_dir / "page_3_full.png")
+    monkeypatch.setattr(step5, "image_path", lambda img_id: image_dir / img_id.split("_cropped_")[1])
+    
+    embeddings = {
+        "reference_cropped_hbe_b.png": {"embedding": [1.0, 0.0, 0.0, 0.0]},
+        "reference_cropped_hbe_a.png": {"embedding": [1.0, 0.0, 0.0, 0.0]},
+        "main_cropped_page_3_full.png": {"embedding": [0.0, 1.0, 0.0, 0.0]}
+    }
+    metadata = {
+        "reference_cropped_hbe_a.png": {"source": "reference_pdfs", "category": "hbe", "system_type": "biorad", "page": 1},
+        "reference_cropped_hbe_b.png": {"source": "reference_pdfs", "category": "hbe", "system_type": "biorad", "page": 1},
+        "main_cropped_page_3_full.png": {"source": "main_database", "category": "main_db", "system_type": "biorad", "page": 3}
+    }
+    return embeddings, metadata
+
+
+def test_identical_crops_cluster(monkeypatch, tmp_path, make_chromatograph):
+    """Test identical crops share one canonical image and the distinct crop stays apart"""
+    embeddings, metadata = make_library(monkeypatch, tmp_path, make_chromatograph)
+    
+    clusters = step5.cluster_near_duplicates(embeddings, metadata)
+    
+    assert clusters == {
+        "reference_cropped_hbe_a.png": ["reference_cropped_hbe_b.png"],  # Canonical chosen by id, not input order
+        "main_cropped_page_3_full.png": []
+    }
+
+
+def test_aliases_are_indexed_under_the_canonical(monkeypatch, tmp_path, make_chromatograph):
+    """Test only canonical images are indexed, with alias metadata the search engine resolves"""
+    embeddings, metadata = make_library(monkeypatch, tmp_path, make_chromatograph)
+    clusters = step5.cluster_near_duplicates(embeddings, metadata)
+    
+    collection = step5.build_image_collection(chromadb.EphemeralClient(), "test_dedup_images", embeddings, metadata, clusters)
+    stored = collection.get(include=["metadatas"])
+    stored = dict(zip(stored["ids"], stored["metadatas"]))
+    
+    assert set(stored) == {"reference_cropped_hbe_a.png", "main_cropped_page_3_full.png"}
+    assert stored["reference_cropped_hbe_a.png"]["aliases"] == "reference_cropped_hbe_b.png"
+    assert stored["reference_cropped_hbe_a.png"]["alias_count"] == 1
+    assert stored["main_cropped_page_3_full.png"]["alias_count"] == 0
+    
+    # VisualSearchEngine.canonical_of is load_aliases() of its collection
+    assert load_aliases(collection) == {"reference_cropped_hbe_b.png": "reference_cropped_hbe_a.png"}
@@ -0,0 +1,52 @@
+"""
+Test numeric range query parsing
+"""
+
+import sys
+from pathlib import Path
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from numeric_index import parse_range_query, describe_ranges
+
+
+RANGE_QUERIES = [
+    # Explicit ranges, with and without %
+    ("HbA2 between 4 and 8%", {"hba2": (4.0, 8.0)}),
+    ("HbF from 10 to 20", {"hbf": (10.0, 20.0)}),
+    ("HbA2 4-8%", {"hba2": (4.0, 8.0)}),
+    ("hba2 4-8", {"hba2": (4.0, 8.0)}),
+    ("HbA2 3.5 - 4.5 % please", {"hba2": (3.5, 4.5)}),
+    ("HbE 8 to 3.", {"hbe": (3.0, 8.0)}),
+    # Bounds with the comparator before or after the value
+    ("HbS above 30%", {"hbs": (30.0, None)}),
+    ("fetal hemoglobin < 2", {"hbf": (None, 2.0)}),
+    ("HbA 95 and above", {"hba": (95.0, None)}),
+    ("hbe 20% or more", {"hbe": (20.0, None)}),
+    ("HbF 10+", {"hbf": (10.0, None)}),
+    ("HbF 1 or less?", {"hbf": (None, 1.0)}),
+    # Several analytes in one question
+    ("HbA2 between 4 and 8% and HbF < 2", {"hba2": (4.0, 8.0), "hbf": (None, 2.0)}),
+    ("hba2 4-8 with hbf below 1", {"hba2": (4.0, 8.0), "hbf": (None, 1.0)}),
+    # Single values without a comparator, and values with other units
+    ("Hb F 5 cells", {}),
+    ("HbF 5%", {}),
+    ("HbF 5 to 10 cells", {}),
+    ("HbF is 5-10 g/dL", {}),
+    ("HbF 2-3 years", {}),
+    ("What does an elevated HbA2 mean?", {}),
+]
+
+
+@pytest.mark.parametrize("text, expected", RANGE_QUERIES)
+def test_parse_range_query(text, expected):
+    """Test each question parses to the expected ranges"""
+    assert parse_range_query(text) == expected
+
+
+def test_describe_ranges():
+    """Test parsed ranges read back as text"""
+    ranges = parse_range_query("HbA2 between 4 and 8% and HbF < 2 and HbS 30+")
+    assert describe_ranges(ranges) == "HbA2 4-8%, HbF ≤ 2%, HbS ≥ 30%"
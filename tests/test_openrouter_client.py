@@ -0,0 +1,266 @@
+"""
+Test OpenRouter client retries, circuit breaker, hedging and streaming against the mock server
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import mock_openrouter
+import openrouter_client
+from openrouter_client import OpenRouterClient, OpenRouterError, CircuitOpenError, CircuitBreaker
+
+MESSAGES = [{"role": "user", "content": "What is HbE?"}]
+REAL_ASYNC_CLIENT = httpx.AsyncClient
+
+
+class SlowFirstRequest:
+    """ASGI wrapper that delays the first chat completion (a slow primary)"""
+    
+    def __init__(self, app, delay: float):
+        self.app = app
+        self.delay = delay
+        self.calls = 0
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/chat/completions"):
+            self.calls += 1
+            if self.calls == 1:
+                await asyncio.sleep(self.delay)
+        await self.app(scope, receive, send)
+
+
+def use_app(monkeypatch, app):
+    """Route the client's httpx traffic to an in-process ASGI app"""
+    class ASGIClient(REAL_ASYNC_CLIENT):
+        def __init__(self, **kwargs):
+            super().__init__(transport=httpx.ASGITransport(app=app), **kwargs)
+    
+    monkeypatch.setattr(openrouter_client.httpx, "AsyncClient", ASGIClient)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Client pointed at a fast, error-free mock with short backoffs"""
+    monkeypatch.setenv("OPENROUTER_API_KEY", "mock")
+    monkeypatch.setenv("OPENROUTER_BASE_URL", "http://mock/api/v1")
+    monkeypatch.setattr(openrouter_client, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(openrouter_client, "OPENROUTER_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(openrouter_client, "OPENROUTER_BACKOFF_MAX", 0.05)
+    mock_openrouter.configure(
+        latency_median_ms=1, latency_sigma=0, error_rate=0.0, rate_limit_rate=0.0,
+        rate_limit_rps=0.0, retry_after_s=1.0, stream_chunk_ms=0, stream_keepalives=0,
+        stream_error_after=-1, seed=0
+    )
+    use_app(monkeypatch, mock_openrouter.app)
+    return OpenRouterClient()
+
+
+def test_rate_limited_then_retried(client):
+    """Test a 429 is retried after Retry-After and the next attempt succeeds"""
+    # Empty token bucket: the first request is rejected, the retry finds a refilled token
+    mock_openrouter.configure(rate_limit_rps=40, retry_after_s=0.05)
+    mock_openrouter._bucket["tokens"] = 0.0
+    
+    reply = asyncio.run(client.chat_completion(MESSAGES, model="test/rate-limited", timeout=5))
+    
+    assert reply.startswith("Mock answer to:")
+    assert mock_openrouter.stats["rate_limited"] == 1
+    assert mock_openrouter.stats["ok"] == 1
+    assert client.metrics["rate_limited"] == 1
+    assert client.metrics["retries"] == 1
+    assert client.metrics["successes"] == 1
+
+
+def test_breaker_opens_on_repeated_5xx(client, monkeypatch):
+    """Test repeated 500s open the breaker and the next call fails fast"""
+    model = "test/failing"
+    monkeypatch.setattr(openrouter_client, "OPENROUTER_MAX_RETRIES", 2)
+    client.breakers[model] = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    mock_openrouter.configure(error_rate=1.0)
+    
+    with pytest.raises(OpenRouterError) as error:
+        asyncio.run(client.chat_completion(MESSAGES, model=model, timeout=5))
+    assert error.value.status_code == 500
+    assert not isinstance(error.value, CircuitOpenError)
+    assert mock_openrouter.stats["requests"] == 3
+    assert client.breakers[model].state == "open"
+    
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.chat_completion(MESSAGES, model=model, timeout=5))
+    assert mock_openrouter.stats["requests"] == 3  # Upstream never called
+    assert client.metrics["breaker_rejections"] == 1
+
+
+def test_slow_primary_is_hedged(client, monkeypatch):
+    """Test a duplicate request is sent, and wins, when the primary is slower than usual"""
+    model = "test/hedged"
+    slow_app = SlowFirstRequest(mock_openrouter.app, delay=2.0)
+    use_app(monkeypatch, slow_app)
+    client.latencies[model] = openrouter_client.deque([0.01] * 20, maxlen=200)
+    
+    start = time.monotonic()
+    reply = asyncio.run(client.chat_completion(MESSAGES, model=model, timeout=5))
+    
+    assert reply.startswith("Mock answer to:")
+    assert time.monotonic() - start < 1.5
+    assert slow_app.calls == 2
+    assert client.metrics["hedges_sent"] == 1
+    assert client.metrics["hedges_won"] == 1
+
+
+def test_no_hedge_without_latency_history(client):
+    """Test hedging stays off until enough latency samples exist"""
+    model = "test/cold"
+    assert client._hedge_delay(model) is None
+    asyncio.run(client.chat_completion(MESSAGES, model=model, timeout=5))
+    assert client.metrics["hedges_sent"] == 0
+    assert mock_openrouter.stats["requests"] == 1
+
+
+def test_deadline_exceeded(client):
+    """Test the overall deadline turns a slow reply into an OpenRouterError"""
+    model = "test/slow"
+    mock_openrouter.configure(latency_median_ms=1000)
+    
+    start = time.monotonic()
+    with pytest.raises(OpenRouterError, match="Deadline"):
+        asyncio.run(client.chat_completion(MESSAGES, model=model, timeout=0.2))
+    
+    assert time.monotonic() - start < 0.9
+    assert client.metrics["deadline_exceeded"] == 1
+    assert client.breakers[model].consecutive_failures == 1
+
+
+async def collect_stream(client, model, timeout=5.0):
+    """Stream a completion, returning the fragments received (and the error, if any)"""
+    fragments = []
+    try:
+        async for fragment in client.chat_completion_stream(MESSAGES, model=model, timeout=timeout):
+            fragments.append(fragment)
+    except OpenRouterError as e:
+        return fragments, e
+    return fragments, None
+
+
+def test_stream_skips_keepalives_and_stops_at_done(client):
+    """Test keep-alive comments are ignored and the stream ends at [DONE]"""
+    mock_openrouter.configure(stream_keepalives=3)
+    
+    fragments, error = asyncio.run(collect_stream(client, "test/stream"))
+    
+    assert error is None
+    assert "".join(fragments) == "Mock answer to: What is HbE?"
+    assert len(fragments) > 1
+    assert client.metrics["streams"] == 1
+    assert client.metrics["successes"] == 1
+    assert len(client.first_token_latencies["test/stream"]) == 1
+
+
+def test_stream_error_chunk_after_tokens(client):
+    """Test an in-stream error after the first token ends the stream without a retry"""
+    model = "test/stream-error"
+    mock_openrouter.configure(stream_error_after=2)
+    
+    fragments, error = asyncio.run(collect_stream(client, model))
+    
+    assert fragments == ["Mock ", "answer "]
+    assert "Stream error" in str(error)
+    assert mock_openrouter.stats["requests"] == 1
+    assert client.metrics["retries"] == 0
+    assert client.metrics["failures"] == 1
+    assert client.breakers[model].consecutive_failures == 1
+
+
+def test_stream_first_token_deadline(client):
+    """Test no token within the timeout raises and counts against the breaker"""
+    model = "test/stream-slow"
+    mock_openrouter.configure(latency_median_ms=2000)
+    
+    start = time.monotonic()
+    fragments, error = asyncio.run(collect_stream(client, model, timeout=0.2))
+    
+    assert fragments == []
+    assert "no tokens within" in str(error)
+    assert time.monotonic() - start < 1.0
+    assert client.metrics["deadline_exceeded"] == 1
+    assert client.breakers[model].consecutive_failures == 1
+
+
+def test_stream_malformed_chunk_is_an_openrouter_error(client, monkeypatch):
+    """Test an unparseable data line is retried, counted as a failure and trips the breaker"""
+    model = "test/stream-malformed"
+    monkeypatch.setattr(openrouter_client, "OPENROUTER_MAX_RETRIES", 1)
+    
+    async def malformed(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        await send({"type": "http.response.body", "body": b'data: {"choices": [\n\n'})
+    
+    use_app(monkeypatch, malformed)
+    
+    fragments, error = asyncio.run(collect_stream(client, model))
+    
+    assert fragments == []
+    assert "Malformed stream chunk" in str(error)
+    assert client.metrics["retries"] == 1
+    assert client.metrics["failures"] == 1
+    assert client.breakers[model].consecutive_failures == 2
+
+
+def test_backoff_bounds(client):
+    """Test full-jitter backoff stays within the capped window and honours Retry-After"""
+    for attempt in range(6):
+        cap = min(openrouter_client.OPENROUTER_BACKOFF_MAX, openrouter_client.OPENROUTER_BACKOFF_BASE * 2 ** attempt)
+        delays = [client._backoff(attempt, None) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+    
+    assert all(client._backoff(0, 3.0) == 3.0 for _ in range(50))
+
+
+def test_circuit_breaker_states():
+    """Test closed -> open -> half_open (single probe) -> closed"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.state == "closed" and breaker.allow()
+    
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.trips == 1
+    
+    # After the reset timeout one probe is let through, others wait for it
+    breaker.opened_at -= 31
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    
+    # A failed probe re-opens immediately
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.trips == 2
+    
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.consecutive_failures == 0
+
+
+def test_abandoned_probe_is_replaced():
+    """Test a half-open probe that never reports back stops blocking after reset_timeout"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    assert not breaker.allow()
+    
+    breaker.probe_started_at -= 31
+    assert breaker.allow()
@@ -0,0 +1,132 @@
+"""
+Test local pattern classifier
+"""
+
+import sys
+from pathlib import Path
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from pattern_classifier import PatternClassifier, peak_vector, TEMPERATURE_GRID
+
+CLASSES = ["beta_thal", "hb_e", "normal"]
+
+
+def make_classifier(per_class=6, noise=0.15, seed=0):
+    """Synthetic references: noisy embeddings around one direction per class"""
+    rng = np.random.default_rng(seed)
+    centers = np.eye(len(CLASSES), 16)
+    ids, categories, embeddings, peaks = [], [], [], []
+    for c, category in enumerate(CLASSES):
+        for i in range(per_class):
+            ids.append(f"reference_cropped_{category}_{i // 2}_page{i % 2 + 1}.png")  # Two pages per report
+            categories.append(category)
+            embeddings.append(centers[c] + noise * rng.normal(size=16))
+            peaks.append(peak_vector({"a2_concentration": 2.5 + 10 * (c == 1), "f_concentration": 1.0 + 20 * (c == 0)}))
+    return PatternClassifier(ids, categories, np.array(embeddings), np.stack(peaks)), centers
+
+
+def test_peak_vector_marks_missing_features():
+    """Test unreported features are NaN"""
+    vector = peak_vector({"a2_concentration": 3.1, "num_peaks": 4})
+    assert vector[0] == np.float32(3.1) and np.isnan(vector[1]) and vector[2] == 4
+
+
+def test_raw_distribution_favors_nearest_class():
+    """Test the kNN + prototype distribution peaks on the query's class"""
+    classifier, centers = make_classifier()
+    
+    distribution, scores = classifier._raw_distribution(centers[1], peak_vector({"a2_concentration": 12.5}))
+    
+    assert np.isclose(distribution.sum(), 1.0)
+    assert classifier.classes[np.argmax(distribution)] == "hb_e"
+    assert scores.shape == (len(classifier),)
+
+
+def test_raw_distribution_exclude():
+    """Test excluded references get no score and no prototype mass"""
+    classifier, centers = make_classifier()
+    exclude = classifier.categories == "hb_e"
+    
+    distribution, scores = classifier._raw_distribution(centers[1], peak_vector(None), exclude=exclude)
+    
+    assert np.all(np.isneginf(scores[exclude]))
+    assert distribution[list(classifier.classes).index("hb_e")] < 1e-6
+
+
+def test_leave_one_out_drops_whole_report():
+    """Test leave-one-out excludes every page of the held-out report"""
+    classifier, _ = make_classifier()
+    assert len(set(classifier.groups)) == len(classifier) // 2
+    
+    # With a single report per class, leaving it out removes the class entirely
+    single, _ = make_classifier(per_class=2)
+    distributions = single.leave_one_out()
+    
+    assert distributions.shape == (len(single), len(CLASSES))
+    assert np.all(distributions[np.arange(len(single)), single.labels] < 1e-6)
+
+
+def test_calibrate_reports_temperature_and_ece():
+    """Test calibration picks a grid temperature and reports sane metrics"""
+    classifier, _ = make_classifier()
+    
+    report = classifier.calibrate()
+    
+    assert report["temperature"] in TEMPERATURE_GRID
+    assert classifier.temperature == report["temperature"]
+    assert report["accuracy"] == 1.0  # Well-separated classes
+    assert 0.0 <= report["ece"] <= 1.0
+    assert report["confidence"].shape == (len(classifier),)
+
+
+def test_calibrate_softens_overconfident_mistakes():
+    """Test label noise pushes the temperature above 1 (less confident)"""
+    classifier, _ = make_classifier(per_class=8, noise=0.6, seed=3)
+    
+    report = classifier.calibrate()
+    
+    assert report["accuracy"] < 1.0
+    assert report["temperature"] > 1.0
+
+
+def test_predict():
+    """Test predictions name the class, its confidence and nearest references"""
+    classifier, centers = make_classifier()
+    classifier.calibrate()
+    
+    prediction = classifier.predict(centers[0], {"f_concentration": 21.0}, top_n=2)
+    
+    assert prediction["category"] == "beta_thal"
+    assert prediction["pattern_type"] == "Beta Thal"
+    assert prediction["confidence"] > 0.5
+    assert len(prediction["alternatives"]) == 2
+    assert all(category == "beta_thal" for _, category, _ in prediction["neighbors"])
+
+
+def test_save_load_round_trip(tmp_path):
+    """Test save/load preserves references, temperature and predictions"""
+    classifier, centers = make_classifier()
+    classifier.calibrate()
+    path = tmp_path / "pattern_classifier.npz"
+    
+    classifier.save(path)
+    loaded = PatternClassifier.load(path)
+    
+    assert loaded.ids.tolist() == classifier.ids.tolist()
+    assert np.isclose(loaded.temperature, classifier.temperature)
+    expected, actual = classifier.predict(centers[2]), loaded.predict(centers[2])
+    assert actual["category"] == expected["category"] == "normal"
+    assert np.isclose(actual["confidence"], expected["confidence"], atol=1e-5)
+    assert [n[0] for n in actual["neighbors"]] == [n[0] for n in expected["neighbors"]]
+    assert PatternClassifier.load(tmp_path / "missing.npz") is None
+
+
+def test_label_of():
+    """Test collection images resolve to classifier labels"""
+    classifier, _ = make_classifier()
+    assert classifier.label_of(classifier.ids[0]) == "beta_thal"
+    assert classifier.label_of("main_cropped_page_3_full.png", "main_db") is None
+    assert classifier.label_of("reference_cropped_other.png", "normal") == "normal"
@@ -0,0 +1,84 @@
+"""
+Test perceptual hash index
+"""
+
+import io
+import sys
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from perceptual_hash import PerceptualHashIndex, image_hashes, hamming_distances, HASH_BYTES
+
+
+def make_index(make_chromatograph):
+    """Index of three distinct patterns"""
+    images = {
+        "normal": make_chromatograph([(120, 300, 25), (380, 40, 10)]),
+        "hbe": make_chromatograph([(120, 180, 25), (300, 150, 20)]),
+        "high_f": make_chromatograph([(80, 200, 15), (120, 220, 25), (380, 30, 10)])
+    }
+    hashes = {name: image_hashes(image) for name, image in images.items()}
+    neighbours = {"normal": [("hbe", 0.7), ("high_f", 0.6)]}
+    return PerceptualHashIndex(hashes, neighbours), images
+
+
+def test_hash_size(make_chromatograph):
+    """Test both hashes are 256 bits"""
+    p, d = image_hashes(make_chromatograph([(120, 300, 25)]))
+    assert len(p) == HASH_BYTES and len(d) == HASH_BYTES
+
+
+def test_exact_copy_matches(make_chromatograph):
+    """Test an identical image matches with distance 0"""
+    index, images = make_index(make_chromatograph)
+    assert index.match(images["hbe"]) == ("hbe", 0)
+
+
+def test_reencoded_copy_matches(make_chromatograph):
+    """Test a JPEG re-encoded copy still matches the original"""
+    index, images = make_index(make_chromatograph)
+    buffer = io.BytesIO()
+    images["normal"].save(buffer, format="JPEG", quality=85)
+    
+    match = index.match(Image.open(buffer))
+    
+    assert match is not None and match[0] == "normal"
+
+
+def test_different_pattern_does_not_match(make_chromatograph):
+    """Test an unseen pattern is not reported as a known image"""
+    index, _ = make_index(make_chromatograph)
+    query = make_chromatograph([(200, 250, 30), (450, 120, 15)])
+    assert index.match(query) is None
+
+
+def test_hamming_distances():
+    """Test bit distances against packed hashes"""
+    hashes = np.zeros((2, 2), dtype=np.uint8)
+    hashes[1] = [0b00000111, 0b10000000]
+    
+    assert hamming_distances(hashes, bytes([0, 0])).tolist() == [0, 4]
+
+
+def test_save_load_round_trip(make_chromatograph, tmp_path):
+    """Test save/load preserves hashes, matches and neighbours"""
+    index, images = make_index(make_chromatograph)
+    path = tmp_path / "phash_index.json"
+    
+    index.save(path)
+    loaded = PerceptualHashIndex.load(path)
+    
+    assert loaded.ids == index.ids
+    assert np.array_equal(loaded.phashes, index.phashes)
+    assert loaded.match(images["high_f"]) == ("high_f", 0)
+    assert loaded.neighbours["normal"] == [("hbe", 0.7), ("high_f", 0.6)]
+
+
+def test_empty_index(make_chromatograph):
+    """Test an empty index never matches"""
+    index = PerceptualHashIndex({})
+    assert index.match(make_chromatograph([(120, 300, 25)])) is None
@@ -0,0 +1,113 @@
+"""
+Test OpenRouter rate governor
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from rate_limiter import RateGovernor, INTERACTIVE, SCREENING, BACKGROUND
+
+
+async def try_acquire(governor, priority, timeout=0.05):
+    """Acquire a permit, or None if none is granted within the timeout"""
+    try:
+        await asyncio.wait_for(governor.acquire(priority), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def test_interactive_reserve():
+    """Test screening cannot take the slots reserved for interactive requests"""
+    async def run():
+        governor = RateGovernor(rps=1000, burst=100, concurrency=4, interactive_reserve=2)
+        assert await try_acquire(governor, SCREENING)
+        assert await try_acquire(governor, SCREENING)
+        assert not await try_acquire(governor, SCREENING)
+        assert not await try_acquire(governor, BACKGROUND)
+        
+        # The reserve is still free for interactive requests
+        assert await try_acquire(governor, INTERACTIVE)
+        assert await try_acquire(governor, INTERACTIVE)
+        assert governor.in_flight == 4
+    
+    asyncio.run(run())
+
+
+def test_reserve_leaves_one_shared_slot():
+    """Test the reserve never takes every slot"""
+    governor = RateGovernor(rps=1, burst=1, concurrency=2, interactive_reserve=5)
+    assert governor.interactive_reserve == 1
+
+
+def test_priority_order():
+    """Test a released slot goes to the interactive lane ahead of earlier screening waiters"""
+    async def run():
+        governor = RateGovernor(rps=1000, burst=100, concurrency=1, interactive_reserve=0)
+        await governor.acquire(SCREENING)
+        
+        order = []
+        
+        async def request(priority, name):
+            async with governor.slot(priority):
+                order.append(name)
+        
+        tasks = [asyncio.create_task(request(SCREENING, "screening"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request(INTERACTIVE, "interactive")))
+        await asyncio.sleep(0)
+        
+        governor.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "screening"]
+    
+    asyncio.run(run())
+
+
+def test_penalize_drains_tokens_and_pauses():
+    """Test a 429 pauses the model for Retry-After before the next permit"""
+    async def run():
+        governor = RateGovernor(rps=1000, burst=100, concurrency=8, interactive_reserve=0)
+        governor.penalize(0.2)
+        assert governor.tokens == 0.0
+        
+        start = time.monotonic()
+        assert not await try_acquire(governor, INTERACTIVE, timeout=0.1)
+        assert await try_acquire(governor, INTERACTIVE, timeout=1.0)
+        assert time.monotonic() - start >= 0.2
+    
+    asyncio.run(run())
+
+
+def test_penalize_without_retry_after_waits_for_refill():
+    """Test a 429 without Retry-After only drains the bucket"""
+    async def run():
+        governor = RateGovernor(rps=10, burst=5, concurrency=8, interactive_reserve=0)
+        governor.penalize(None)
+        assert governor.paused_until == 0.0
+        
+        start = time.monotonic()
+        await governor.acquire(INTERACTIVE)
+        assert time.monotonic() - start >= 0.08  # One token at 10 rps
+    
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    """Test a waiter that gives up does not hold a slot"""
+    async def run():
+        governor = RateGovernor(rps=1000, burst=100, concurrency=1, interactive_reserve=0)
+        await governor.acquire(INTERACTIVE)
+        assert not await try_acquire(governor, INTERACTIVE)
+        
+        governor.release()
+        assert await try_acquire(governor, INTERACTIVE)
+        assert governor.in_flight == 1
+        assert governor.stats()["queued"]["interactive"] == 0
+    
+    asyncio.run(run())
@@ -0,0 +1,95 @@
+"""
+Test semantic answer cache
+"""
+
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from semantic_cache import SemanticAnswerCache
+
+
+def rotated(vector, cosine):
+    """Unit vector at the given cosine similarity to a unit vector"""
+    other = np.zeros_like(vector)
+    other[1] = 1.0
+    return cosine * vector + np.sqrt(1.0 - cosine ** 2) * other
+
+
+BASE = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+BUCKET = ("model", 0.7, ("page_1", "page_2"))
+
+
+def test_paraphrase_above_threshold_hits():
+    """Test a close question gets the cached answer"""
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.put(BUCKET, BASE * 3.0, "answer", "v1")  # Norm does not matter
+    
+    assert cache.get(BUCKET, rotated(BASE, 0.95), "v1") == "answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_question_below_threshold_misses():
+    """Test a different question is not served the cached answer"""
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.put(BUCKET, BASE, "answer", "v1")
+    
+    assert cache.get(BUCKET, rotated(BASE, 0.85), "v1") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_closest_question_wins():
+    """Test the most similar cached question is used"""
+    cache = SemanticAnswerCache(threshold=0.5)
+    cache.put(BUCKET, rotated(BASE, 0.6), "far", "v1")
+    cache.put(BUCKET, rotated(BASE, 0.99), "near", "v1")
+    
+    assert cache.get(BUCKET, BASE, "v1") == "near"
+
+
+def test_other_bucket_misses():
+    """Test answers are not shared across models or source sets"""
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.put(BUCKET, BASE, "answer", "v1")
+    
+    assert cache.get(("model", 0.7, ("page_3",)), BASE, "v1") is None
+
+
+def test_index_version_change_invalidates():
+    """Test a new text index version drops every cached answer"""
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.put(BUCKET, BASE, "answer", "v1")
+    
+    assert cache.get(BUCKET, BASE, "v2") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+    assert cache.get(BUCKET, BASE, "v1") is None  # Not restored by the old version
+
+
+def test_ttl_expiry():
+    """Test expired answers are not served"""
+    cache = SemanticAnswerCache(threshold=0.9, ttl=0.05)
+    cache.put(BUCKET, BASE, "answer", "v1")
+    time.sleep(0.1)
+    
+    assert cache.get(BUCKET, BASE, "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction():
+    """Test the least recently used answer is evicted over max_entries"""
+    cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+    first, second = BASE, np.array([0.0, 0.0, 1.0, 0.0], dtype=np.float32)
+    cache.put(BUCKET, first, "first", "v1")
+    cache.put(BUCKET, second, "second", "v1")
+    cache.get(BUCKET, first, "v1")  # "second" is now least recently used
+    
+    cache.put(("other",), BASE, "third", "v1")
+    
+    assert cache.get(BUCKET, first, "v1") == "first"
+    assert cache.get(BUCKET, second, "v1") is None
+    assert cache.stats()["entries"] == 2